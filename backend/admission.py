@@ -0,0 +1,131 @@
+"""
+Controllo di ammissione della pipeline di trascrizione
+
+Al massimo PIPELINE_CONCURRENCY trascrizioni vengono elaborate insieme
+(decodifica, Whisper, Claude, archiviazione); le altre aspettano in una coda
+a priorità lunga al massimo PIPELINE_QUEUE_SIZE. Con la coda piena la
+richiesta viene rifiutata subito con QueueFull (429 con Retry-After)
+invece di restare appesa fino al timeout.
+
+Un memo breve passa davanti agli audio lunghi già in attesa. Per non far
+aspettare per sempre un audio lungo la chiave della coda è una scadenza
+virtuale, arrivo + PIPELINE_AGING secondi per minuto di audio: un file di
+10 minuti cede il posto solo ai memo arrivati meno di 10 * PIPELINE_AGING
+secondi dopo di lui.
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+
+# Trascrizioni elaborate insieme e trascrizioni in attesa
+PIPELINE_CONCURRENCY = int(os.getenv('PIPELINE_CONCURRENCY', 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 16))
+# Secondi di precedenza ceduti per ogni minuto di audio
+PIPELINE_AGING = float(os.getenv('PIPELINE_AGING', 30))
+
+class QueueFull(Exception):
+    """Troppe trascrizioni in corso o in attesa"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Troppe trascrizioni in corso, riprova tra {math.ceil(retry_after)} secondi")
+        self.retry_after = retry_after
+
+class AdmissionQueue:
+    """Slot di elaborazione con coda a priorità limitata"""
+
+    def __init__(self, slots: int = PIPELINE_CONCURRENCY, max_waiting: int = PIPELINE_QUEUE_SIZE, aging: float = PIPELINE_AGING):
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.aging = aging
+        self.running = 0
+        self._waiting: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Durata media di uno slot (media mobile), per stimare Retry-After
+        self.average_seconds = 15.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def retry_after(self, count: int = 1) -> float:
+        """Secondi stimati prima che si liberi posto per count trascrizioni"""
+        return max(1.0, self.average_seconds * (len(self._waiting) + count) / self.slots)
+
+    def check(self, count: int = 1):
+        """
+        Rifiuta subito se non c'è posto per count trascrizioni
+
+        Usato prima di ricevere il file, per non leggere upload che verrebbero scartati.
+        """
+        if self.running + len(self._waiting) + count > self.slots + self.max_waiting:
+            self.rejected += 1
+            raise QueueFull(self.retry_after(count))
+
+    async def acquire(self, audio_minutes: float = 0, bounded: bool = True):
+        """
+        Attende uno slot libero
+
+        Args:
+            audio_minutes: Durata dell'audio, usata come priorità
+            bounded: False per i job in background, che aspettano senza limite di coda
+
+        Raises:
+            QueueFull: se la coda è piena
+        """
+        if self.running < self.slots and not self._waiting:
+            self.running += 1
+            self.admitted += 1
+            return
+        if bounded and len(self._waiting) >= self.max_waiting:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic() + audio_minutes * self.aging, next(self._sequence), future)
+        heapq.heappush(self._waiting, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            else:
+                # Lo slot era già stato ceduto a questa richiesta: passa al prossimo
+                self.release()
+            raise
+        self.admitted += 1
+
+    def release(self):
+        """Libera uno slot, cedendolo direttamente al primo in coda"""
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self, audio_minutes: float = 0, bounded: bool = True):
+        """Esegue il blocco dentro uno slot (vedi acquire)"""
+        await self.acquire(audio_minutes, bounded)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.monotonic() - started)
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiting),
+            "slots": self.slots,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_seconds": round(self.average_seconds, 1)
+        }
@@ -1,47 +1,84 @@
 import os
 import json
-import tempfile
-import firebase_admin
+import base64
+import math
+import shutil
+import hashlib
+import secrets
+import functools
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, Callable, List, Tuple
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from openai import OpenAI
-import anthropic
-from firebase_admin import credentials, firestore
-import cloudinary
-import cloudinary.uploader
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from prompts import WHISPER_PROMPT, get_prompt
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from prompts import WHISPER_PROMPT, PROMPT_PARTS, get_prompt_parts
 from urllib.parse import urlparse
 import re
 from pydantic import BaseModel
 
 # Import auth module
 from auth import get_current_user, verify_password, create_access_token
+from concurrency import PROVIDER_LIMITS
+from providers import openai_client, claude_client, cloudinary_sdk, prewarm, PREWARM_CONNECTIONS
+from provider_calls import call_provider, providers_stats, ProviderUnavailable
+from rate_limits import RateLimited
+from admission import AdmissionQueue, QueueFull
+from uploads import spool_upload, UploadSizeLimitMiddleware, BATCH_MAX_FILES, MAX_BATCH_UPLOAD_BYTES
+from audio_chunking import (
+    needs_chunking, pcm_needs_chunking, exceeds_whisper_limit, load_pcm, transcribe_in_chunks, write_wav
+)
+from silence_trim import trim_silence, VAD_TRIM
+from metrics import MetricsMiddleware, Counter, Gauge, span, collect_timings, render as render_metrics
+from metrics import METRICS_TOKEN, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from profiling import ProfilerMiddleware
+from jobs import JobQueue
+from resumable_uploads import UploadSessions, parse_content_range, MAX_CHUNK_BYTES
+from audio_cache import AudioCache, cache_key
+from audio_normalize import AudioNormalizer
+from note_store import create_note_store
+from search_index import SearchIndex, INDEX_FIELDS
+from note_cache import NoteCache, CachedBody, encoded_body, etag_matches
+from serialization import serialize_note, negotiate_encoding, COMPRESSION_MIN_BYTES, COMPRESSION_THREAD_BYTES
+from cost_calculator import get_audio_duration_minutes, calculate_cost_from_usage, recompute_costs, count_tokens
 
 # Carica variabili d'ambiente
 load_dotenv()
 
-# Inizializza Firebase Admin (solo per Firestore)
-cred = credentials.Certificate(json.loads(os.getenv('FIREBASE_SERVICE_ACCOUNT')))
-firebase_admin.initialize_app(cred)
+# Archivio delle note (Firestore o SQLite locale, scelto con NOTE_STORE);
+# la connessione a Firestore viene aperta al primo utilizzo
+note_store = create_note_store()
 
-# Inizializza Firestore
-db = firestore.client()
-
-# Configura Cloudinary
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Avvia i worker della coda (riprendendo i job interrotti da un riavvio)
+    await job_queue.start()
+    await upload_sessions.start()
+    if PREWARM_CONNECTIONS:
+        # In background: l'avvio non aspetta SDK e connessioni
+        task = asyncio.create_task(prewarm(note_store))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    yield
+    await job_queue.stop()
+    await upload_sessions.stop()
+    await note_search.flush()
 
 # Inizializza FastAPI
-app = FastAPI(title="Whisper Claude Notes API")
+app = FastAPI(title="Whisper Claude Notes API", lifespan=lifespan)
+
+# Rifiuta gli upload troppo grandi prima di riceverli per intero
+# (registrato prima di CORS così anche il 413 riceve gli header CORS)
+app.add_middleware(UploadSizeLimitMiddleware, exclude_prefixes=("/api/transcribe/batch",))
+app.add_middleware(
+    UploadSizeLimitMiddleware, max_bytes=MAX_BATCH_UPLOAD_BYTES, path_prefixes=("/api/transcribe/batch",)
+)
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=MAX_CHUNK_BYTES, path_prefixes=("/api/uploads",))
 
 # Configura CORS
 app.add_middleware(
@@ -50,16 +87,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # Letto dal frontend per le richieste con If-None-Match
 )
+# Profilazione opzionale di un campione delle richieste (PROFILE_SAMPLE_RATE)
+app.add_middleware(ProfilerMiddleware)
+# Durata e richieste in corso per route, esposte su /metrics (middleware più esterno)
+app.add_middleware(MetricsMiddleware)
+# Modelli usati per trascrizione ed elaborazione
+WHISPER_MODEL = "whisper-1"
+WHISPER_LANGUAGE = "it"
+CLAUDE_MODEL = "claude-opus-4-1-20250805"
+# Prefisso minimo che Anthropic mette in cache (1024 token per Opus e Sonnet, 2048 per Haiku):
+# sotto questa soglia cache_control viene ignorato
+CLAUDE_CACHE_MIN_TOKENS = int(os.getenv('CLAUDE_CACHE_MIN_TOKENS', 1024))
+
+# Attese (secondi) tra i tentativi di archiviazione su Cloudinary falliti
+ARCHIVE_RETRY_DELAYS = [30, 120, 600]
 
-# Inizializza client OpenAI per Whisper API
-openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Paginazione della lista note
+NOTES_PAGE_DEFAULT = 20
+NOTES_PAGE_MAX = 100
+NOTE_PREVIEW_CHARS = 200
 
-# Inizializza client Anthropic
-claude_client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+# Campi letti da Firestore per la lista (il testo completo resta in /api/note/{id})
+NOTE_LIST_FIELDS = [
+    'title',
+    'original_filename',
+    'preview',
+    'prompt_type',
+    'audio_duration_minutes',
+    'cost_data.total_cost_usd',
+    'cost_data.total_cost_eur',
+    'created_at'
+]
 
-# Thread pool per operazioni CPU intensive
-executor = ThreadPoolExecutor(max_workers=2)
+# Note massime per richiesta di eliminazione o modifica multipla
+BULK_MAX_NOTES = 500
+
+# public_id massimi per chiamata delete_resources di Cloudinary
+CLOUDINARY_DELETE_BATCH = 100
+
+# Task in background (riferimenti forti per evitare la garbage collection)
+background_tasks = set()
 
 # Pydantic models
 class LoginRequest(BaseModel):
@@ -69,22 +138,19 @@ class UpdateNoteRequest(BaseModel):
     processed_text: Optional[str] = None
     title: Optional[str] = None
 
-def serialize_firestore_data(data: dict) -> dict:
-    """Converte i tipi Firestore in tipi JSON serializzabili"""
-    serialized = {}
-    for key, value in data.items():
-        # Gestisce DatetimeWithNanoseconds
-        if hasattr(value, 'isoformat'):
-            serialized[key] = value.isoformat()
-        # Gestisce altri tipi datetime
-        elif isinstance(value, datetime):
-            serialized[key] = value.isoformat()
-        # Salta i campi timestamp server-side che potrebbero essere None
-        elif key == 'timestamp' and value is None:
-            continue
-        else:
-            serialized[key] = value
-    return serialized
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # SHA-256 dell'intero file, verificato alla finalizzazione
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[str]
+
+class BulkUpdateItem(UpdateNoteRequest):
+    id: str
+
+class BulkUpdateRequest(BaseModel):
+    items: List[BulkUpdateItem]
 
 def extract_cloudinary_public_id(cloudinary_url: str) -> Optional[str]:
     """
@@ -125,6 +191,621 @@ def extract_cloudinary_public_id(cloudinary_url: str) -> Optional[str]:
         print(f"Errore nell'estrazione del public_id: {str(e)}")
         return None
 
+async def archive_audio(tmp_path: str, audio_filename: str) -> str:
+    """Archivia l'audio su Cloudinary e ritorna l'URL pubblico"""
+    # Upload su Cloudinary con resource_type="video" per file audio
+    with span("cloudinary"):
+        upload_result = await call_provider(
+            "cloudinary",
+            lambda: cloudinary_sdk().uploader.upload(
+                tmp_path,
+                resource_type="video",  # Cloudinary usa "video" per audio
+                folder="voice_notes",
+                public_id=audio_filename,
+                overwrite=True
+            )
+        )
+    return upload_result['secure_url']
+
+async def whisper_transcribe(audio_path: str, prompt: str = WHISPER_PROMPT) -> str:
+    """Invia un singolo file audio a OpenAI Whisper API"""
+    def request():
+        # Il file viene riaperto a ogni tentativo (retry e hedging)
+        with open(audio_path, "rb") as audio_file:
+            return openai_client().audio.transcriptions.create(
+                model=WHISPER_MODEL,
+                file=audio_file,
+                prompt=prompt,
+                language=WHISPER_LANGUAGE,  # Specifica italiano per migliori risultati
+                response_format="text"
+            )
+    
+    return await call_provider("whisper", request, units=get_audio_duration_minutes(audio_path))
+
+async def whisper_transcribe_wav(wav_path: str, prompt: str = WHISPER_PROMPT) -> str:
+    """Invia a Whisper un WAV PCM della pipeline, compresso in Opus quando c'è ffmpeg"""
+    try:
+        with span("encode"):
+            encoded_path = await asyncio.to_thread(audio_normalizer.encode, wav_path)
+    except Exception as e:
+        print(f"Errore nella compressione del WAV, invio non compresso: {str(e)}")
+        encoded_path = None
+    if encoded_path is None:
+        return await whisper_transcribe(wav_path, prompt)
+    try:
+        return await whisper_transcribe(encoded_path, prompt)
+    finally:
+        os.unlink(encoded_path)
+
+async def transcribe_pcm(samples, sample_rate: int) -> str:
+    """Trascrive campioni già decodificati, in un solo file o a segmenti paralleli"""
+    if pcm_needs_chunking(len(samples), sample_rate):
+        return await transcribe_in_chunks(
+            samples,
+            sample_rate,
+            whisper_transcribe_wav,
+            base_prompt=WHISPER_PROMPT,
+            max_concurrency=PROVIDER_LIMITS["whisper"]
+        )
+    
+    fd, wav_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(write_wav, wav_path, samples, sample_rate)
+        return await whisper_transcribe_wav(wav_path)
+    finally:
+        os.unlink(wav_path)
+
+async def transcribe_file(tmp_path: str, audio: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Trascrive il file audio, a segmenti paralleli se supera il limite di Whisper o è molto lungo
+    
+    Con VAD_TRIM i silenzi lunghi vengono rimossi prima dell'invio; se
+    passato, il dizionario audio riceve i minuti effettivamente inviati a
+    Whisper (whisper_minutes) e i secondi tagliati (trimmed_seconds).
+    """
+    print("Invio audio a Whisper API...")
+    with span("whisper"):
+        transcription = await _transcribe_file(tmp_path, audio)
+    print(f"Trascrizione completata: {len(transcription)} caratteri")
+    return transcription
+
+async def _transcribe_file(tmp_path: str, audio: Optional[Dict[str, Any]]) -> str:
+    decode = VAD_TRIM or needs_chunking(tmp_path)
+    pcm = await asyncio.to_thread(load_pcm, tmp_path) if decode else None
+    
+    trimmed = None
+    if pcm is not None and VAD_TRIM:
+        with span("vad"):
+            trimmed = await asyncio.to_thread(trim_silence, pcm[0], pcm[1])
+        if trimmed is None and not needs_chunking(tmp_path):
+            # Niente da tagliare: il file originale è più compatto del WAV decodificato
+            if pcm[2]:
+                os.unlink(pcm[2])
+            pcm = None
+    
+    if pcm is None:
+        if exceeds_whisper_limit(tmp_path):
+            raise HTTPException(
+                status_code=413,
+                detail="File oltre il limite di 25MB di Whisper: serve ffmpeg per dividerlo in segmenti"
+            )
+        return await whisper_transcribe(tmp_path)
+    else:
+        samples, sample_rate, decoded_path = pcm
+        try:
+            if trimmed is not None:
+                print(f"Silenzi rimossi: {trimmed.original_seconds:.1f} s → {trimmed.speech_seconds:.1f} s")
+                if audio is not None:
+                    audio["whisper_minutes"] = round(trimmed.speech_seconds / 60, 4)
+                    audio["trimmed_seconds"] = round(trimmed.removed_seconds, 1)
+                samples = trimmed.samples
+            return await transcribe_pcm(samples, sample_rate)
+        finally:
+            del samples, trimmed
+            if decoded_path:
+                os.unlink(decoded_path)
+
+@functools.lru_cache(maxsize=None)
+def system_prompt_cacheable(prompt_type: str) -> bool:
+    """Indica se il system prompt raggiunge la lunghezza minima per la prompt cache"""
+    return count_tokens(get_prompt_parts(prompt_type)[0]) >= CLAUDE_CACHE_MIN_TOKENS
+
+def claude_request(transcription: str, prompt_type: str) -> dict:
+    """
+    Parametri della chiamata a Claude per il prompt selezionato
+    
+    Le istruzioni fisse vanno nel system prompt, marcato come cacheable
+    quando è abbastanza lungo da essere messo in cache da Anthropic: le
+    chiamate successive leggono allora il prefisso dalla cache e solo la
+    trascrizione viene elaborata ogni volta. I prompt attuali sono sotto la
+    soglia; cache_read_input_tokens in /api/cache/stats mostra l'effetto
+    quando la superano.
+    """
+    system_prompt, user_template = get_prompt_parts(prompt_type)
+    system_block = {"type": "text", "text": system_prompt}
+    if system_prompt_cacheable(prompt_type):
+        system_block["cache_control"] = {"type": "ephemeral"}
+    
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": 2000,
+        "system": [system_block],
+        "messages": [
+            {
+                "role": "user",
+                "content": user_template.format(transcription=transcription)
+            }
+        ]
+    }
+
+def estimate_input_tokens(transcription: str, prompt_type: str) -> int:
+    """Token di input stimati per il limite al minuto (il system prompt conta solo se non è in cache)"""
+    system_chars = 0 if system_prompt_cacheable(prompt_type) else len(get_prompt_parts(prompt_type)[0])
+    return (len(transcription) + system_chars) // 4 + 1
+
+# Token di Claude letti e scritti nella prompt cache dall'avvio
+prompt_cache_usage = {"calls": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+def claude_usage(usage, started: float, first_token_at: Optional[float] = None) -> Dict[str, Any]:
+    """Token (compresi quelli letti/scritti in cache) e tempi di una chiamata a Claude"""
+    data = {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+        "latency_ms": round((time.perf_counter() - started) * 1000)
+    }
+    if first_token_at is not None:
+        data["first_token_ms"] = round((first_token_at - started) * 1000)
+    prompt_cache_usage["calls"] += 1
+    prompt_cache_usage["cache_read_input_tokens"] += data["cache_read_input_tokens"]
+    prompt_cache_usage["cache_creation_input_tokens"] += data["cache_creation_input_tokens"]
+    return data
+
+async def process_with_claude(transcription: str, prompt_type: str) -> Tuple[str, Dict[str, Any]]:
+    """Processa la trascrizione con Claude e ritorna (testo, utilizzo token)"""
+    started = time.perf_counter()
+    with span("claude"):
+        claude_response = await call_provider(
+            "claude",
+            lambda: claude_client().messages.create(**claude_request(transcription, prompt_type)),
+            units=estimate_input_tokens(transcription, prompt_type)
+        )
+    
+    return claude_response.content[0].text, claude_usage(claude_response.usage, started)
+
+async def stream_claude(
+    transcription: str,
+    prompt_type: str,
+    usage: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Processa la trascrizione con Claude ritornando il testo man mano che arriva
+    
+    Lo stream sincrono dell'SDK gira nel thread pool e passa i frammenti
+    all'event loop attraverso una coda. Al termine, se passato, il dizionario
+    usage viene riempito con token e tempi della chiamata. Un errore prima
+    del primo frammento viene ripetuto come le altre chiamate a Claude;
+    dopo, il testo è già stato inviato al client e lo stream fallisce.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    streamed = threading.Event()
+    
+    def produce():
+        started = time.perf_counter()
+        first_token_at = None
+        with claude_client().messages.stream(**claude_request(transcription, prompt_type)) as stream:
+            for text in stream.text_stream:
+                if stop.is_set():
+                    break
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    streamed.set()
+                loop.call_soon_threadsafe(queue.put_nowait, ("delta", text))
+            if usage is not None and not stop.is_set():
+                usage.update(claude_usage(stream.get_final_message().usage, started, first_token_at))
+    
+    def request():
+        try:
+            produce()
+        except Exception as e:
+            if streamed.is_set():
+                # Non ripetibile: il tentativo successivo duplicherebbe il testo
+                raise RuntimeError(f"Stream di Claude interrotto: {str(e)}") from e
+            raise
+    
+    async def run_producer():
+        try:
+            # Senza hedging: due stream in parallelo scriverebbero entrambi nella coda
+            await call_provider("claude", request, units=estimate_input_tokens(transcription, prompt_type), hedge=False)
+            queue.put_nowait(("done", None))
+        except Exception as e:
+            queue.put_nowait(("error", e))
+    
+    producer = asyncio.ensure_future(run_producer())
+    try:
+        # Lo stage comprende anche l'invio dei frammenti al client
+        with span("claude"):
+            while True:
+                kind, value = await queue.get()
+                if kind == "delta":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    break
+            await producer
+    finally:
+        # Se il client si disconnette interrompe lo stream nel thread
+        stop.set()
+
+async def collect_archive(archive_task: asyncio.Task) -> Tuple[Optional[str], str]:
+    """Attende l'archiviazione su Cloudinary e ritorna (audio_url, archive_status)"""
+    try:
+        return await archive_task, "archived"
+    except Exception as archive_error:
+        # La trascrizione è valida anche senza archivio: si riprova più tardi
+        print(f"Errore nell'archiviazione su Cloudinary, nuovo tentativo in background: {str(archive_error)}")
+        return None, "pending"
+
+def build_note(
+    filename: str,
+    prompt_type: str,
+    transcription: str,
+    processed_text: str,
+    audio_url: Optional[str],
+    archive_status: str,
+    usage: Optional[Dict[str, Any]] = None,
+    audio_minutes: Optional[float] = None,
+    whisper_minutes: Optional[float] = None,
+    stage_timings: Optional[Dict[str, float]] = None
+) -> Dict[str, Any]:
+    """
+    Documento della nota da salvare nell'archivio
+    
+    whisper_minutes, se diverso dalla durata (silenzi rimossi), è la durata
+    fatturata da Whisper. stage_timings sono i millisecondi per stage della
+    richiesta (collect_timings), salvati per analizzare le note lente.
+    """
+    # Genera un titolo iniziale basato sul nome del file
+    # Rimuovi estensione e timestamp per un titolo più leggibile
+    initial_title = filename.rsplit('.', 1)[0]  # Rimuovi estensione
+    
+    # Costi calcolati dai token reali riportati da Anthropic
+    cost_data = calculate_cost_from_usage(audio_minutes or 0.0, usage or {}, CLAUDE_MODEL, whisper_minutes)
+    
+    doc_data = {
+        "title": initial_title,  # Nuovo campo titolo
+        "original_filename": filename,
+        "audio_url": audio_url,
+        "archive_status": archive_status,
+        "transcription": transcription,
+        "processed_text": processed_text,
+        "preview": note_preview(transcription),  # Anteprima per la lista delle note
+        "prompt_type": prompt_type,  # Salva il tipo di prompt usato
+        "claude_usage": usage,  # Token e tempi di Claude, compresi quelli della prompt cache
+        "audio_duration_minutes": audio_minutes,
+        "whisper_minutes": whisper_minutes,
+        "cost_data": cost_data,
+        "created_at": datetime.now().isoformat()
+    }
+    if stage_timings is not None:
+        doc_data["stage_timings"] = dict(stage_timings)
+    return doc_data
+
+async def save_note(
+    filename: str,
+    prompt_type: str,
+    transcription: str,
+    processed_text: str,
+    audio_url: Optional[str],
+    archive_status: str,
+    usage: Optional[Dict[str, Any]] = None,
+    audio_minutes: Optional[float] = None,
+    whisper_minutes: Optional[float] = None,
+    stage_timings: Optional[Dict[str, float]] = None
+) -> Tuple[str, str, Dict[str, Any]]:
+    """Salva la nota nell'archivio e ritorna (id, titolo, costi)"""
+    doc_data = build_note(
+        filename, prompt_type, transcription, processed_text, audio_url, archive_status, usage, audio_minutes,
+        whisper_minutes, stage_timings
+    )
+    doc_id = await note_store.add(doc_data)
+    note_cache.invalidate_first_pages()
+    note_search.add([{**doc_data, "id": doc_id}])
+    return doc_id, doc_data["title"], doc_data["cost_data"]
+
+def note_preview(text: Optional[str], max_chars: int = NOTE_PREVIEW_CHARS) -> str:
+    """Anteprima in testo semplice mostrata nella lista delle note"""
+    plain = " ".join(re.sub(r"<[^>]+>", " ", text or "").split())
+    if len(plain) <= max_chars:
+        return plain
+    return plain[:max_chars].rsplit(" ", 1)[0] + "…"
+
+def encode_notes_cursor(created_at: Any, doc_id: str) -> str:
+    """Cursore opaco (created_at, id) dell'ultima nota di una pagina"""
+    payload = json.dumps([created_at, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_notes_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+    if not isinstance(doc_id, str) or not doc_id:
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+    return created_at, doc_id
+
+async def backfill_previews(notes: list):
+    """Calcola e salva l'anteprima delle note create prima del campo preview"""
+    if not notes:
+        return
+    stored = await note_store.get_many([note['id'] for note in notes], fields=['transcription'])
+    
+    updates = {}
+    for note in notes:
+        if note['id'] in stored:
+            note['preview'] = note_preview(stored[note['id']].get('transcription'))
+            updates[note['id']] = {'preview': note['preview']}
+    await note_store.update_many(updates)
+
+def audio_public_filename(filename: str) -> str:
+    """Nome con cui l'audio viene archiviato su Cloudinary"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"audio_{timestamp}_{filename}"
+
+def validate_audio_filename(filename: str):
+    if not filename.endswith(('.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac')):
+        raise HTTPException(status_code=400, detail="Formato file non supportato")
+
+def result_cache_key(content_hash: str, prompt_type: str) -> str:
+    """Chiave della cache risultati per l'audio e la configurazione attuale"""
+    return cache_key(content_hash, WHISPER_MODEL, WHISPER_LANGUAGE, CLAUDE_MODEL, prompt_type)
+
+async def remember_result(content_hash: Optional[str], prompt_type: str, result: Dict[str, Any]):
+    """Salva in cache il risultato di una nota con audio già archiviato"""
+    if content_hash and result.get("archive_status") == "archived":
+        await audio_cache.put(result_cache_key(content_hash, prompt_type), result)
+
+def cached_result_changes(update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Campi del risultato in cache corrispondenti a una modifica della nota"""
+    fields = {'title': 'title', 'processed_text': 'processed'}
+    return {fields[name]: value for name, value in update_data.items() if name in fields}
+
+async def normalize_upload(
+    tmp_path: str,
+    content_hash: str,
+    remove_original: bool = True
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Sostituisce l'audio caricato con la versione normalizzata, se attiva e più piccola
+    
+    Il file originale viene rimosso (se remove_original) e il nuovo percorso
+    ne prende il posto; in caso di errore si prosegue con l'originale.
+    
+    Returns:
+        Tupla (percorso da usare, byte risparmiati e tempo di conversione o None)
+    """
+    if not audio_normalizer.enabled:
+        return tmp_path, None
+    try:
+        with span("normalize"):
+            normalized = await asyncio.to_thread(audio_normalizer.normalize, tmp_path, content_hash)
+    except Exception as e:
+        print(f"Errore nella normalizzazione audio, uso il file originale: {str(e)}")
+        return tmp_path, None
+    if normalized is None:
+        return tmp_path, None
+    
+    if remove_original:
+        os.unlink(tmp_path)
+    report = normalized.report()
+    print(f"Audio normalizzato: {report['original_bytes']} → {report['normalized_bytes']} byte "
+          f"in {report['normalize_ms']} ms{' (cache)' if report['cached'] else ''}")
+    return normalized.path, report
+
+def sse_event(event: str, data: dict) -> str:
+    """Formatta un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Stream di Server-Sent Events che rimuove i propri file temporanei
+    
+    cleanup viene eseguita alla fine della risposta in ogni caso, anche se
+    il client si disconnette prima che il generatore parta (il suo finally
+    non verrebbe mai eseguito) o durante l'invio, quando Starlette salta i
+    BackgroundTask.
+    """
+    
+    def __init__(self, events: AsyncIterator[str], cleanup: Callable[[], None]):
+        super().__init__(
+            events,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        self.cleanup = cleanup
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Prima il finally del generatore (annulla i task in corso), poi i file rimasti
+            await self.body_iterator.aclose()
+            self.cleanup()
+
+def spawn_background(coro) -> asyncio.Task:
+    """Avvia un task in background mantenendone un riferimento fino al termine"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def retry_archive(doc_id: str, tmp_path: str, audio_filename: str):
+    """
+    Riprova l'archiviazione su Cloudinary per una nota già salvata
+    
+    Aggiorna audio_url e archive_status della nota e rimuove il file
+    temporaneo al termine, sia in caso di successo che di fallimento.
+    """
+    try:
+        for delay in ARCHIVE_RETRY_DELAYS:
+            await asyncio.sleep(delay)
+            try:
+                audio_url = await archive_audio(tmp_path, audio_filename)
+            except Exception as e:
+                print(f"Nuovo tentativo di archiviazione fallito per nota {doc_id}: {str(e)}")
+                continue
+            
+            await note_store.update(doc_id, {"audio_url": audio_url, "archive_status": "archived"})
+            note_cache.invalidate_note(doc_id)
+            print(f"Audio della nota {doc_id} archiviato su Cloudinary")
+            return
+        
+        await note_store.update(doc_id, {"archive_status": "failed"})
+        note_cache.invalidate_note(doc_id)
+        print(f"Archiviazione abbandonata per nota {doc_id}")
+    except Exception as e:
+        print(f"Errore nel retry di archiviazione per nota {doc_id}: {str(e)}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def job_audio_path(job: Dict[str, Any]) -> str:
+    """File audio attuale del job: quello normalizzato, se la conversione è già avvenuta"""
+    return job["state"].get("audio_path") or job["audio_path"]
+
+async def run_transcription_job(job: Dict[str, Any], checkpoint) -> Dict[str, Any]:
+    """
+    Esegue la pipeline per un job in coda riprendendo dall'ultimo checkpoint
+    
+    Gli stage già completati (trascrizione, testo di Claude, archivio,
+    salvataggio) sono nello stato del job e non vengono ripetuti.
+    """
+    state = job["state"]
+    filename = job["filename"]
+    content_hash = state.get("content_hash")
+    # Tempi degli stage eseguiti in questo tentativo (quelli ripresi dai checkpoint non ci sono)
+    timings = collect_timings()
+    
+    if content_hash and "note_id" not in state:
+        cached = await audio_cache.get(result_cache_key(content_hash, job["prompt_type"]))
+        if cached is not None:
+            os.unlink(job_audio_path(job))
+            return {**cached, "cached": True}
+    
+    if "audio_filename" not in state:
+        original_path = job["audio_path"]
+        audio_path, normalization = (
+            await normalize_upload(original_path, content_hash, remove_original=False) if content_hash
+            else (original_path, None)
+        )
+        # Il percorso del file convertito è nello stato: l'originale si rimuove solo dopo il checkpoint
+        await checkpoint("started", {
+            "audio_filename": audio_public_filename(filename),
+            "audio_minutes": get_audio_duration_minutes(audio_path),
+            "audio_path": audio_path,
+            "normalization": normalization
+        })
+        if audio_path != original_path:
+            os.unlink(original_path)
+    audio_filename = state["audio_filename"]
+    audio_path = job_audio_path(job)
+    
+    # I job aspettano il proprio turno senza limite: la coda persistente li contiene già
+    async with pipeline_admission.slot(state.get("audio_minutes") or 0, bounded=False):
+        archive_task = None
+        if "audio_url" not in state and "note_id" not in state:
+            archive_task = asyncio.create_task(archive_audio(audio_path, audio_filename))
+        
+        try:
+            if "transcription" not in state:
+                audio: Dict[str, Any] = {}
+                transcription = await transcribe_file(audio_path, audio)
+                await checkpoint("transcribed", {"transcription": transcription, **audio})
+            if "processed_text" not in state:
+                processed_text, usage = await process_with_claude(state["transcription"], job["prompt_type"])
+                await checkpoint("processed", {"processed_text": processed_text, "claude_usage": usage})
+        except Exception:
+            if archive_task is not None:
+                archive_task.cancel()
+            raise
+        
+        if archive_task is not None:
+            audio_url, archive_status = await collect_archive(archive_task)
+            await checkpoint("archived", {"audio_url": audio_url, "archive_status": archive_status})
+    
+    if "note_id" not in state:
+        doc_id, initial_title, cost_data = await save_note(
+            filename,
+            job["prompt_type"],
+            state["transcription"],
+            state["processed_text"],
+            state.get("audio_url"),
+            state.get("archive_status", "archived"),
+            state.get("claude_usage"),
+            state.get("audio_minutes"),
+            state.get("whisper_minutes"),
+            timings
+        )
+        await checkpoint("saved", {"note_id": doc_id, "title": initial_title, "cost": cost_data})
+    
+    if state.get("archive_status") == "pending":
+        # Il task di retry diventa proprietario del file audio
+        spawn_background(retry_archive(state["note_id"], audio_path, audio_filename))
+    elif os.path.exists(audio_path):
+        os.unlink(audio_path)
+    
+    result = {
+        "id": state["note_id"],
+        "title": state["title"],
+        "transcription": state["transcription"],
+        "processed": state["processed_text"],
+        "audio_url": state.get("audio_url"),
+        "archive_status": state.get("archive_status"),
+        "cost": state.get("cost")
+    }
+    await remember_result(content_hash, job["prompt_type"], result)
+    if state.get("normalization") is not None:
+        return {**result, "normalization": state["normalization"]}
+    return result
+
+# Coda persistente per le trascrizioni in background
+job_queue = JobQueue(runner=run_transcription_job)
+
+# Sessioni degli upload a blocchi riprendibili
+upload_sessions = UploadSessions()
+
+# Cache dei risultati per audio già elaborati
+audio_cache = AudioCache()
+
+# Cache in memoria delle risposte di lista e dettaglio note
+note_cache = NoteCache()
+
+# Indice di ricerca full-text (costruito alla prima ricerca)
+note_search = SearchIndex()
+
+# Conversione opzionale dell'audio in Opus 16 kHz mono prima degli upload
+audio_normalizer = AudioNormalizer()
+
+# Trascrizioni elaborate insieme e coda a priorità di quelle in attesa
+pipeline_admission = AdmissionQueue()
+
+def too_busy(e) -> HTTPException:
+    """429 con Retry-After per coda della pipeline piena o limiti dei provider"""
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+def check_admission(count: int = 1):
+    """Rifiuta la richiesta prima dell'upload se la pipeline non ha posto"""
+    try:
+        pipeline_admission.check(count)
+    except QueueFull as e:
+        raise too_busy(e)
+
 @app.get("/")
 async def root():
     """Endpoint pubblico per verificare che l'API sia online"""
@@ -164,183 +845,748 @@ async def verify_auth(current_user: dict = Depends(get_current_user)):
 async def transcribe_audio(
     file: UploadFile = File(...), 
     prompt_type: str = "linkedin",
+    async_job: bool = False,
     current_user: dict = Depends(get_current_user)  # Richiede autenticazione
 ):
-    """Endpoint per trascrivere audio con Whisper e processare con Claude"""
+    """
+    Endpoint per trascrivere audio con Whisper e processare con Claude
     
-    if not file.filename.endswith(('.mp3', '.wav', '.m4a', '.flac', '.ogg', '.aac')):
-        raise HTTPException(status_code=400, detail="Formato file non supportato")
+    Con async_job=true il file viene messo in coda e la risposta contiene
+    subito l'id del job, da seguire con GET /api/jobs/{job_id}.
+    """
     
-    try:
-        # Salva il file temporaneamente
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        # Salva l'audio su Cloudinary
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_filename = f"audio_{timestamp}_{file.filename}"
-        
-        # Upload su Cloudinary con resource_type="video" per file audio
-        upload_result = cloudinary.uploader.upload(
-            tmp_path,
-            resource_type="video",  # Cloudinary usa "video" per audio
-            folder="voice_notes",
-            public_id=audio_filename,
-            overwrite=True
+    validate_audio_filename(file.filename)
+    
+    # L'hash dei byte viene calcolato mentre il file arriva
+    hasher = hashlib.sha256()
+    
+    if async_job:
+        audio_path = await spool_upload(
+            file, suffix=os.path.splitext(file.filename)[1], dir=job_queue.audio_dir, hasher=hasher
         )
-        
-        audio_url = upload_result['secure_url']
-        
-        # Trascrivi con OpenAI Whisper API
-        print("Invio audio a Whisper API...")
-        
-        # Apri il file audio per l'API
-        with open(tmp_path, "rb") as audio_file:
-            transcription_response = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                prompt=WHISPER_PROMPT,
-                language="it",  # Specifica italiano per migliori risultati
-                response_format="text"
-            )
-        
-        transcription = transcription_response
-        print(f"Trascrizione completata: {len(transcription)} caratteri")
-        
-        # Processa con Claude usando il prompt selezionato
-        claude_prompt = get_prompt(prompt_type)
-        
-        claude_response = claude_client.messages.create(
-            model="claude-opus-4-1-20250805",
-            max_tokens=2000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": claude_prompt.format(transcription=transcription)
-                }
-            ]
+        job_id = await job_queue.enqueue(
+            audio_path, file.filename, prompt_type, state={"content_hash": hasher.hexdigest()}
         )
+        return JSONResponse({"success": True, "job_id": job_id, "status": "queued"}, status_code=202)
+    
+    tmp_path = None
+    timings = collect_timings()
+    try:
+        check_admission()
+        # Salva il file temporaneamente, a blocchi e con limite di dimensione
+        with span("upload"):
+            tmp_path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1], hasher=hasher)
+        content_hash = hasher.hexdigest()
         
-        processed_text = claude_response.content[0].text
-        
-        # Genera un titolo iniziale basato sul nome del file
-        # Rimuovi estensione e timestamp per un titolo più leggibile
-        initial_title = file.filename.rsplit('.', 1)[0]  # Rimuovi estensione
-        
-        # Salva nel database Firestore
-        doc_data = {
-            "title": initial_title,  # Nuovo campo titolo
-            "original_filename": file.filename,
-            "audio_url": audio_url,
-            "transcription": transcription,
-            "processed_text": processed_text,
-            "prompt_type": prompt_type,  # Salva il tipo di prompt usato
-            "created_at": datetime.now().isoformat(),
-            "timestamp": firestore.SERVER_TIMESTAMP
-        }
-        
-        doc_ref = db.collection('notes').add(doc_data)
-        doc_id = doc_ref[1].id
-        
-        # Pulisci file temporaneo
-        os.unlink(tmp_path)
+        # Audio già elaborato: ritorna la nota esistente senza chiamare i provider
+        cached = await audio_cache.get(result_cache_key(content_hash, prompt_type))
+        if cached is not None:
+            return JSONResponse({"success": True, **cached, "cached": True})
         
-        return JSONResponse({
-            "success": True,
-            "id": doc_id,
-            "title": initial_title,
-            "transcription": transcription,
-            "processed": processed_text,
-            "audio_url": audio_url
-        })
+        # Un posto nella pipeline per richiesta, in coda secondo la durata dell'audio
+        async with pipeline_admission.slot(get_audio_duration_minutes(tmp_path)):
+            audio_filename = audio_public_filename(file.filename)
+            tmp_path, normalization = await normalize_upload(tmp_path, content_hash)
+            
+            # L'archiviazione su Cloudinary è indipendente dalla trascrizione:
+            # parte subito e corre in parallelo a Whisper → Claude
+            archive_task = asyncio.create_task(archive_audio(tmp_path, audio_filename))
+            
+            try:
+                audio: Dict[str, Any] = {}
+                transcription = await transcribe_file(tmp_path, audio)
+                processed_text, usage = await process_with_claude(transcription, prompt_type)
+            except Exception:
+                archive_task.cancel()
+                raise
+            
+            # Il salvataggio su Firestore attende entrambi i rami
+            audio_url, archive_status = await collect_archive(archive_task)
+            doc_id, initial_title, cost_data = await save_note(
+                file.filename, prompt_type, transcription, processed_text, audio_url, archive_status,
+                usage, get_audio_duration_minutes(tmp_path), audio.get("whisper_minutes"), timings
+            )
+            
+            if archive_status == "pending":
+                # Il task di retry diventa proprietario del file temporaneo
+                spawn_background(retry_archive(doc_id, tmp_path, audio_filename))
+                tmp_path = None
+            
+            result = {
+                "id": doc_id,
+                "title": initial_title,
+                "transcription": transcription,
+                "processed": processed_text,
+                "audio_url": audio_url,
+                "archive_status": archive_status,
+                "cost": cost_data
+            }
+            await remember_result(content_hash, prompt_type, result)
+            
+            response = {"success": True, **result, "stage_timings": timings}
+            if normalization is not None:
+                response["normalization"] = normalization
+            return JSONResponse(response)
         
+    except HTTPException:
+        raise
+    except ProviderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(round(e.retry_after))})
+    except (QueueFull, RateLimited) as e:
+        raise too_busy(e)
     except Exception as e:
         print(f"Errore: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Pulisci file temporaneo su ogni percorso, errori compresi
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
-@app.get("/api/notes")
-async def get_notes(
-    limit: int = 20,
+def transcription_stream(
+    tmp_path: str,
+    filename: str,
+    content_hash: str,
+    prompt_type: str,
+    timings: Dict[str, float]
+) -> StreamingResponse:
+    """
+    Pipeline di un file già ricevuto con l'avanzamento in Server-Sent Events
+    
+    Usata da /api/transcribe/stream e dalla finalizzazione degli upload a
+    blocchi. La risposta diventa proprietaria del file temporaneo.
+    """
+    audio_filename = audio_public_filename(filename)
+    
+    async def events() -> AsyncIterator[str]:
+        nonlocal tmp_path
+        try:
+            cached = await audio_cache.get(result_cache_key(content_hash, prompt_type))
+            if cached is not None:
+                yield sse_event("uploaded", {"filename": filename})
+                yield sse_event("transcription", {"text": cached["transcription"]})
+                yield sse_event("delta", {"text": cached["processed"]})
+                yield sse_event("saved", {
+                    "id": cached["id"],
+                    "title": cached["title"],
+                    "audio_url": cached["audio_url"],
+                    "archive_status": cached["archive_status"],
+                    "cost": cached.get("cost"),
+                    "cached": True
+                })
+                return
+            
+            async with pipeline_admission.slot(get_audio_duration_minutes(tmp_path)):
+                tmp_path, normalization = await normalize_upload(tmp_path, content_hash)
+                archive_task = asyncio.create_task(archive_audio(tmp_path, audio_filename))
+                uploaded = {"filename": filename}
+                if normalization is not None:
+                    uploaded["normalization"] = normalization
+                yield sse_event("uploaded", uploaded)
+                
+                try:
+                    audio: Dict[str, Any] = {}
+                    transcription = await transcribe_file(tmp_path, audio)
+                    yield sse_event("transcription", {"text": transcription, **audio})
+                    
+                    parts = []
+                    usage: Dict[str, Any] = {}
+                    async for delta in stream_claude(transcription, prompt_type, usage):
+                        parts.append(delta)
+                        yield sse_event("delta", {"text": delta})
+                    processed_text = "".join(parts)
+                except BaseException:
+                    archive_task.cancel()
+                    raise
+                
+                audio_url, archive_status = await collect_archive(archive_task)
+                doc_id, initial_title, cost_data = await save_note(
+                    filename, prompt_type, transcription, processed_text, audio_url, archive_status,
+                    usage, get_audio_duration_minutes(tmp_path), audio.get("whisper_minutes"), timings
+                )
+                
+                if archive_status == "pending":
+                    spawn_background(retry_archive(doc_id, tmp_path, audio_filename))
+                    tmp_path = None
+                
+                await remember_result(content_hash, prompt_type, {
+                    "id": doc_id,
+                    "title": initial_title,
+                    "transcription": transcription,
+                    "processed": processed_text,
+                    "audio_url": audio_url,
+                    "archive_status": archive_status,
+                    "cost": cost_data
+                })
+                
+                yield sse_event("saved", {
+                    "id": doc_id,
+                    "title": initial_title,
+                    "audio_url": audio_url,
+                    "archive_status": archive_status,
+                    "cost": cost_data,
+                    "stage_timings": timings
+                })
+        except Exception as e:
+            print(f"Errore nello stream di trascrizione: {str(e)}")
+            yield sse_event("error", {"detail": getattr(e, "detail", str(e))})
+        finally:
+            discard_tmp()
+    
+    def discard_tmp():
+        # tmp_path segue il generatore: None se passato al retry di archiviazione
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    
+    return EventStreamResponse(events(), discard_tmp)
+
+@app.post("/api/transcribe/stream")
+async def transcribe_audio_stream(
+    file: UploadFile = File(...),
+    prompt_type: str = "linkedin",
     current_user: dict = Depends(get_current_user)  # Richiede autenticazione
 ):
-    """Recupera le note salvate"""
-    try:
-        # Ordina per created_at invece di timestamp per evitare problemi
-        notes_ref = db.collection('notes').order_by('created_at', direction=firestore.Query.DESCENDING).limit(limit)
-        docs = notes_ref.stream()
-        
-        notes = []
-        for doc in docs:
-            note_data = doc.to_dict()
-            # Serializza i dati Firestore
-            note_data = serialize_firestore_data(note_data)
-            note_data['id'] = doc.id
-            
-            # Assicurati che il campo title esista (per retrocompatibilità)
-            if 'title' not in note_data:
-                note_data['title'] = note_data.get('original_filename', 'Nota senza titolo')
+    """
+    Come /api/transcribe, ma invia l'avanzamento come Server-Sent Events
+    
+    Eventi: uploaded, transcription (testo trascritto), delta (frammenti del
+    testo di Claude man mano che arrivano), saved (id della nota) ed error.
+    La nota viene salvata una sola volta, a testo completo.
+    """
+    validate_audio_filename(file.filename)
+    
+    # La ricezione del file avviene prima di aprire lo stream,
+    # così gli errori di upload restano normali risposte HTTP
+    check_admission()
+    hasher = hashlib.sha256()
+    # Il generatore gira in un task che eredita il contesto: gli stage finiscono in timings
+    timings = collect_timings()
+    with span("upload"):
+        tmp_path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1], hasher=hasher)
+    content_hash = hasher.hexdigest()
+    return transcription_stream(tmp_path, file.filename, content_hash, prompt_type, timings)
+
+@app.post("/api/uploads")
+async def create_upload(
+    data: UploadSessionRequest,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Crea una sessione di upload riprendibile
+    
+    I byte si inviano con PUT /api/uploads/{upload_id} e Content-Range, a
+    blocchi di al massimo chunk_size byte consigliati; la sessione scade se
+    resta inattiva fino a expires_at.
+    """
+    validate_audio_filename(data.filename)
+    session = await upload_sessions.create(data.filename, data.size, data.sha256)
+    return JSONResponse({"success": True, **upload_sessions.public(session)}, status_code=201)
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """Stato della sessione: offset è il primo byte da inviare per riprendere"""
+    session = await upload_sessions.get(upload_id)
+    return JSONResponse({"success": True, **upload_sessions.public(session)})
+
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Aggiunge un blocco di byte alla sessione
+    
+    Il blocco deve partire dall'offset confermato o prima (i byte già
+    ricevuti vengono ignorati); altrimenti la risposta è 409 e il client
+    riprende dall'offset letto con GET. X-Chunk-Sha256, se presente, viene
+    verificato prima di confermare il blocco.
+    """
+    start, length, total = parse_content_range(request.headers.get("content-range"))
+    with span("upload"):
+        session = await upload_sessions.write(
+            upload_id, start, length, total, request.stream(), request.headers.get("x-chunk-sha256")
+        )
+    return JSONResponse({"success": True, "offset": session["offset"], "size": session["size"]})
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    prompt_type: str = "linkedin",
+    async_job: bool = False,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Chiude l'upload completo e avvia la pipeline
+    
+    Risponde con gli stessi Server-Sent Events di /api/transcribe/stream;
+    con async_job=true mette il file in coda e ritorna l'id del job. Con la
+    pipeline piena la risposta è 429 e la sessione resta finalizzabile.
+    """
+    if not async_job:
+        check_admission()
+    timings = collect_timings()
+    audio_path, filename, content_hash = await upload_sessions.finalize(upload_id)
+    
+    if async_job:
+        job_path = shutil.move(audio_path, os.path.join(job_queue.audio_dir, os.path.basename(audio_path)))
+        job_id = await job_queue.enqueue(job_path, filename, prompt_type, state={"content_hash": content_hash})
+        return JSONResponse({"success": True, "job_id": job_id, "status": "queued"}, status_code=202)
+    
+    return transcription_stream(audio_path, filename, content_hash, prompt_type, timings)
+
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """Annulla la sessione ed elimina i byte ricevuti"""
+    await upload_sessions.delete(upload_id)
+    return JSONResponse({"success": True})
+
+async def transcribe_batch_file(
+    index: int,
+    filename: str,
+    tmp_path: str,
+    content_hash: str,
+    prompt_type: str,
+    progress: asyncio.Queue
+) -> Dict[str, Any]:
+    """
+    Pipeline di un file della trascrizione multipla, senza salvataggio
+    
+    Le chiamate passano da call_provider, quindi Whisper, Claude e Cloudinary
+    restano entro i rispettivi limiti di concorrenza anche con molti file.
+    
+    Returns:
+        Esito del file: "cached" con il risultato già salvato, oppure
+        "processed" con il documento della nota da salvare
+    """
+    cached = await audio_cache.get(result_cache_key(content_hash, prompt_type))
+    if cached is not None:
+        await progress.put(("file", {"index": index, "filename": filename, "stage": "cached"}))
+        return {"status": "cached", "result": cached}
+    
+    # Il batch è già stato ammesso: i suoi file aspettano il turno senza limite di coda
+    async with pipeline_admission.slot(get_audio_duration_minutes(tmp_path), bounded=False):
+        audio_filename = audio_public_filename(filename)
+        # Ogni file gira nel proprio task, quindi ha i propri tempi per stage
+        timings = collect_timings()
+        audio_path, normalization = await normalize_upload(tmp_path, content_hash, remove_original=False)
+        try:
+            archive_task = asyncio.create_task(archive_audio(audio_path, audio_filename))
+            try:
+                audio: Dict[str, Any] = {}
+                transcription = await transcribe_file(audio_path, audio)
+                await progress.put(("file", {"index": index, "filename": filename, "stage": "transcribed"}))
+                processed_text, usage = await process_with_claude(transcription, prompt_type)
+            except BaseException:
+                archive_task.cancel()
+                raise
             
-            notes.append(note_data)
+            audio_url, archive_status = await collect_archive(archive_task)
+        except BaseException:
+            if audio_path != tmp_path:
+                os.unlink(audio_path)
+            raise
+        
+        doc_data = build_note(
+            filename, prompt_type, transcription, processed_text, audio_url, archive_status,
+            usage, get_audio_duration_minutes(audio_path), audio.get("whisper_minutes"), timings
+        )
+        await progress.put(("file", {"index": index, "filename": filename, "stage": "processed"}))
+        return {
+            "status": "processed",
+            "note": doc_data,
+            "audio_filename": audio_filename,
+            "audio_path": audio_path,
+            "normalization": normalization
+        }
+
+@app.post("/api/transcribe/batch")
+async def transcribe_batch(
+    files: List[UploadFile] = File(...),
+    prompt_type: str = "linkedin",
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Trascrive ed elabora più file audio in parallelo, con avanzamento in SSE
+    
+    Eventi: file (stage "transcribed", "processed", "cached" o "failed" di
+    un singolo file), saved (esito per file, con id delle note) ed error.
+    Le note nuove vengono scritte tutte insieme con un unico salvataggio
+    raggruppato al termine dell'elaborazione.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Massimo {BATCH_MAX_FILES} file per richiesta")
+    for file in files:
+        validate_audio_filename(file.filename)
+    # Ammesso come una sola richiesta: con 20-50 file la coda limitata non basterebbe mai
+    check_admission()
+    
+    # La ricezione dei file avviene prima di aprire lo stream,
+    # così gli errori di upload restano normali risposte HTTP
+    uploads: List[Tuple[str, str, str]] = []
+    try:
+        for file in files:
+            hasher = hashlib.sha256()
+            tmp_path = await spool_upload(file, suffix=os.path.splitext(file.filename)[1], hasher=hasher)
+            uploads.append((file.filename, tmp_path, hasher.hexdigest()))
+    except BaseException:
+        for _, tmp_path, _ in uploads:
+            os.unlink(tmp_path)
+        raise
+    
+    # File temporanei ancora da rimuovere (i retry di archiviazione ne prendono possesso)
+    owned = {tmp_path for _, tmp_path, _ in uploads}
+    
+    def discard_owned():
+        for tmp_path in owned:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    async def events() -> AsyncIterator[str]:
+        progress: asyncio.Queue = asyncio.Queue()
         
-        return JSONResponse({"success": True, "notes": notes})
+        async def run(index: int, filename: str, tmp_path: str, content_hash: str) -> Optional[Dict[str, Any]]:
+            try:
+                return await transcribe_batch_file(index, filename, tmp_path, content_hash, prompt_type, progress)
+            except Exception as e:
+                print(f"Errore nella trascrizione di {filename}: {str(e)}")
+                await progress.put(("file", {
+                    "index": index, "filename": filename, "stage": "failed", "detail": getattr(e, "detail", str(e))
+                }))
+                return None
         
-    except Exception as e:
-        print(f"Errore nel recupero note: {str(e)}")
-        # Se il problema è l'ordinamento, prova senza ordinamento
+        tasks = [asyncio.create_task(run(index, *upload)) for index, upload in enumerate(uploads)]
         try:
-            notes_ref = db.collection('notes').limit(limit)
-            docs = notes_ref.stream()
+            # Ogni file chiude con uno stage finale: processed, cached o failed
+            remaining = len(tasks)
+            while remaining:
+                event, data = await progress.get()
+                if data["stage"] in ("processed", "cached", "failed"):
+                    remaining -= 1
+                yield sse_event(event, data)
             
-            notes = []
-            for doc in docs:
-                note_data = doc.to_dict()
-                # Serializza i dati Firestore
-                note_data = serialize_firestore_data(note_data)
-                note_data['id'] = doc.id
-                
-                # Assicurati che il campo title esista (per retrocompatibilità)
-                if 'title' not in note_data:
-                    note_data['title'] = note_data.get('original_filename', 'Nota senza titolo')
-                
-                notes.append(note_data)
+            outcomes = await asyncio.gather(*tasks)
+            processed = [i for i, outcome in enumerate(outcomes) if outcome and outcome["status"] == "processed"]
+            # Gli audio normalizzati sostituiscono gli originali da archiviare o rimuovere
+            owned.update(outcomes[i]["audio_path"] for i in processed)
+            
+            # Un solo salvataggio raggruppato per tutte le note nuove
+            doc_ids = await note_store.add_many([outcomes[i]["note"] for i in processed]) if processed else []
+            if processed:
+                note_cache.invalidate_first_pages()
+                note_search.add([{**outcomes[i]["note"], "id": doc_id} for i, doc_id in zip(processed, doc_ids)])
+            
+            results: List[Dict[str, Any]] = [
+                {"index": i, "filename": filename, "status": "failed"}
+                for i, (filename, _, _) in enumerate(uploads)
+            ]
+            for i, outcome in enumerate(outcomes):
+                if outcome and outcome["status"] == "cached":
+                    results[i] = {"index": i, "filename": uploads[i][0], "status": "cached", **outcome["result"]}
             
-            # Ordina manualmente per created_at se esiste
-            notes.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+            for i, doc_id in zip(processed, doc_ids):
+                filename, _, content_hash = uploads[i]
+                audio_path = outcomes[i]["audio_path"]
+                note = outcomes[i]["note"]
+                result = {
+                    "id": doc_id,
+                    "title": note["title"],
+                    "transcription": note["transcription"],
+                    "processed": note["processed_text"],
+                    "audio_url": note["audio_url"],
+                    "archive_status": note["archive_status"],
+                    "cost": note["cost_data"]
+                }
+                await remember_result(content_hash, prompt_type, result)
+                if note["archive_status"] == "pending":
+                    spawn_background(retry_archive(doc_id, audio_path, outcomes[i]["audio_filename"]))
+                    owned.discard(audio_path)
+                results[i] = {"index": i, "filename": filename, "status": "saved", **result}
+                if outcomes[i]["normalization"] is not None:
+                    results[i]["normalization"] = outcomes[i]["normalization"]
             
-            return JSONResponse({"success": True, "notes": notes})
-        except Exception as fallback_error:
-            print(f"Errore anche nel fallback: {str(fallback_error)}")
-            raise HTTPException(status_code=500, detail=str(fallback_error))
+            yield sse_event("saved", {
+                "results": [
+                    {key: value for key, value in result.items() if key not in ("transcription", "processed")}
+                    for result in results
+                ],
+                "saved": len(doc_ids),
+                "failed": sum(1 for result in results if result["status"] == "failed")
+            })
+        except Exception as e:
+            print(f"Errore nella trascrizione multipla: {str(e)}")
+            yield sse_event("error", {"detail": getattr(e, "detail", str(e))})
+        finally:
+            for task in tasks:
+                task.cancel()
+            discard_owned()
+    
+    return EventStreamResponse(events(), discard_owned)
 
-@app.get("/api/note/{note_id}")
-async def get_note(
-    note_id: str,
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
     current_user: dict = Depends(get_current_user)  # Richiede autenticazione
 ):
-    """Recupera una nota specifica"""
+    """Stato e risultato di una trascrizione in background"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    
+    return JSONResponse({"success": True, "job": job})
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """Contatori delle cache, dell'indice di ricerca e delle chiamate ai provider"""
+    return JSONResponse({
+        "success": True,
+        "cache": audio_cache.stats(),
+        "notes": note_cache.stats(),
+        "search": note_search.stats(),
+        "normalization": audio_normalizer.stats(),
+        "providers": providers_stats(),
+        "admission": pipeline_admission.stats(),
+        "prompt_cache": {
+            **prompt_cache_usage,
+            "cacheable_prompts": [prompt_type for prompt_type in PROMPT_PARTS if system_prompt_cacheable(prompt_type)]
+        }
+    })
+
+def provider_metrics() -> List[Any]:
+    """Contatori di call_provider come metriche, letti al momento dello scrape"""
+    counters = {
+        name: Counter(f"provider_{name}_total", description, ("provider",), register=False)
+        for name, description in (
+            ("calls", "Chiamate ai provider, tentativi compresi"),
+            ("retries", "Tentativi ripetuti dopo un errore transitorio"),
+            ("failures", "Chiamate fallite"),
+            ("rejected", "Chiamate rifiutate a circuito aperto"),
+            ("hedges", "Richieste duplicate (hedging) inviate"),
+            ("throttled", "Chiamate rallentate dai limiti di frequenza")
+        )
+    }
+    circuit_open = Gauge("provider_circuit_open", "1 se il circuito del provider è aperto", ("provider",), register=False)
+    for provider, stats in providers_stats().items():
+        for name, counter in counters.items():
+            counter.inc(provider, amount=stats[name])
+        circuit_open.set(1 if stats["circuit"] == "open" else 0, provider)
+    return [*counters.values(), circuit_open]
+
+def prompt_cache_metrics() -> List[Any]:
+    """Token della prompt cache di Claude al momento dello scrape"""
+    tokens = Counter("claude_prompt_cache_tokens_total", "Token letti (read) e scritti (creation) nella prompt cache",
+                     ("kind",), register=False)
+    tokens.inc("read", amount=prompt_cache_usage["cache_read_input_tokens"])
+    tokens.inc("creation", amount=prompt_cache_usage["cache_creation_input_tokens"])
+    return [tokens]
+
+def admission_metrics() -> List[Any]:
+    """Stato della coda della pipeline al momento dello scrape"""
+    stats = pipeline_admission.stats()
+    running = Gauge("pipeline_running", "Trascrizioni in elaborazione", register=False)
+    waiting = Gauge("pipeline_waiting", "Trascrizioni in coda", register=False)
+    rejected = Counter("pipeline_rejected_total", "Trascrizioni rifiutate con coda piena", register=False)
+    running.set(stats["running"])
+    waiting.set(stats["waiting"])
+    rejected.inc(amount=stats["rejected"])
+    return [running, waiting, rejected]
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """
+    Metriche in formato Prometheus, con Authorization: Bearer <METRICS_TOKEN>
+    
+    Senza METRICS_TOKEN l'endpoint è disattivato: latenze, errori, code e
+    costi non vanno esposti senza autenticazione.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Metriche disattivate: impostare METRICS_TOKEN")
+    if not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Token delle metriche non valido")
+    return Response(render_metrics(provider_metrics() + admission_metrics() + prompt_cache_metrics()), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/api/costs/recompute")
+async def recompute_note_costs(
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """Ricalcola cost_data di tutte le note con i prezzi attuali di PRICING"""
     try:
-        doc_ref = db.collection('notes').document(note_id)
-        doc = doc_ref.get()
+        fields = ['audio_duration_minutes', 'whisper_minutes', 'claude_usage', 'cost_data']
+        stored = await note_store.list_all(fields)
         
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="Nota non trovata")
+        notes = []
+        for data in stored:
+            previous = data.get('cost_data') or {}
+            # Note salvate prima dell'utilizzo reale: usa i token del vecchio cost_data
+            usage = data.get('claude_usage') or {
+                "input_tokens": previous.get('claude', {}).get('input_tokens', 0),
+                "output_tokens": previous.get('claude', {}).get('output_tokens', 0)
+            }
+            notes.append({
+                "id": data['id'],
+                "audio_duration_minutes": data.get('audio_duration_minutes')
+                    or previous.get('whisper', {}).get('duration_minutes', 0.0),
+                "whisper_minutes": data.get('whisper_minutes'),
+                "claude_usage": usage,
+                "model": previous.get('claude', {}).get('model', CLAUDE_MODEL)
+            })
+        
+        costs = recompute_costs(notes)
+        
+        # Scritture raggruppate (batch da 500 su Firestore, una transazione su SQLite)
+        await note_store.update_many({
+            note["id"]: {"cost_data": cost_data} for note, cost_data in zip(notes, costs)
+        })
+        note_cache.clear()
         
-        note_data = doc.to_dict()
-        # Serializza i dati Firestore
-        note_data = serialize_firestore_data(note_data)
-        note_data['id'] = doc.id
+        total = round(sum(c["total_cost_usd"] for c in costs), 4)
+        return JSONResponse({"success": True, "updated": len(notes), "total_cost_usd": total})
+        
+    except Exception as e:
+        print(f"Errore nel ricalcolo dei costi: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def cached_json_response(request: Request, entry: CachedBody) -> Response:
+    """
+    Risposta JSON con ETag e compressione negoziata, oppure 304 se il client ha già questa versione
+    
+    I corpi grandi non ancora compressi vengono compressi in un thread, per
+    non bloccare l'event loop con le liste di note lunghe.
+    """
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        note_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    
+    body = entry.body
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+        if encoding not in entry.encoded and len(body) >= COMPRESSION_THREAD_BYTES:
+            body = await asyncio.to_thread(encoded_body, entry, encoding)
+        else:
+            body = encoded_body(entry, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def fetch_notes_page(limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    """Legge dall'archivio una pagina della lista note"""
+    after = decode_notes_cursor(cursor) if cursor else None
+    
+    # Un documento in più per sapere se esiste una pagina successiva
+    docs = await note_store.list_page(NOTE_LIST_FIELDS, limit + 1, after)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    
+    notes = []
+    for doc in docs:
+        note_data = serialize_note(doc)
         
         # Assicurati che il campo title esista (per retrocompatibilità)
         if 'title' not in note_data:
             note_data['title'] = note_data.get('original_filename', 'Nota senza titolo')
         
-        return JSONResponse({"success": True, "note": note_data})
-        
+        notes.append(note_data)
+    
+    await backfill_previews([n for n in notes if 'preview' not in n])
+    
+    next_cursor = None
+    if has_more and notes:
+        last = docs[-1]
+        next_cursor = encode_notes_cursor(last.get('created_at'), last['id'])
+    
+    return {"success": True, "notes": notes, "next_cursor": next_cursor}
+
+@app.get("/api/notes")
+async def get_notes(
+    request: Request,
+    limit: int = NOTES_PAGE_DEFAULT,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Recupera una pagina di note, dalla più recente
+    
+    Ritorna solo i campi mostrati nella lista (NOTE_LIST_FIELDS); il testo
+    completo si legge con /api/note/{id}. next_cursor va passato come cursor
+    per la pagina successiva ed è null sull'ultima pagina.
+    """
+    limit = max(1, min(limit, NOTES_PAGE_MAX))
+    key = ("notes", limit, cursor)
+    
+    entry = note_cache.get(key)
+    if entry is None:
+        try:
+            generation = note_cache.generation
+            page = await fetch_notes_page(limit, cursor)
+            entry = note_cache.put(key, page, [n['id'] for n in page['notes']], generation)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Errore nel recupero note: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return await cached_json_response(request, entry)
+
+@app.get("/api/search")
+async def search_notes(
+    q: str,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Cerca le note per parole di titolo, trascrizione e testo elaborato
+    
+    Ritorna le note più rilevanti (BM25) con i campi della lista e il punteggio.
+    """
+    try:
+        await note_search.ensure_built(note_store)
     except Exception as e:
-        print(f"Errore nel recupero nota {note_id}: {str(e)}")
+        print(f"Errore nella costruzione dell'indice di ricerca: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    
+    results = note_search.search(q, max(1, min(limit, NOTES_PAGE_MAX)))
+    return JSONResponse({"success": True, "query": q, "results": results})
+
+@app.get("/api/note/{note_id}")
+async def get_note(
+    note_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """Recupera una nota specifica"""
+    key = ("note", note_id)
+    
+    entry = note_cache.get(key)
+    if entry is None:
+        try:
+            generation = note_cache.generation
+            doc = await note_store.get(note_id)
+            
+            if doc is None:
+                raise HTTPException(status_code=404, detail="Nota non trovata")
+            
+            note_data = serialize_note(doc)
+            
+            # Assicurati che il campo title esista (per retrocompatibilità)
+            if 'title' not in note_data:
+                note_data['title'] = note_data.get('original_filename', 'Nota senza titolo')
+            
+            entry = note_cache.put(key, {"success": True, "note": note_data}, [note_id], generation)
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Errore nel recupero nota {note_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return await cached_json_response(request, entry)
 
 @app.put("/api/note/{note_id}")
 async def update_note(
@@ -351,10 +1597,9 @@ async def update_note(
     """Aggiorna il testo processato e/o il titolo di una nota"""
     try:
         # Verifica che il documento esista
-        doc_ref = db.collection('notes').document(note_id)
-        doc = doc_ref.get()
+        doc = await note_store.get(note_id)
         
-        if not doc.exists:
+        if doc is None:
             raise HTTPException(status_code=404, detail="Nota non trovata")
         
         # Prepara i dati da aggiornare
@@ -370,7 +1615,11 @@ async def update_note(
             update_data['title'] = request.title
         
         # Aggiorna il documento
-        doc_ref.update(update_data)
+        await note_store.update(note_id, update_data)
+        note_cache.invalidate_note(note_id)
+        note_search.add([{**doc, **update_data}])
+        # La nota resta il risultato di quell'audio: la cache ne riceve la nuova versione
+        await audio_cache.update_note(note_id, cached_result_changes(update_data))
         
         print(f"Nota {note_id} aggiornata con successo")
         return JSONResponse({"success": True, "message": "Nota aggiornata"})
@@ -388,29 +1637,32 @@ async def delete_note(
 ):
     """Elimina una nota dal database e il file audio da Cloudinary"""
     try:
-        doc_ref = db.collection('notes').document(note_id)
-        doc = doc_ref.get()
+        # Recupera i dati prima di eliminare per ottenere l'URL audio
+        note_data = await note_store.get(note_id)
         
-        if not doc.exists:
+        if note_data is None:
             raise HTTPException(status_code=404, detail="Nota non trovata")
         
-        # Recupera i dati prima di eliminare per ottenere l'URL audio
-        note_data = doc.to_dict()
-        
         # Elimina l'audio da Cloudinary se presente
         if 'audio_url' in note_data and note_data['audio_url']:
             public_id = extract_cloudinary_public_id(note_data['audio_url'])
             if public_id:
                 try:
                     # Elimina da Cloudinary
-                    result = cloudinary.uploader.destroy(public_id, resource_type="video")
+                    result = await call_provider(
+                        "cloudinary",
+                        lambda: cloudinary_sdk().uploader.destroy(public_id, resource_type="video")
+                    )
                     print(f"Eliminazione audio Cloudinary - public_id: {public_id}, risultato: {result}")
                 except Exception as cloud_error:
                     # Log dell'errore ma continua con l'eliminazione della nota
                     print(f"Errore nell'eliminazione audio da Cloudinary: {str(cloud_error)}")
         
-        # Elimina il documento da Firestore
-        doc_ref.delete()
+        # Elimina il documento dall'archivio
+        await note_store.delete(note_id)
+        note_cache.invalidate_note(note_id)
+        note_search.remove([note_id])
+        await audio_cache.invalidate_note(note_id)
         
         print(f"Nota {note_id} eliminata con successo")
         return JSONResponse({"success": True, "message": "Nota e audio eliminati"})
@@ -421,6 +1673,136 @@ async def delete_note(
         print(f"Errore nell'eliminazione nota {note_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def check_bulk_size(count: int):
+    if count == 0:
+        raise HTTPException(status_code=400, detail="Nessuna nota indicata")
+    if count > BULK_MAX_NOTES:
+        raise HTTPException(status_code=400, detail=f"Massimo {BULK_MAX_NOTES} note per richiesta")
+
+async def delete_cloudinary_audio(public_ids: List[str]) -> Dict[str, str]:
+    """
+    Elimina gli audio da Cloudinary con chiamate multi-risorsa in parallelo
+    
+    Returns:
+        Esito per public_id ("deleted", "not_found" o "failed")
+    """
+    async def delete_batch(batch: List[str]) -> Dict[str, str]:
+        try:
+            result = await call_provider(
+                "cloudinary", lambda: cloudinary_sdk().api.delete_resources(batch, resource_type="video")
+            )
+            return {public_id: result.get("deleted", {}).get(public_id, "failed") for public_id in batch}
+        except Exception as e:
+            print(f"Errore nell'eliminazione multipla da Cloudinary: {str(e)}")
+            return {public_id: "failed" for public_id in batch}
+    
+    batches = [
+        public_ids[start:start + CLOUDINARY_DELETE_BATCH]
+        for start in range(0, len(public_ids), CLOUDINARY_DELETE_BATCH)
+    ]
+    outcomes: Dict[str, str] = {}
+    for outcome in await asyncio.gather(*(delete_batch(batch) for batch in batches)):
+        outcomes.update(outcome)
+    return outcomes
+
+@app.post("/api/notes/bulk-delete")
+async def bulk_delete_notes(
+    request: BulkDeleteRequest,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Elimina più note e i relativi audio con scritture e chiamate raggruppate
+    
+    Ritorna l'esito per nota: status è "deleted" o "not_found"; audio è
+    "deleted", "not_found", "failed" oppure null se la nota non aveva audio.
+    Come per la singola eliminazione, un errore di Cloudinary non blocca
+    l'eliminazione della nota.
+    """
+    note_ids = list(dict.fromkeys(request.ids))
+    check_bulk_size(len(note_ids))
+    
+    try:
+        notes = await note_store.get_many(note_ids, fields=['audio_url'])
+        
+        public_ids = {
+            note_id: extract_cloudinary_public_id(note['audio_url'])
+            for note_id, note in notes.items() if note.get('audio_url')
+        }
+        audio_results = await delete_cloudinary_audio([p for p in public_ids.values() if p])
+        
+        await note_store.delete_many(list(notes))
+        note_search.remove(notes)
+        for note_id in notes:
+            note_cache.invalidate_note(note_id)
+            await audio_cache.invalidate_note(note_id)
+        
+        results = []
+        for note_id in note_ids:
+            if note_id not in notes:
+                results.append({"id": note_id, "status": "not_found", "audio": None})
+                continue
+            public_id = public_ids.get(note_id)
+            results.append({
+                "id": note_id,
+                "status": "deleted",
+                "audio": audio_results.get(public_id, "failed") if public_id else None
+            })
+        
+        print(f"Eliminazione multipla: {len(notes)} note su {len(note_ids)}")
+        return JSONResponse({"success": True, "deleted": len(notes), "results": results})
+        
+    except Exception as e:
+        print(f"Errore nell'eliminazione multipla: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/notes/bulk-update")
+async def bulk_update_notes(
+    request: BulkUpdateRequest,
+    current_user: dict = Depends(get_current_user)  # Richiede autenticazione
+):
+    """
+    Aggiorna titolo e/o testo processato di più note con scritture raggruppate
+    
+    Ritorna l'esito per nota: "updated", "not_found" oppure "unchanged"
+    (nessun campo indicato). Se lo stesso id compare più volte vale l'ultima voce.
+    """
+    check_bulk_size(len(request.items))
+    
+    try:
+        now = datetime.now().isoformat()
+        requested: Dict[str, Dict[str, Any]] = {}
+        for item in request.items:
+            update_data = item.model_dump(exclude={'id'}, exclude_none=True)
+            if update_data:
+                requested[item.id] = {**update_data, 'updated_at': now}
+        
+        # Con l'indice di ricerca attivo servono i testi per reindicizzare le note
+        reindex = note_search.built
+        existing = await note_store.get_many(list(requested), fields=INDEX_FIELDS if reindex else ['title'])
+        updates = {note_id: data for note_id, data in requested.items() if note_id in existing}
+        await note_store.update_many(updates)
+        note_search.add([{**existing[note_id], **data} for note_id, data in updates.items()])
+        
+        for note_id, data in updates.items():
+            note_cache.invalidate_note(note_id)
+            await audio_cache.update_note(note_id, cached_result_changes(data))
+        
+        results = []
+        for note_id in dict.fromkeys(item.id for item in request.items):
+            if note_id in updates:
+                status = "updated"
+            elif note_id in requested:
+                status = "not_found"
+            else:
+                status = "unchanged"
+            results.append({"id": note_id, "status": status})
+        
+        return JSONResponse({"success": True, "updated": len(updates), "results": results})
+        
+    except Exception as e:
+        print(f"Errore nell'aggiornamento multiplo: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv('PORT', 8000))
@@ -0,0 +1,132 @@
+"""
+Cache dei risultati indirizzata per contenuto dell'audio
+
+La chiave è l'hash SHA-256 dei byte caricati più modelli, lingua e tipo di
+prompt: ricaricare lo stesso memo restituisce la nota già elaborata senza
+ripagare Cloudinary, Whisper e Claude. Le voci vivono in SQLite, con uno
+strato LRU in memoria davanti.
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from settings import DATA_DIR
+
+AUDIO_CACHE_DB_PATH = os.getenv('AUDIO_CACHE_DB_PATH', os.path.join(DATA_DIR, 'audio_cache.sqlite3'))
+
+# Voci mantenute nello strato in memoria
+AUDIO_CACHE_MEMORY_ENTRIES = int(os.getenv('AUDIO_CACHE_MEMORY_ENTRIES', 256))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_cache (
+    key TEXT PRIMARY KEY,
+    note_id TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_audio_cache_note ON audio_cache (note_id);
+"""
+
+def cache_key(content_hash: str, whisper_model: str, language: str, claude_model: str, prompt_type: str) -> str:
+    """Chiave della cache per un audio elaborato con una data configurazione"""
+    return ":".join([content_hash, whisper_model, language, claude_model, prompt_type])
+
+class AudioCache:
+    """Cache persistente dei risultati con LRU in memoria e contatori hit/miss"""
+
+    def __init__(self, db_path: str = AUDIO_CACHE_DB_PATH, memory_entries: int = AUDIO_CACHE_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Risultato salvato per la chiave, oppure None"""
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        rows = await asyncio.to_thread(self._execute, "SELECT value FROM audio_cache WHERE key = ?", (key,))
+        if not rows:
+            self.misses += 1
+            return None
+
+        value = json.loads(rows[0][0])
+        self._remember(key, value)
+        self.hits += 1
+        return value
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        """Salva il risultato di una nota (value deve contenere 'id')"""
+        self._remember(key, value)
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO audio_cache (key, note_id, value, created_at) VALUES (?, ?, ?, ?)",
+            (key, value["id"], json.dumps(value), datetime.now().isoformat())
+        )
+
+    def _update_rows(self, note_id: str, changes: Dict[str, Any]):
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute("SELECT key, value FROM audio_cache WHERE note_id = ?", (note_id,)).fetchall()
+            conn.executemany(
+                "UPDATE audio_cache SET value = ? WHERE key = ?",
+                [(json.dumps({**json.loads(value), **changes}), key) for key, value in rows]
+            )
+
+    async def update_note(self, note_id: str, changes: Dict[str, Any]):
+        """Aggiorna i campi delle voci che puntano a una nota modificata"""
+        if not changes:
+            return
+        for key, value in self._memory.items():
+            if value.get("id") == note_id:
+                self._memory[key] = {**value, **changes}
+        await asyncio.to_thread(self._update_rows, note_id, changes)
+
+    async def invalidate_note(self, note_id: str):
+        """Rimuove le voci che puntano a una nota eliminata"""
+        for key in [k for k, v in self._memory.items() if v.get("id") == note_id]:
+            del self._memory[key]
+        await asyncio.to_thread(self._execute, "DELETE FROM audio_cache WHERE note_id = ?", (note_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
@@ -0,0 +1,302 @@
+"""
+Trascrizione a segmenti per registrazioni lunghe
+
+Whisper accetta file fino a 25 MB e la sua latenza cresce con la durata.
+Le registrazioni lunghe vengono quindi divise in segmenti sovrapposti,
+tagliati nei punti di minima energia (pause), trascritti in parallelo e
+ricuciti eliminando le parole duplicate nelle sovrapposizioni.
+
+Il modulo non dipende dai client dei provider: la funzione che trascrive un
+segmento viene passata dall'esterno, così lo stage è verificabile offline con
+un trascrittore finto e audio sintetico.
+"""
+
+import os
+import re
+import wave
+import shutil
+import asyncio
+import tempfile
+import subprocess
+import numpy as np
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from audio_probe import probe_duration, read_wav_layout
+
+# Limite di upload di Whisper, con margine per le intestazioni multipart
+WHISPER_MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+# Parametri di segmentazione
+CHUNK_SECONDS = int(os.getenv('WHISPER_CHUNK_SECONDS', 300))
+# Oltre questa durata conviene segmentare anche i file sotto i 25 MB (latenza)
+CHUNK_MIN_SECONDS = int(os.getenv('WHISPER_CHUNK_MIN_SECONDS', 2 * CHUNK_SECONDS))
+CHUNK_OVERLAP_SECONDS = 2.0
+SPLIT_SEARCH_SECONDS = 20.0
+ENERGY_FRAME_MS = 30
+
+# Formato PCM usato per decodificare e per i segmenti inviati a Whisper
+PCM_SAMPLE_RATE = 16000
+
+# Caratteri della trascrizione precedente passati come contesto a Whisper
+PROMPT_TAIL_CHARS = 200
+
+# Parole massime cercate come duplicato nella sovrapposizione
+MAX_OVERLAP_WORDS = 40
+
+# Con 1 ogni segmento aspetta la trascrizione del precedente per usarla come
+# prompt (continuità garantita, trascrizione sequenziale)
+CHUNK_WAIT_FOR_CONTEXT = os.getenv('WHISPER_CHUNK_CONTEXT', '0') == '1'
+
+TranscribeChunk = Callable[[str, str], Awaitable[str]]
+
+def decode_to_wav(path: str) -> Optional[str]:
+    """
+    Converte un file audio in WAV PCM 16 bit mono a 16 kHz con ffmpeg
+
+    Returns:
+        Percorso del WAV temporaneo, oppure None se ffmpeg non è disponibile
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+
+    fd, wav_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    result = subprocess.run(
+        [ffmpeg, "-y", "-v", "error", "-i", path, "-ac", "1", "-ar", str(PCM_SAMPLE_RATE),
+         "-c:a", "pcm_s16le", wav_path],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        os.unlink(wav_path)
+        raise RuntimeError(f"Decodifica ffmpeg fallita: {result.stderr.decode(errors='ignore')[:200]}")
+    return wav_path
+
+def load_pcm(path: str) -> Optional[Tuple[np.ndarray, int, Optional[str]]]:
+    """
+    Carica l'audio come campioni int16 mono senza leggerlo tutto in memoria
+
+    I WAV 16 bit mono a 16 kHz vengono mappati direttamente in memoria; gli
+    altri formati e frequenze passano da ffmpeg. Senza ffmpeg un WAV 16 bit
+    mono a un'altra frequenza viene comunque mappato: plan_chunks limita la
+    durata dei segmenti perché restino sotto il limite di Whisper.
+
+    Returns:
+        Tupla (campioni, sample_rate, wav_temporaneo_da_rimuovere)
+        oppure None se il formato non è decodificabile in questo ambiente
+    """
+    layout = read_wav_layout(path)
+    decoded_path = None
+    mono_16bit = layout is not None and layout[0] == 1 and layout[2] == 16
+    if not mono_16bit or layout[1] != PCM_SAMPLE_RATE:
+        decoded_path = decode_to_wav(path)
+        if decoded_path is not None:
+            layout = read_wav_layout(decoded_path)
+        elif not mono_16bit:
+            return None
+
+    _, sample_rate, _, offset, data_size = layout
+    samples = np.memmap(
+        decoded_path or path, dtype="<i2", mode="r", offset=offset, shape=(data_size // 2,)
+    )
+    return samples, sample_rate, decoded_path
+
+def frame_energy(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """Energia RMS per frame (vettorizzata, ultimo frame parziale escluso)"""
+    n_frames = len(samples) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(samples[:n_frames * frame_length], dtype=np.float32).reshape(n_frames, frame_length)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+def find_split_points(
+    samples: np.ndarray,
+    sample_rate: int,
+    chunk_seconds: float = CHUNK_SECONDS,
+    search_seconds: float = SPLIT_SEARCH_SECONDS,
+    frame_ms: int = ENERGY_FRAME_MS
+) -> List[int]:
+    """
+    Trova i punti di taglio nelle zone a energia minima
+
+    Per ogni confine ideale (ogni chunk_seconds dall'ultimo taglio) cerca il
+    frame più silenzioso negli ultimi search_seconds prima del confine.
+    Calcola l'energia solo nelle finestre di ricerca.
+
+    Returns:
+        Indici dei campioni in cui tagliare (esclusi inizio e fine)
+    """
+    total = len(samples)
+    chunk_length = int(chunk_seconds * sample_rate)
+    search_length = min(int(search_seconds * sample_rate), chunk_length // 2)
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+
+    cuts = []
+    position = 0
+    while total - position > chunk_length:
+        window_end = position + chunk_length
+        window_start = window_end - search_length
+        energy = frame_energy(samples[window_start:window_end], frame_length)
+        if len(energy) == 0:
+            cut = window_end
+        else:
+            quietest = int(np.argmin(energy))
+            cut = window_start + quietest * frame_length + frame_length // 2
+        cuts.append(cut)
+        position = cut
+    return cuts
+
+def max_chunk_seconds(sample_rate: int, overlap_seconds: float = CHUNK_OVERLAP_SECONDS) -> float:
+    """Durata massima di un segmento WAV int16 mono sotto il limite di Whisper, sovrapposizione compresa"""
+    return WHISPER_MAX_UPLOAD_BYTES / (sample_rate * 2) - overlap_seconds - 1
+
+def plan_chunks(
+    samples: np.ndarray,
+    sample_rate: int,
+    chunk_seconds: float = CHUNK_SECONDS,
+    overlap_seconds: float = CHUNK_OVERLAP_SECONDS
+) -> List[Tuple[int, int]]:
+    """
+    Divide l'audio in segmenti che si sovrappongono di overlap_seconds
+
+    Returns:
+        Lista di intervalli (inizio, fine) in campioni
+    """
+    overlap = int(overlap_seconds * sample_rate)
+    chunk_seconds = min(chunk_seconds, max_chunk_seconds(sample_rate, overlap_seconds))
+    boundaries = [0] + find_split_points(samples, sample_rate, chunk_seconds) + [len(samples)]
+    return [
+        (max(0, start - overlap) if i > 0 else start, end)
+        for i, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:]))
+    ]
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    """Scrive campioni int16 mono in un file WAV"""
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+def stitch_transcripts(texts: List[str], max_overlap_words: int = MAX_OVERLAP_WORDS) -> str:
+    """
+    Unisce le trascrizioni dei segmenti rimuovendo le parole duplicate
+
+    Cerca la sequenza più lunga di parole con cui finisce il testo precedente
+    e inizia il successivo (ignorando maiuscole e punteggiatura) e la
+    mantiene una sola volta.
+    """
+    stitched: List[str] = []
+    for text in texts:
+        words = text.split()
+        if not words:
+            continue
+        if stitched:
+            tail = [_normalize_word(w) for w in stitched[-max_overlap_words:]]
+            head = [_normalize_word(w) for w in words[:max_overlap_words]]
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    words = words[size:]
+                    break
+        stitched.extend(words)
+    return " ".join(stitched)
+
+def prompt_tail(text: str, max_chars: int = PROMPT_TAIL_CHARS) -> str:
+    """Ultima parte di una trascrizione, tagliata a inizio parola"""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+def exceeds_whisper_limit(path: str) -> bool:
+    """Indica se il file supera il limite di upload di Whisper"""
+    return os.path.getsize(path) > WHISPER_MAX_UPLOAD_BYTES
+
+def needs_chunking(path: str, duration_seconds: Optional[float] = None) -> bool:
+    """
+    Indica se il file va trascritto a segmenti
+
+    Obbligatorio oltre il limite di Whisper; conveniente per la latenza
+    quando la durata (letta dalle intestazioni) supera CHUNK_MIN_SECONDS.
+    """
+    if exceeds_whisper_limit(path):
+        return True
+    if duration_seconds is None:
+        duration_seconds = probe_duration(path)
+    return duration_seconds is not None and duration_seconds > CHUNK_MIN_SECONDS
+
+def pcm_needs_chunking(n_samples: int, sample_rate: int) -> bool:
+    """Come needs_chunking, per campioni int16 mono già decodificati"""
+    return n_samples * 2 > WHISPER_MAX_UPLOAD_BYTES or n_samples / sample_rate > CHUNK_MIN_SECONDS
+
+async def transcribe_in_chunks(
+    samples: np.ndarray,
+    sample_rate: int,
+    transcribe_chunk: TranscribeChunk,
+    base_prompt: str = "",
+    max_concurrency: int = 4,
+    chunk_seconds: float = CHUNK_SECONDS,
+    overlap_seconds: float = CHUNK_OVERLAP_SECONDS,
+    wait_for_context: bool = CHUNK_WAIT_FOR_CONTEXT
+) -> str:
+    """
+    Trascrive l'audio a segmenti in parallelo e ricuce il testo
+
+    Il prompt di un segmento è base_prompt più la coda della trascrizione
+    del segmento precedente. In parallelo quella coda c'è solo se il
+    precedente ha già finito quando il segmento parte: i primi
+    max_concurrency segmenti, e in genere quelli partiti insieme al
+    precedente, ricevono solo base_prompt (la sovrapposizione resta l'unica
+    continuità). Con wait_for_context ogni segmento aspetta il precedente
+    prima dell'invio: il contesto è sempre presente ma la trascrizione
+    diventa sequenziale (solo la scrittura dei WAV resta in parallelo).
+
+    Args:
+        samples: Campioni int16 mono
+        sample_rate: Frequenza di campionamento
+        transcribe_chunk: Coroutine (percorso_wav, prompt) -> testo
+        base_prompt: Prompt comune a tutti i segmenti (es. WHISPER_PROMPT)
+        max_concurrency: Segmenti trascritti contemporaneamente
+        wait_for_context: Attende sempre la trascrizione del segmento precedente
+
+    Returns:
+        Trascrizione completa
+    """
+    chunks = plan_chunks(samples, sample_rate, chunk_seconds, overlap_seconds)
+    results: List[Optional[str]] = [None] * len(chunks)
+    finished = [asyncio.Event() for _ in chunks]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # Un thread di scrittura già avviato può finire dopo la cancellazione del suo task
+    with tempfile.TemporaryDirectory(prefix="chunks_", ignore_cleanup_errors=True) as chunk_dir:
+        async def run(index: int, start: int, end: int):
+            async with semaphore:
+                chunk_path = os.path.join(chunk_dir, f"chunk_{index:04d}.wav")
+                await asyncio.to_thread(write_wav, chunk_path, samples[start:end], sample_rate)
+                if wait_for_context and index > 0:
+                    await finished[index - 1].wait()
+
+                prompt = base_prompt
+                previous = results[index - 1] if index > 0 else None
+                if previous:
+                    prompt = f"{base_prompt}\n{prompt_tail(previous)}".strip()
+
+                results[index] = await transcribe_chunk(chunk_path, prompt)
+                finished[index].set()
+                os.unlink(chunk_path)
+
+        tasks = [asyncio.create_task(run(i, start, end)) for i, (start, end) in enumerate(chunks)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Un segmento fallito: gli altri non devono partire né usare la cartella dopo la rimozione
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    return stitch_transcripts(results)
@@ -0,0 +1,236 @@
+"""
+Normalizzazione dell'audio prima di Whisper e Cloudinary
+
+Gli upload arrivano spesso come m4a ad alto bitrate o WAV non compressi,
+ma per il riconoscimento vocale bastano 16 kHz mono. Con AUDIO_NORMALIZE=1
+e ffmpeg installato, il file viene convertito in Opus (Ogg) a basso bitrate
+prima di entrambi gli upload, che diventano molto più piccoli e veloci.
+
+Il risultato è salvato in una cache su disco indicizzata per hash del
+contenuto originale, così lo stesso audio non viene convertito due volte.
+Se la conversione non riduce il file (audio già compresso) si usa
+l'originale, e i file già sotto AUDIO_NORMALIZE_MIN_KBPS non vengono
+nemmeno convertiti. Con AUDIO_NORMALIZE_FORMAT=aac l'output è un m4a AAC,
+riproducibile anche dai browser senza supporto Opus.
+
+Lo stesso formato è usato, anche con AUDIO_NORMALIZE=0, per comprimere i
+WAV che la pipeline produce dopo la rimozione dei silenzi o la divisione
+in segmenti.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from audio_probe import probe_duration
+from settings import DATA_DIR
+
+AUDIO_NORMALIZE = os.getenv('AUDIO_NORMALIZE', '0') == '1'
+AUDIO_NORMALIZE_FORMAT = os.getenv('AUDIO_NORMALIZE_FORMAT', 'opus')
+AUDIO_NORMALIZE_BITRATE = os.getenv('AUDIO_NORMALIZE_BITRATE', '24k')
+# Sotto questo bitrate il risparmio non ripaga il tempo di conversione
+AUDIO_NORMALIZE_MIN_KBPS = float(os.getenv('AUDIO_NORMALIZE_MIN_KBPS', 48))
+
+NORMALIZED_CACHE_DIR = os.getenv('NORMALIZED_CACHE_DIR', os.path.join(DATA_DIR, 'normalized'))
+NORMALIZED_CACHE_MAX_BYTES = int(os.getenv('NORMALIZED_CACHE_MB', 500)) * 1024 * 1024
+
+# Conversioni ffmpeg contemporanee (CPU-bound)
+NORMALIZE_CONCURRENCY = int(os.getenv('NORMALIZE_CONCURRENCY', os.cpu_count() or 2))
+
+NORMALIZE_SAMPLE_RATE = 16000
+
+# Estensione e parametri del codec per formato di uscita
+OUTPUT_FORMATS: Dict[str, Dict[str, Any]] = {
+    # compression_level 5: metà del tempo di codifica del default (10), dimensione quasi uguale
+    "opus": {"suffix": ".ogg", "codec": ["-c:a", "libopus", "-application", "voip", "-compression_level", "5"]},
+    "aac": {"suffix": ".m4a", "codec": ["-c:a", "aac", "-movflags", "+faststart"]},
+}
+
+class NormalizedAudio(NamedTuple):
+    # File temporaneo di proprietà del chiamante (la copia in cache resta)
+    path: str
+    original_bytes: int
+    normalized_bytes: int
+    elapsed_ms: int
+    cached: bool
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "original_bytes": self.original_bytes,
+            "normalized_bytes": self.normalized_bytes,
+            "saved_bytes": self.original_bytes - self.normalized_bytes,
+            "normalize_ms": self.elapsed_ms,
+            "cached": self.cached
+        }
+
+class AudioNormalizer:
+    """Conversione con ffmpeg e cache su disco dei file convertiti"""
+
+    def __init__(
+        self,
+        enabled: bool = AUDIO_NORMALIZE,
+        audio_format: str = AUDIO_NORMALIZE_FORMAT,
+        bitrate: str = AUDIO_NORMALIZE_BITRATE,
+        cache_dir: str = NORMALIZED_CACHE_DIR,
+        max_cache_bytes: int = NORMALIZED_CACHE_MAX_BYTES,
+        min_kbps: float = AUDIO_NORMALIZE_MIN_KBPS
+    ):
+        if audio_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato di normalizzazione non supportato: {audio_format}")
+        self.ffmpeg = shutil.which("ffmpeg")
+        self.enabled = enabled and self.ffmpeg is not None
+        if enabled and self.ffmpeg is None:
+            print("AUDIO_NORMALIZE attivo ma ffmpeg non trovato: l'audio viene inviato senza conversione")
+        self.suffix = OUTPUT_FORMATS[audio_format]["suffix"]
+        self.codec_args: List[str] = OUTPUT_FORMATS[audio_format]["codec"] + ["-b:a", bitrate]
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.min_kbps = min_kbps
+        self._slots = threading.BoundedSemaphore(NORMALIZE_CONCURRENCY)
+        self._cache_lock = threading.Lock()
+        self.normalized = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_ms = 0
+
+    def _cache_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash + self.suffix)
+
+    def _temp_path(self, directory: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=self.suffix, dir=directory)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def _link(source: str, target: str):
+        # Hard link quando possibile (stesso filesystem), altrimenti copia
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def normalize(self, path: str, content_hash: str) -> Optional[NormalizedAudio]:
+        """
+        Converte il file (o lo prende dalla cache) in un nuovo file temporaneo
+
+        Va eseguita in un thread. Il file originale non viene modificato.
+
+        Returns:
+            NormalizedAudio, oppure None se il file è già compatto o la
+            conversione non lo riduce
+        """
+        started = time.perf_counter()
+        original_bytes = os.path.getsize(path)
+        directory = os.path.dirname(path) or None
+        cache_path = self._cache_path(content_hash)
+
+        if os.path.exists(cache_path):
+            output = self._temp_path(directory)
+            os.unlink(output)
+            try:
+                self._link(cache_path, output)
+                os.utime(cache_path)
+            except FileNotFoundError:
+                # Rimosso da una pulizia concorrente: si converte di nuovo
+                pass
+            else:
+                self.cache_hits += 1
+                return self._result(output, original_bytes, started, cached=True)
+
+        duration = probe_duration(path)
+        if duration and original_bytes * 8 / duration / 1000 <= self.min_kbps:
+            self.skipped += 1
+            return None
+
+        output = self._temp_path(directory)
+        with self._slots:
+            result = subprocess.run(
+                [self.ffmpeg, "-y", "-v", "error", "-i", path, "-vn", "-ac", "1",
+                 "-ar", str(NORMALIZE_SAMPLE_RATE), *self.codec_args, output],
+                capture_output=True
+            )
+        if result.returncode != 0:
+            os.unlink(output)
+            raise RuntimeError(f"Normalizzazione ffmpeg fallita: {result.stderr.decode(errors='ignore')[:200]}")
+
+        if os.path.getsize(output) >= original_bytes:
+            os.unlink(output)
+            self.skipped += 1
+            return None
+
+        self._store(output, cache_path)
+        return self._result(output, original_bytes, started, cached=False)
+
+    def encode(self, wav_path: str) -> Optional[str]:
+        """
+        Comprime un WAV PCM prodotto dalla pipeline (silenzi rimossi, segmenti)
+
+        Indipendente da AUDIO_NORMALIZE: il WAV è un file intermedio a 32 KB/s,
+        mai più compatto della conversione. Va eseguita in un thread.
+
+        Returns:
+            Percorso del file compresso (del chiamante), oppure None senza ffmpeg
+        """
+        if self.ffmpeg is None:
+            return None
+        output = self._temp_path(os.path.dirname(wav_path) or None)
+        with self._slots:
+            result = subprocess.run(
+                [self.ffmpeg, "-y", "-v", "error", "-i", wav_path, *self.codec_args, output],
+                capture_output=True
+            )
+        if result.returncode != 0:
+            os.unlink(output)
+            raise RuntimeError(f"Compressione ffmpeg fallita: {result.stderr.decode(errors='ignore')[:200]}")
+        return output
+
+    def _result(self, output: str, original_bytes: int, started: float, cached: bool) -> NormalizedAudio:
+        normalized = NormalizedAudio(
+            output, original_bytes, os.path.getsize(output), round((time.perf_counter() - started) * 1000), cached
+        )
+        self.normalized += 1
+        self.bytes_in += normalized.original_bytes
+        self.bytes_out += normalized.normalized_bytes
+        self.total_ms += normalized.elapsed_ms
+        return normalized
+
+    def _store(self, output: str, cache_path: str):
+        """Copia il file convertito in cache (scrittura atomica) e rispetta il limite di spazio"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with self._cache_lock:
+            shutil.copyfile(output, tmp_path)
+            os.replace(tmp_path, cache_path)
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        # Rimuove i file usati meno di recente
+        for _, size, name in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            os.unlink(os.path.join(self.cache_dir, name))
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "normalized": self.normalized,
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "saved_bytes": self.bytes_in - self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "avg_normalize_ms": round(self.total_ms / self.normalized) if self.normalized else None
+        }
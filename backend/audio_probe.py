@@ -0,0 +1,332 @@
+"""
+Durata esatta dei file audio letta dalle intestazioni
+
+Legge solo le intestazioni del contenitore o dei frame, senza decodificare
+l'audio: WAV (chunk RIFF), MP3 (header Xing/Info/VBRI o scansione dei frame),
+MP4/M4A (box mvhd), FLAC (STREAMINFO), Ogg Vorbis/Opus (granule position
+dell'ultima pagina) e AAC ADTS (scansione dei frame). Le letture sono
+limitate a poche decine di byte, tranne le scansioni dei frame che usano
+un file mappato in memoria.
+"""
+
+import os
+import mmap
+import struct
+from typing import Optional, Tuple
+
+# Byte letti dalla fine dei file Ogg per trovare l'ultima pagina
+OGG_TAIL_BYTES = 64 * 1024
+
+# Frame MP3 controllati per decidere se il bitrate è costante
+MP3_CBR_CHECK_FRAMES = 8
+
+# Byte cercati dopo i tag per trovare il primo frame MP3
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+def read_wav_layout(path: str) -> Optional[Tuple[int, int, int, int, int]]:
+    """
+    Legge l'intestazione RIFF di un file WAV PCM
+
+    Returns:
+        Tupla (canali, sample_rate, bit_per_campione, offset_dati, byte_dati)
+        oppure None se il file non è un WAV PCM
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                audio_format, channels, sample_rate, _, _, bits = fmt
+                # 1 = PCM, 0xFFFE = WAVE_FORMAT_EXTENSIBLE
+                if audio_format not in (1, 0xFFFE):
+                    return None
+                data_size = min(chunk_size, os.path.getsize(path) - f.tell())
+                return channels, sample_rate, bits, f.tell(), data_size
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _wav_duration(path: str) -> Optional[float]:
+    layout = read_wav_layout(path)
+    if layout is None:
+        return None
+    channels, sample_rate, bits, _, data_size = layout
+    return data_size / (channels * sample_rate * bits / 8)
+
+def _id3v2_size(header: bytes) -> int:
+    """Dimensione del tag ID3v2 all'inizio del file (0 se assente)"""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+# --- MP3 ---
+
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_MP3_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],      # MPEG-1
+    2: [22050, 24000, 16000],      # MPEG-2
+    25: [11025, 12000, 8000],      # MPEG-2.5
+}
+
+def _parse_mp3_header(data, pos: int) -> Optional[Tuple[int, int, int, int, bool, int]]:
+    """
+    Decodifica l'header di un frame MP3
+
+    Returns:
+        Tupla (lunghezza_frame, campioni_per_frame, sample_rate, bitrate_kbps, mono, versione)
+        oppure None se i byte non sono un header valido
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version_bits = (b1 >> 3) & 0x3
+    layer_bits = (b1 >> 1) & 0x3
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    version = {0: 25, 2: 2, 3: 1}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x1
+    mono = (b3 >> 6) == 0x3
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate * 1000 // sample_rate + padding
+    return length, samples, sample_rate, bitrate, mono, version
+
+def _find_mp3_frame(data, start: int) -> Optional[int]:
+    """Primo header MP3 valido confermato dal frame successivo"""
+    limit = min(len(data), start + MP3_SYNC_SEARCH_BYTES)
+    pos = data.find(b"\xff", start, limit)
+    while pos != -1 and pos + 4 <= len(data):
+        header = _parse_mp3_header(data, pos)
+        if header is not None:
+            following = pos + header[0]
+            if following + 4 > len(data) or _parse_mp3_header(data, following) is not None:
+                return pos
+        pos = data.find(b"\xff", pos + 1, limit)
+    return None
+
+def _mp3_duration(path: str, audio_start: int) -> Optional[float]:
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        first = _find_mp3_frame(data, audio_start)
+        if first is None:
+            return None
+        _, samples, sample_rate, bitrate, mono, version = _parse_mp3_header(data, first)
+
+        # Header Xing/Info (VBR) nel primo frame, dopo le side information
+        side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+        xing = first + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info"):
+            flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+            if flags & 0x1:
+                frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+                return frames * samples / sample_rate
+
+        # Header VBRI (encoder Fraunhofer), sempre a 32 byte dall'header
+        vbri = first + 36
+        if data[vbri:vbri + 4] == b"VBRI":
+            frames = struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+            return frames * samples / sample_rate
+
+        # Bitrate costante nei primi frame: durata dai byte audio
+        pos = first
+        constant = True
+        for _ in range(MP3_CBR_CHECK_FRAMES):
+            header = _parse_mp3_header(data, pos)
+            if header is None:
+                break
+            if header[3] != bitrate:
+                constant = False
+                break
+            pos += header[0]
+
+        if constant:
+            audio_end = file_size - (128 if data[file_size - 128:file_size - 125] == b"TAG" else 0)
+            return (audio_end - first) * 8 / (bitrate * 1000)
+
+        # VBR senza header: conta i frame
+        total_samples = 0
+        pos = first
+        while True:
+            header = _parse_mp3_header(data, pos)
+            if header is None:
+                break
+            total_samples += header[1]
+            pos += header[0]
+        return total_samples / sample_rate
+
+# --- AAC ADTS ---
+
+_ADTS_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+
+def _adts_duration(path: str, audio_start: int) -> Optional[float]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        pos = audio_start
+        total_samples = 0
+        sample_rate = None
+        size = len(data)
+        while pos + 7 <= size and data[pos] == 0xFF and (data[pos + 1] & 0xF6) == 0xF0:
+            rate_index = (data[pos + 2] >> 2) & 0xF
+            if rate_index >= len(_ADTS_SAMPLE_RATES):
+                break
+            sample_rate = _ADTS_SAMPLE_RATES[rate_index]
+            frame_length = ((data[pos + 3] & 0x3) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+            if frame_length < 7:
+                break
+            total_samples += 1024 * ((data[pos + 6] & 0x3) + 1)
+            pos += frame_length
+        return total_samples / sample_rate if sample_rate else None
+
+# --- MP4 / M4A ---
+
+def _mp4_duration(path: str) -> Optional[float]:
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        def boxes(start: int, end: int):
+            pos = start
+            while pos + 8 <= end:
+                f.seek(pos)
+                size, box_type = struct.unpack(">I4s", f.read(8))
+                header = 8
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header = 16
+                elif size == 0:
+                    size = end - pos
+                if size < header:
+                    return
+                yield box_type, pos + header, pos + size
+                pos += size
+
+        for box_type, body, end in boxes(0, file_size):
+            if box_type != b"moov":
+                continue
+            for child_type, child_body, _ in boxes(body, end):
+                if child_type != b"mvhd":
+                    continue
+                f.seek(child_body)
+                version = f.read(1)[0]
+                if version == 1:
+                    f.seek(child_body + 20)
+                    timescale, duration = struct.unpack(">IQ", f.read(12))
+                else:
+                    f.seek(child_body + 12)
+                    timescale, duration = struct.unpack(">II", f.read(8))
+                return duration / timescale if timescale else None
+    return None
+
+# --- FLAC ---
+
+def _flac_duration(path: str, audio_start: int) -> Optional[float]:
+    with open(path, "rb") as f:
+        f.seek(audio_start)
+        if f.read(4) != b"fLaC":
+            return None
+        block_header = f.read(4)
+        # Il primo blocco di metadati è sempre STREAMINFO (tipo 0)
+        if len(block_header) < 4 or block_header[0] & 0x7F != 0:
+            return None
+        info = f.read(34)
+        if len(info) < 18:
+            return None
+        packed = struct.unpack(">Q", info[10:18])[0]
+        sample_rate = packed >> 44
+        total_samples = packed & ((1 << 36) - 1)
+        return total_samples / sample_rate if sample_rate and total_samples else None
+
+# --- Ogg (Vorbis, Opus) ---
+
+def _ogg_duration(path: str) -> Optional[float]:
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        first_page = f.read(27)
+        if len(first_page) < 27:
+            return None
+        segments = first_page[26]
+        f.seek(27 + segments)
+        packet = f.read(20)
+
+        pre_skip = 0
+        if packet.startswith(b"\x01vorbis"):
+            sample_rate = struct.unpack("<I", packet[12:16])[0]
+        elif packet.startswith(b"OpusHead"):
+            # La granule position di Opus è sempre a 48 kHz
+            sample_rate = 48000
+            pre_skip = struct.unpack("<H", packet[10:12])[0]
+        else:
+            return None
+
+        tail_start = max(0, file_size - OGG_TAIL_BYTES)
+        f.seek(tail_start)
+        tail = f.read()
+        last_page = tail.rfind(b"OggS")
+        if last_page == -1 or last_page + 14 > len(tail):
+            return None
+        granule = struct.unpack("<q", tail[last_page + 6:last_page + 14])[0]
+        if granule <= 0 or not sample_rate:
+            return None
+        return max(0, granule - pre_skip) / sample_rate
+
+def probe_duration(path: str) -> Optional[float]:
+    """
+    Durata dell'audio in secondi letta dalle intestazioni
+
+    Il formato è riconosciuto dai primi byte, non dall'estensione.
+
+    Returns:
+        Durata in secondi, oppure None se il formato non è riconosciuto
+        o le intestazioni non sono valide
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+                return _wav_duration(path)
+            if head[4:8] == b"ftyp":
+                return _mp4_duration(path)
+            if head[:4] == b"OggS":
+                return _ogg_duration(path)
+
+            # ID3v2 può precedere sia MP3 che FLAC e AAC
+            f.seek(0)
+            audio_start = _id3v2_size(f.read(10))
+            f.seek(audio_start)
+            start = f.read(4)
+
+        if start == b"fLaC":
+            return _flac_duration(path, audio_start)
+        if len(start) >= 2 and start[0] == 0xFF and (start[1] & 0xF6) == 0xF0:
+            return _adts_duration(path, audio_start)
+        return _mp3_duration(path, audio_start)
+    except (OSError, ValueError, struct.error, IndexError):
+        return None
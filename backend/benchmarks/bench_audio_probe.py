@@ -0,0 +1,133 @@
+"""
+Benchmark della lettura della durata dalle intestazioni
+
+Crea file sintetici grandi (sparse dove possibile) per ogni formato
+supportato, verifica che probe_duration ritorni la durata attesa e misura
+il tempo medio per file.
+
+Uso:
+    python benchmarks/bench_audio_probe.py --size-mb 500
+"""
+
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_probe import probe_duration  # noqa: E402
+
+def make_wav(path: str, size: int) -> float:
+    sample_rate, channels, bits = 44100, 2, 16
+    data_size = size - 44
+    with open(path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", size - 8) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate,
+                                      sample_rate * channels * bits // 8, channels * bits // 8, bits))
+        f.write(b"data" + struct.pack("<I", data_size))
+        f.truncate(size)
+    return data_size / (sample_rate * channels * bits / 8)
+
+def make_mp3_cbr(path: str, size: int) -> float:
+    # MPEG-1 Layer III, 64 kbps, 44.1 kHz, mono: frame da 208 byte
+    frame = b"\xff\xfb\x50\xc0" + b"\x00" * 204
+    frames = size // len(frame)
+    with open(path, "wb") as f:
+        f.write(frame * frames)
+    return frames * len(frame) * 8 / 64000
+
+def make_mp3_xing(path: str, size: int) -> float:
+    frames = 123456
+    first = bytearray(b"\xff\xfb\x90\xc0" + b"\x00" * 413)
+    first[4 + 17:4 + 17 + 12] = b"Xing" + struct.pack(">II", 1, frames)
+    second = b"\xff\xfb\x90\xc0" + b"\x00" * 413
+    with open(path, "wb") as f:
+        f.write(bytes(first) + second)
+        f.truncate(size)
+    return frames * 1152 / 44100
+
+def make_mp4(path: str, size: int) -> float:
+    timescale, duration = 44100, 44100 * 3723
+    mvhd_body = struct.pack(">B3xIIII", 0, 0, 0, timescale, duration) + b"\x00" * 80
+    mvhd = struct.pack(">I4s", 8 + len(mvhd_body), b"mvhd") + mvhd_body
+    moov = struct.pack(">I4s", 8 + len(mvhd), b"moov") + mvhd
+    ftyp = struct.pack(">I4s4sI", 16, b"ftyp", b"M4A ", 0)
+    mdat_size = size - len(ftyp) - len(moov)
+    with open(path, "wb") as f:
+        f.write(ftyp)
+        f.write(struct.pack(">I4s", mdat_size, b"mdat"))
+        f.seek(len(ftyp) + mdat_size)
+        f.write(moov)
+    return duration / timescale
+
+def make_flac(path: str, size: int) -> float:
+    sample_rate, total_samples = 48000, 48000 * 5400
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo = struct.pack(">HH3s3sQ16s", 4096, 4096, b"\x00" * 3, b"\x00" * 3, packed, b"\x00" * 16)
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo)
+        f.truncate(size)
+    return total_samples / sample_rate
+
+def make_ogg_opus(path: str, size: int) -> float:
+    def page(granule: int, payload: bytes) -> bytes:
+        return (b"OggS" + bytes([0, 0]) + struct.pack("<qIII", granule, 1, 0, 0)
+                + bytes([1, len(payload)]) + payload)
+    pre_skip, granule = 312, 48000 * 2400 + 312
+    head = b"OpusHead" + bytes([1, 1]) + struct.pack("<HIhB", pre_skip, 48000, 0, 0)
+    last = page(granule, b"\x00" * 10)
+    with open(path, "wb") as f:
+        f.write(page(0, head))
+        f.seek(size - len(last))
+        f.write(last)
+    return (granule - pre_skip) / 48000
+
+def make_adts(path: str, size: int) -> float:
+    # AAC LC 44.1 kHz, frame da 372 byte, 1024 campioni per frame
+    length = 372
+    header = bytes([0xFF, 0xF1, 0x50, 0x80 | (length >> 11), (length >> 3) & 0xFF, ((length & 7) << 5) | 0x1F, 0xFC])
+    frame = header + b"\x00" * (length - 7)
+    frames = size // length
+    with open(path, "wb") as f:
+        f.write(frame * frames)
+    return frames * 1024 / 44100
+
+FORMATS = [
+    ("wav", make_wav, 1.0),
+    ("mp3 cbr", make_mp3_cbr, 1.0),
+    ("mp3 xing", make_mp3_xing, 1.0),
+    ("m4a", make_mp4, 1.0),
+    ("flac", make_flac, 1.0),
+    ("ogg opus", make_ogg_opus, 1.0),
+    # ADTS non ha un indice: la scansione dei frame è proporzionale alla dimensione
+    ("aac adts", make_adts, 0.05),
+]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, make, size_factor in FORMATS:
+            path = os.path.join(tmp_dir, name.replace(" ", "_"))
+            size = int(args.size_mb * 1024 * 1024 * size_factor)
+            expected = make(path, size)
+            repeat = args.repeat if size_factor == 1.0 else 3
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                duration = probe_duration(path)
+            elapsed = (time.perf_counter() - start) / repeat
+
+            ok = duration is not None and abs(duration - expected) < 0.05
+            print(f"{name:>9} ({size / 1024 / 1024:.0f} MB): {duration or 0:9.2f}s "
+                  f"{'ok' if ok else 'ERRATO (atteso ' + format(expected, '.2f') + ')'}, "
+                  f"{elapsed * 1000:.3f} ms per probe")
+
+if __name__ == "__main__":
+    main()
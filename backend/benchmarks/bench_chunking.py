@@ -0,0 +1,121 @@
+"""
+Benchmark offline della trascrizione a segmenti
+
+Genera audio sintetico (parlato simulato con rumore e pause), lo trascrive con
+un trascrittore finto che ha latenza proporzionale alla durata del segmento e
+verifica che il testo ricucito coincida con quello atteso, confrontando il
+tempo totale con diversi livelli di parallelismo. Controlla anche il prompt
+ricevuto da ogni segmento: la coda del precedente quando è già trascritto
+(sempre, in sequenza o con wait_for_context), altrimenti il solo prompt base.
+
+Uso:
+    python benchmarks/bench_chunking.py --minutes 30
+"""
+
+import os
+import sys
+import time
+import wave
+import asyncio
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_chunking import PCM_SAMPLE_RATE, plan_chunks, prompt_tail, transcribe_in_chunks  # noqa: E402
+
+WORDS_PER_SECOND = 2
+# Secondi di latenza simulata per minuto di audio trascritto
+LATENCY_PER_MINUTE = 0.05
+
+def synthetic_speech(minutes: float, sample_rate: int = PCM_SAMPLE_RATE) -> np.ndarray:
+    """Alterna 4-9 s di rumore (parlato) a 0.3-1.5 s di silenzio"""
+    rng = np.random.default_rng(42)
+    parts = []
+    total = 0
+    target = int(minutes * 60 * sample_rate)
+    while total < target:
+        speech = rng.normal(0, 3000, int(rng.uniform(4, 9) * sample_rate)).astype(np.int16)
+        pause = np.zeros(int(rng.uniform(0.3, 1.5) * sample_rate), dtype=np.int16)
+        parts.extend([speech, pause])
+        total += len(speech) + len(pause)
+    return np.concatenate(parts)[:target]
+
+def make_fake_transcriber(sample_rate: int, words, calls: dict):
+    """
+    Trascrittore che ritorna le parole 'pronunciate' nell'intervallo del segmento
+
+    In calls registra per indice del segmento il prompt ricevuto, il testo
+    ritornato e se il segmento precedente era già finito alla partenza.
+    """
+    async def transcribe(chunk_path: str, prompt: str) -> str:
+        index = int(os.path.basename(chunk_path)[len("chunk_"):-len(".wav")])
+        previous_done = index > 0 and "text" in calls.get(index - 1, {})
+        calls[index] = {"prompt": prompt, "previous_done": previous_done}
+        with wave.open(chunk_path) as wav_file:
+            frames = wav_file.getnframes()
+            data = np.frombuffer(wav_file.readframes(frames), dtype=np.int16)
+        # Il primo campione del segmento identifica la sua posizione nell'audio originale
+        start = starts[data[:64].tobytes()]
+        first = start * WORDS_PER_SECOND // sample_rate
+        last = (start + frames) * WORDS_PER_SECOND // sample_rate
+        await asyncio.sleep(frames / sample_rate / 60 * LATENCY_PER_MINUTE)
+        calls[index]["text"] = " ".join(words[first:last])
+        return calls[index]["text"]
+
+    starts = {}
+    return transcribe, starts
+
+def prompt_errors(calls: dict, concurrency: int, wait_for_context: bool) -> list:
+    """Segmenti che non hanno ricevuto il prompt atteso"""
+    errors = []
+    for index, call in sorted(calls.items()):
+        expected = prompt_tail(calls[index - 1]["text"]) if call["previous_done"] else ""
+        if call["prompt"] != expected:
+            errors.append(f"segmento {index}: prompt inatteso")
+        if index > 0 and (wait_for_context or concurrency == 1) and not call["previous_done"]:
+            errors.append(f"segmento {index}: partito senza il contesto del precedente")
+        if 0 < index < concurrency and not wait_for_context and call["prompt"]:
+            errors.append(f"segmento {index}: contesto tra i primi {concurrency} segmenti paralleli")
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--chunk-seconds", type=float, default=120)
+    args = parser.parse_args()
+    failed = False
+
+    samples = synthetic_speech(args.minutes)
+    words = [f"parola{i}" for i in range(len(samples) * WORDS_PER_SECOND // PCM_SAMPLE_RATE)]
+    calls: dict = {}
+    transcribe, starts = make_fake_transcriber(PCM_SAMPLE_RATE, words, calls)
+    chunks = plan_chunks(samples, PCM_SAMPLE_RATE, args.chunk_seconds)
+    for start, _ in chunks:
+        starts[samples[start:start + 64].tobytes()] = start
+
+    print(f"Audio: {args.minutes:.0f} min, segmenti: {len(chunks)}")
+    for concurrency, wait_for_context in ((1, False), (2, False), (4, False), (8, False), (4, True)):
+        calls.clear()
+        begin = time.perf_counter()
+        text = asyncio.run(transcribe_in_chunks(
+            samples, PCM_SAMPLE_RATE, transcribe,
+            max_concurrency=concurrency, chunk_seconds=args.chunk_seconds, wait_for_context=wait_for_context
+        ))
+        elapsed = time.perf_counter() - begin
+        ok = text.split() == words
+        errors = prompt_errors(calls, concurrency, wait_for_context)
+        with_context = sum(1 for call in calls.values() if call["prompt"])
+        label = f"concorrenza {concurrency}{' con contesto' if wait_for_context else ''}"
+        print(f"{label}: {elapsed:.2f}s, testo {'corretto' if ok else 'ERRATO'}, "
+              f"segmenti con contesto {with_context}/{len(calls)}")
+        for error in errors:
+            print(f"  ERRORE: {error}")
+        failed = failed or not ok or bool(errors)
+
+    if failed:
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark dell'avvio a freddo del backend
+
+Ogni misura avvia un interprete nuovo, come un'istanza appena risvegliata:
+tempo di import di app.py, avvio del lifespan e prima richiesta a GET /.
+Usa l'archivio SQLite in una cartella temporanea, quindi non serve alcun
+servizio esterno. Riporta anche i moduli più lenti da importare
+(python -X importtime) e, per confronto, il costo degli SDK che l'app ora
+importa solo al primo utilizzo.
+
+Con --max-ms il comando fallisce se l'avvio (import + prima richiesta)
+supera la soglia, per intercettare le regressioni.
+
+Uso:
+    python benchmarks/bench_cold_start.py --runs 5 --max-ms 1500
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.app) as client:
+    ready = time.perf_counter()
+    client.get("/")
+    answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "lifespan_ms": (ready - imported) * 1000,
+    "first_request_ms": (answered - ready) * 1000,
+    "total_ms": (answered - started) * 1000,
+}))
+"""
+
+# SDK caricati al primo utilizzo: misurati a parte per mostrare quanto costerebbero all'avvio
+DEFERRED_SDKS = ["openai", "anthropic", "cloudinary", "firebase_admin", "tiktoken"]
+
+def probe_env(data_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "NOTE_STORE": "sqlite",
+        "DATA_DIR": data_dir,
+        "PREWARM_CONNECTIONS": "0",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+def measure_start(data_dir: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=probe_env(data_dir),
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(data_dir: str, top: int) -> list:
+    """Pacchetti importati da app.py con il tempo cumulativo di import più alto"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR,
+        env=probe_env(data_dir), capture_output=True, text=True, check=True
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        package = name.strip().split(".")[0]
+        if package != "app":
+            packages[package] = max(packages.get(package, 0.0), int(cumulative) / 1000)
+    return sorted(((ms, name) for name, ms in packages.items()), reverse=True)[:top]
+
+def sdk_import_ms(module: str):
+    result = subprocess.run(
+        [sys.executable, "-c",
+         f"import time; s = time.perf_counter(); import {module}; print((time.perf_counter() - s) * 1000)"],
+        capture_output=True, text=True
+    )
+    return float(result.stdout) if result.returncode == 0 else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Moduli più lenti da mostrare")
+    parser.add_argument("--max-ms", type=float, default=None, help="Soglia sulla mediana di import + prima richiesta")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        runs = [measure_start(data_dir) for _ in range(args.runs)]
+        imports = slowest_imports(data_dir, args.top)
+
+    print(f"Avvio a freddo, mediana su {args.runs} processi:")
+    for key, label in [("import_ms", "import app"), ("lifespan_ms", "lifespan"),
+                       ("first_request_ms", "prima richiesta"), ("total_ms", "totale")]:
+        values = [run[key] for run in runs]
+        print(f"  {label:16s} {statistics.median(values):8.1f} ms  (min {min(values):.1f}, max {max(values):.1f})")
+
+    print("Import più lenti (cumulativi):")
+    for elapsed, name in imports:
+        print(f"  {name:24s} {elapsed:8.1f} ms")
+
+    print("SDK rinviati al primo utilizzo:")
+    for module in DEFERRED_SDKS:
+        elapsed = sdk_import_ms(module)
+        print(f"  {module:24s} " + (f"{elapsed:8.1f} ms" if elapsed is not None else "   non installato"))
+
+    total = statistics.median(run["total_ms"] for run in runs)
+    if args.max_ms is not None and total > args.max_ms:
+        print(f"Regressione: avvio {total:.1f} ms oltre la soglia di {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: N upload contemporanei con chiamate bloccanti vs thread pool
+
+Simula la pipeline di /api/transcribe (Cloudinary → Whisper → Claude → Firestore)
+con latenze finte e confronta il tempo totale quando le chiamate bloccano
+l'event loop e quando passano da run_blocking. Misura anche il ritardo massimo
+dell'event loop, cioè quanto aspetterebbe una richiesta a /api/notes.
+
+Uso:
+    python benchmarks/bench_concurrency.py --uploads 4
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrency import run_blocking  # noqa: E402
+
+# Latenze simulate per stage (secondi)
+STAGES = [
+    ("cloudinary", 0.3),
+    ("whisper", 0.6),
+    ("claude", 0.9),
+    ("firestore", 0.05),
+]
+
+async def pipeline_blocking():
+    for _, latency in STAGES:
+        time.sleep(latency)
+
+async def pipeline_non_blocking():
+    for provider, latency in STAGES:
+        await run_blocking(provider, time.sleep, latency)
+
+async def measure_loop_lag(stop: asyncio.Event) -> float:
+    """Ritorna il ritardo massimo osservato dall'event loop"""
+    max_lag = 0.0
+    interval = 0.01
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+async def run(pipeline, uploads: int):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(pipeline() for _ in range(uploads)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await lag_task
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=4)
+    args = parser.parse_args()
+
+    single = sum(latency for _, latency in STAGES)
+    print(f"Pipeline singola: {single:.2f}s, upload contemporanei: {args.uploads}")
+
+    for name, pipeline in (("bloccante", pipeline_blocking), ("thread pool", pipeline_non_blocking)):
+        elapsed, lag = asyncio.run(run(pipeline, args.uploads))
+        print(f"{name:>12}: totale {elapsed:.2f}s, ritardo max event loop {lag * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main()
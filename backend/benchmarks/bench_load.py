@@ -0,0 +1,415 @@
+"""
+Test di carico end-to-end dell'API con servizi esterni simulati
+
+Avvia app.py con uvicorn in un processo separato, con gli SDK reali
+puntati ai servizi di fake_services.py (OpenAI, Anthropic, Cloudinary) e
+Firestore sostituito dal client in memoria; con --store sqlite usa invece
+l'archivio SQLite vero. Nessuna chiamata esce dalla macchina.
+
+N utenti virtuali eseguono per --duration secondi un mix di operazioni:
+/api/transcribe (WAV 16 kHz sempre diversi, per non colpire la cache dei
+risultati), /api/transcribe/stream (solo se indicato in --mix), lista /api/notes con paginazione, lettura, modifica ed
+eliminazione di note. Per ogni operazione riporta p50/p95/p99 ed errori,
+e in totale richieste al secondo e picco di memoria (RSS) del server.
+
+I risultati si confrontano con benchmarks/baselines/load.json: il comando
+termina con codice 1 se p95, RPS, memoria o tasso di errore peggiorano
+oltre --tolerance. Le baseline dipendono dalla macchina: rigenerarle con
+--save-baseline dopo ogni modifica voluta delle prestazioni.
+
+Uso:
+    python benchmarks/bench_load.py --concurrency 8 --duration 30
+    python benchmarks/bench_load.py --latency-scale 0.1 --save-baseline
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import wave
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import DEFAULT_PROFILES, FakeServices, ServiceProfile, install_fake_firestore  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load.json")
+
+# Peso di ogni operazione nel mix (uso tipico: molte letture, poche trascrizioni)
+DEFAULT_MIX = "transcribe=1,list=4,get=4,update=2,delete=1"
+
+# Note presenti all'avvio, e sotto cui le eliminazioni vengono sospese
+SEED_NOTES = 200
+MIN_NOTES = 20
+
+SAMPLE_RATE = 16000
+BENCH_PASSWORD = "bench"
+
+def scaled_profiles(latency_scale: float, error_scale: float) -> Dict[str, ServiceProfile]:
+    return {name: profile.scaled(latency_scale, error_scale) for name, profile in DEFAULT_PROFILES.items()}
+
+def synthetic_wav(seconds: float) -> bytes:
+    """Parlato sintetico con pause, WAV 16 kHz mono 16 bit"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+    pauses = np.sin(2 * np.pi * 0.2 * t) > -0.6
+    signal = 0.25 * voice * pauses + 0.003 * rng.standard_normal(len(t))
+    samples = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+def seed_notes(count: int) -> List[Dict[str, Any]]:
+    """Note realistiche costruite con build_note, come dopo una trascrizione"""
+    import app
+    from fake_services import CLAUDE_TEXT, TRANSCRIPTION_TEXT
+
+    usage = {"input_tokens": 60, "output_tokens": 120, "cache_read_input_tokens": 1200}
+    return [
+        app.build_note(
+            f"memo_{index}.m4a", "linkedin", TRANSCRIPTION_TEXT, CLAUDE_TEXT,
+            f"https://res.cloudinary.com/bench/video/upload/v1/voice_notes/memo_{index}.m4a",
+            "archived", usage, 1.5
+        )
+        for index in range(count)
+    ]
+
+def serve(args):
+    """Processo del server: configura i servizi simulati e avvia uvicorn"""
+    import uvicorn
+    import app
+    from note_store import FirestoreNoteStore
+    from providers import cloudinary_sdk
+
+    random.seed(args.seed)
+    profiles = scaled_profiles(args.latency_scale, args.error_scale)
+    cloudinary_sdk().config(upload_prefix=args.fake_url)
+    if isinstance(app.note_store, FirestoreNoteStore):
+        install_fake_firestore(app.note_store, profiles["firestore"])
+
+    async def main():
+        await app.note_store.add_many(seed_notes(SEED_NOTES))
+        config = uvicorn.Config(app.app, host="127.0.0.1", port=args.port, log_level="warning")
+        await uvicorn.Server(config).serve()
+
+    asyncio.run(main())
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args, fake_url: str, data_dir: str, log) -> subprocess.Popen:
+    port = free_port()
+    env = {
+        # I limiti al minuto dipendono dall'account, non dall'API: disattivati salvo override
+        "WHISPER_RPM": "0",
+        "CLAUDE_RPM": "0",
+        "CLAUDE_TPM": "0",
+        **os.environ,
+        "DATA_DIR": data_dir,
+        "NOTE_STORE": args.store,
+        "NOTES_DB_PATH": os.path.join(data_dir, "notes.sqlite3"),
+        "APP_PASSWORD": BENCH_PASSWORD,
+        "AUTH_SECRET_KEY": "bench-secret",
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": fake_url + "/v1",
+        "ANTHROPIC_API_KEY": "sk-ant-bench",
+        "ANTHROPIC_BASE_URL": fake_url,
+        "CLOUDINARY_CLOUD_NAME": "bench",
+        "CLOUDINARY_API_KEY": "bench",
+        "CLOUDINARY_API_SECRET": "bench",
+        "FIREBASE_SERVICE_ACCOUNT": "{}",
+        "PREWARM_CONNECTIONS": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--fake-url", fake_url,
+         "--latency-scale", str(args.latency_scale), "--error-scale", str(args.error_scale),
+         "--seed", str(args.seed)],
+        env=env, stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    process.base_url = f"http://127.0.0.1:{port}"
+    return process
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Il server si è chiuso durante l'avvio")
+        try:
+            if (await client.get("/", timeout=5)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Il server non risponde")
+
+class LoadRun:
+    """Utenti virtuali, note conosciute e latenze per operazione"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], audio: bytes, seed: int):
+        self.client = client
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.audio = audio
+        self.random = random.Random(seed)
+        self.note_ids: List[str] = []
+        self.uploads = 0
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = {name: 0 for name in mix}
+        self.client_errors: Dict[str, int] = {name: 0 for name in mix}
+        # Risposte 429 del controllo di ammissione: né latenze né errori
+        self.rejected: Dict[str, int] = {name: 0 for name in mix}
+
+    async def load_note_ids(self):
+        cursor = None
+        while True:
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            page = (await self.client.get("/api/notes", params=params)).json()
+            self.note_ids += [note["id"] for note in page["notes"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
+
+    def unique_audio(self) -> bytes:
+        # Primi campioni diversi per ogni upload: hash nuovo, nessun risultato in cache
+        self.uploads += 1
+        return self.audio[:44] + self.uploads.to_bytes(8, "little") + self.audio[52:]
+
+    async def transcribe(self) -> httpx.Response:
+        response = await self.client.post(
+            "/api/transcribe", files={"file": (f"memo_{self.uploads}.wav", self.unique_audio(), "audio/wav")}
+        )
+        if response.status_code == 200:
+            self.note_ids.append(response.json()["id"])
+        return response
+
+    async def stream(self) -> httpx.Response:
+        response = await self.client.post(
+            "/api/transcribe/stream", files={"file": (f"memo_{self.uploads}.wav", self.unique_audio(), "audio/wav")}
+        )
+        # Gli errori della pipeline arrivano come evento SSE con stato 200
+        if "event: error" in response.text:
+            response.status_code = 502
+        elif response.status_code == 200:
+            saved = response.text.split("event: saved\ndata: ")[-1].split("\n")[0]
+            self.note_ids.append(json.loads(saved)["id"])
+        return response
+
+    async def list(self) -> httpx.Response:
+        response = await self.client.get("/api/notes")
+        cursor = response.json().get("next_cursor") if response.status_code == 200 else None
+        # Un terzo degli utenti scorre anche alla seconda pagina
+        if cursor and self.random.random() < 1 / 3:
+            response = await self.client.get("/api/notes", params={"cursor": cursor})
+        return response
+
+    async def get(self) -> httpx.Response:
+        return await self.client.get(f"/api/note/{self.random.choice(self.note_ids)}")
+
+    async def update(self) -> httpx.Response:
+        return await self.client.put(
+            f"/api/note/{self.random.choice(self.note_ids)}", json={"title": f"Titolo {self.random.random():.6f}"}
+        )
+
+    async def delete(self) -> Optional[httpx.Response]:
+        if len(self.note_ids) <= MIN_NOTES:
+            return None
+        # Tolta subito dall'elenco: gli altri utenti non la leggono più
+        note_id = self.note_ids.pop(self.random.randrange(len(self.note_ids)))
+        return await self.client.delete(f"/api/note/{note_id}")
+
+    async def user(self, deadline: float):
+        while time.monotonic() < deadline:
+            name = self.random.choices(self.operations, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, name)()
+            except httpx.HTTPError:
+                self.errors[name] += 1
+                continue
+            if response is None:
+                continue
+            if response.status_code >= 500:
+                self.errors[name] += 1
+                continue
+            if response.status_code == 429:
+                self.rejected[name] += 1
+                continue
+            self.latencies[name].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                self.client_errors[name] += 1
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    total = len(ordered) + errors
+    return {
+        "requests": len(ordered),
+        "rps": round(len(ordered) / elapsed, 2),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+    }
+
+def peak_rss_mb() -> float:
+    """Picco di memoria del processo figlio terminato (il server)"""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux riporta KiB, macOS byte
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+async def run_load(args, server: subprocess.Popen) -> Dict[str, Any]:
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=600) as client:
+        await wait_ready(client, server)
+        return await drive(args, client, mix)
+
+async def drive(args, client: httpx.AsyncClient, mix: Dict[str, float]) -> Dict[str, Any]:
+    login = await client.post("/api/login", json={"password": BENCH_PASSWORD})
+    client.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+
+    run = LoadRun(client, mix, synthetic_wav(args.audio_seconds), args.seed)
+    await run.load_note_ids()
+
+    started = time.monotonic()
+    await asyncio.gather(*(run.user(started + args.duration) for _ in range(args.concurrency)))
+    elapsed = time.monotonic() - started
+
+    all_latencies = [value for values in run.latencies.values() for value in values]
+    return {
+        "total": summarize(all_latencies, sum(run.errors.values()), elapsed),
+        "operations": {
+            name: {
+                **summarize(run.latencies[name], run.errors[name], elapsed),
+                "4xx": run.client_errors[name],
+                "429": run.rejected[name]
+            }
+            for name in mix
+        },
+    }
+
+def print_results(results: Dict[str, Any]):
+    print(f"  {'operazione':12s} {'richieste':>9s} {'rps':>7s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'errori':>7s} {'429':>5s}")
+    rows = [*results["operations"].items(), ("totale", results["total"])]
+    for name, stats in rows:
+        rejected = stats.get("429", sum(op.get("429", 0) for op in results["operations"].values()))
+        print(f"  {name:12s} {stats['requests']:9d} {stats['rps']:7.2f} {stats['p50_ms']:7.0f}ms "
+              f"{stats['p95_ms']:7.0f}ms {stats['p99_ms']:7.0f}ms {stats['error_rate']:7.2%} {rejected:5d}")
+    print(f"  picco memoria server: {results['peak_rss_mb']:.0f} MB")
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    found = []
+    current, previous = results["total"], baseline["total"]
+    if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+        found.append(f"p95 {current['p95_ms']:.0f} ms contro {previous['p95_ms']:.0f} ms della baseline")
+    if current["rps"] < previous["rps"] * (1 - tolerance):
+        found.append(f"{current['rps']:.2f} richieste/s contro {previous['rps']:.2f} della baseline")
+    if current["error_rate"] > previous["error_rate"] + 0.02:
+        found.append(f"errori {current['error_rate']:.2%} contro {previous['error_rate']:.2%} della baseline")
+    if results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        found.append(f"memoria {results['peak_rss_mb']:.0f} MB contro {baseline['peak_rss_mb']:.0f} MB della baseline")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="pesi delle operazioni, es. transcribe=1,list=4")
+    parser.add_argument("--audio-seconds", type=float, default=20)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="moltiplica le latenze simulate")
+    parser.add_argument("--error-scale", type=float, default=1.0, help="moltiplica i tassi di errore simulati")
+    parser.add_argument("--store", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--name", help="nome della baseline (default: store e concorrenza)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    # Modalità interna: processo del server
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--fake-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    name = args.name or f"{args.store}-c{args.concurrency}"
+    random.seed(args.seed)
+    services = FakeServices(scaled_profiles(args.latency_scale, args.error_scale)).start()
+    print(f"{args.concurrency} utenti per {args.duration:.0f} s, archivio {args.store}, "
+          f"latenze x{args.latency_scale}, errori x{args.error_scale}")
+
+    with tempfile.TemporaryDirectory() as data_dir, tempfile.TemporaryFile("w+") as log:
+        server = start_server(args, services.url, data_dir, log)
+        try:
+            results = asyncio.run(run_load(args, server))
+        except Exception:
+            log.seek(0)
+            print(log.read()[-4000:])
+            raise
+        finally:
+            server.terminate()
+            server.wait()
+            services.stop()
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["fake_calls"] = dict(sorted(services.counters.items()))
+    print_results(results)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.save_baseline:
+        baselines[name] = {
+            **results,
+            "config": {key: getattr(args, key) for key in
+                       ("concurrency", "duration", "mix", "audio_seconds", "latency_scale", "error_scale", "store")},
+            "machine": f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}",
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline '{name}' salvata in {args.baseline}")
+        return
+
+    if name not in baselines:
+        print(f"Nessuna baseline '{name}': eseguire con --save-baseline per crearla")
+        return
+    found = regressions(results, baselines[name], args.tolerance)
+    for message in found:
+        print(f"REGRESSIONE: {message}")
+    if found:
+        sys.exit(1)
+    print(f"ok rispetto alla baseline '{name}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark della normalizzazione audio (Opus 16 kHz mono)
+
+Genera un parlato sintetico (armoniche modulate con pause e rumore) come
+WAV 44.1 kHz stereo e, con ffmpeg, come m4a AAC a 128 kbps, cioè i due
+formati tipici degli upload. Per ciascuno misura dimensione prima e dopo,
+tempo di conversione e di lettura dalla cache, e stima la variazione di
+latenza per richiesta: l'audio viene inviato sia a Cloudinary sia a
+Whisper, quindi sul collegamento in uscita passa due volte.
+
+Uso:
+    python benchmarks/bench_normalize.py --seconds 300 --uplink-mbps 20
+"""
+
+import os
+import sys
+import wave
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_normalize import AudioNormalizer  # noqa: E402
+
+SAMPLE_RATE = 44100
+
+def synthetic_speech(seconds: float, seed: int = 0) -> np.ndarray:
+    """Sillabe di ~200 ms a frequenza variabile, separate da brevi pause"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = (np.sin(2 * np.pi * 2.5 * t) > -0.2).astype(np.float64)
+    pauses = (np.sin(2 * np.pi * 0.15 * t) > -0.8).astype(np.float64)
+    signal = 0.3 * voice * syllables * pauses + 0.01 * rng.standard_normal(len(t))
+    stereo = np.stack([signal, signal * 0.95], axis=1)
+    return (np.clip(stereo, -1, 1) * 32767).astype("<i2")
+
+def write_wav(path: str, samples: np.ndarray):
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(samples.tobytes())
+
+def to_m4a(wav_path: str, m4a_path: str):
+    subprocess.run(
+        [shutil.which("ffmpeg"), "-y", "-v", "error", "-i", wav_path, "-c:a", "aac", "-b:a", "128k", m4a_path],
+        check=True
+    )
+
+def upload_seconds(size: int, uplink_mbps: float) -> float:
+    # Cloudinary e Whisper: due upload dello stesso file sullo stesso collegamento
+    return 2 * size * 8 / (uplink_mbps * 1_000_000)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=300)
+    parser.add_argument("--uplink-mbps", type=float, default=20)
+    parser.add_argument("--format", choices=["opus", "aac"], default="opus")
+    parser.add_argument("--bitrate", default="24k")
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        print("ffmpeg non disponibile: la normalizzazione è disattivata in questo ambiente")
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        wav_path = os.path.join(workdir, "memo.wav")
+        m4a_path = os.path.join(workdir, "memo.m4a")
+        write_wav(wav_path, synthetic_speech(args.seconds))
+        to_m4a(wav_path, m4a_path)
+
+        normalizer = AudioNormalizer(
+            enabled=True, audio_format=args.format, bitrate=args.bitrate,
+            cache_dir=os.path.join(workdir, "cache")
+        )
+        print(f"{args.seconds:.0f} s di audio, uscita {args.format} {args.bitrate}, "
+              f"collegamento {args.uplink_mbps:.0f} Mbit/s")
+        for label, path in [("WAV 44.1k stereo", wav_path), ("m4a AAC 128k", m4a_path)]:
+            first = normalizer.normalize(path, label)
+            if first is None:
+                print(f"  {label}: la conversione non riduce il file")
+                continue
+            cached = normalizer.normalize(path, label)
+            before = upload_seconds(first.original_bytes, args.uplink_mbps)
+            after = upload_seconds(first.normalized_bytes, args.uplink_mbps)
+            change = first.elapsed_ms / 1000 + after - before
+            print(f"  {label}:")
+            print(f"    {first.original_bytes / 1024:9.0f} KiB → {first.normalized_bytes / 1024:6.0f} KiB "
+                  f"({first.normalized_bytes / first.original_bytes:.1%})")
+            print(f"    conversione {first.elapsed_ms} ms, da cache {cached.elapsed_ms} ms")
+            print(f"    upload {before:.2f} s → {after:.2f} s, variazione latenza {change:+.2f} s "
+                  f"({cached.elapsed_ms / 1000 + after - before:+.2f} s con cache)")
+            os.unlink(first.path)
+            os.unlink(cached.path)
+
+if __name__ == "__main__":
+    main()
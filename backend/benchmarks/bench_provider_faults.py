@@ -0,0 +1,212 @@
+"""
+Verifica di call_provider contro un server locale che inietta guasti
+
+Avvia un server HTTP in un thread che risponde con latenza variabile e,
+con le probabilità indicate, restituisce 503/529, chiude la connessione o
+risponde molto lentamente. Le stesse richieste (client httpx con pool
+keep-alive) vengono eseguite:
+
+- direttamente con run_blocking (comportamento precedente);
+- con call_provider (retry con backoff e jitter);
+- con call_provider e hedging oltre il p95;
+- contro un server sempre in errore, per verificare che il circuito si
+  apra e le chiamate successive falliscano subito;
+- annullando la prova del circuito semiaperto, che non deve bloccarlo.
+
+Termina con codice 1 se il layer non migliora il tasso di successo, se il
+circuito non si apre o se resta bloccato dopo una prova annullata.
+
+Uso:
+    python benchmarks/bench_provider_faults.py --requests 300 --error-rate 0.1
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import provider_calls  # noqa: E402
+from concurrency import PROVIDER_LIMITS, run_blocking  # noqa: E402
+from provider_calls import CallPolicy, CircuitBreaker, ProviderUnavailable, call_provider  # noqa: E402
+
+class Faults:
+    error_rate = 0.1
+    reset_rate = 0.03
+    slow_rate = 0.03
+    latency = 0.02
+    slow_latency = 0.5
+    always_fail = False
+    hits = 0
+
+class FaultyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        Faults.hits += 1
+        roll = random.random()
+        if Faults.always_fail or roll < Faults.error_rate:
+            self._reply(random.choice([503, 529]), b'{"error":"overloaded"}')
+        elif roll < Faults.error_rate + Faults.reset_rate:
+            # Connessione chiusa senza risposta
+            self.close_connection = True
+            self.connection.shutdown(2)
+        elif roll < Faults.error_rate + Faults.reset_rate + Faults.slow_rate:
+            time.sleep(Faults.slow_latency)
+            self._reply(200, b'{"text":"ok"}')
+        else:
+            time.sleep(random.uniform(0.5, 1.5) * Faults.latency)
+            self._reply(200, b'{"text":"ok"}')
+
+    def _reply(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FaultyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def register(provider: str, hedge: bool, attempts: int = 4, deadline: float = 5.0):
+    # Slot sufficienti anche per le richieste hedge dei client contemporanei
+    PROVIDER_LIMITS[provider] = 16
+    provider_calls.PROVIDER_POLICIES[provider] = CallPolicy(
+        deadline=deadline, attempts=attempts, backoff_base=0.02, backoff_max=0.2, hedge=hedge
+    )
+    provider_calls.breakers[provider] = CircuitBreaker(provider, threshold=1000)
+    provider_calls.provider_stats[provider] = provider_calls.ProviderStats()
+
+async def run_scenario(label: str, call, count: int, concurrency: int = 8) -> dict:
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await call()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                pass
+
+    started = time.perf_counter()
+    # I messaggi dei singoli retry non interessano qui
+    with contextlib.redirect_stdout(None):
+        await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies) or [0.0]
+    summary = {
+        "success": len(latencies) / count,
+        "p50": statistics.median(ordered),
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+    }
+    print(f"  {label:24s} successo {summary['success']:6.1%}  p50 {summary['p50'] * 1000:6.1f} ms  "
+          f"p99 {summary['p99'] * 1000:7.1f} ms  ({elapsed:.2f} s)")
+    return summary
+
+async def main_async(args):
+    server = start_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    client = httpx.Client(
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16),
+        timeout=httpx.Timeout(2.0, connect=1.0)
+    )
+
+    def request():
+        response = client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    Faults.error_rate, Faults.reset_rate, Faults.slow_rate = args.error_rate, args.reset_rate, args.slow_rate
+    random.seed(0)
+    register("fake", hedge=False)
+    register("fake_hedged", hedge=True)
+
+    print(f"{args.requests} richieste, errori {args.error_rate:.0%}, reset {args.reset_rate:.0%}, "
+          f"lente {args.slow_rate:.0%} ({Faults.slow_latency * 1000:.0f} ms)")
+    direct = await run_scenario("run_blocking", lambda: run_blocking("fake", request), args.requests)
+    retried = await run_scenario("call_provider", lambda: call_provider("fake", request), args.requests)
+    # Il primo giro riempie la finestra delle latenze usata per il p95
+    await run_scenario("hedging (riscaldamento)", lambda: call_provider("fake_hedged", request), args.requests)
+    await run_scenario("call_provider + hedging", lambda: call_provider("fake_hedged", request), args.requests)
+    stats = provider_calls.provider_stats["fake_hedged"]
+    print(f"  richieste hedge: {stats.hedges}, vinte dalla seconda: {stats.hedge_wins}")
+
+    # Server sempre in errore: dopo la soglia il circuito rifiuta senza chiamare il server
+    Faults.always_fail = True
+    register("fake_down", hedge=False, attempts=1)
+    provider_calls.breakers["fake_down"] = CircuitBreaker("fake_down", threshold=5, cooldown=60)
+    Faults.hits = 0
+    rejected = 0
+    with contextlib.redirect_stdout(None):
+        for _ in range(50):
+            try:
+                await call_provider("fake_down", request)
+            except ProviderUnavailable:
+                rejected += 1
+            except Exception:
+                pass
+    down_hits = Faults.hits
+    print(f"  server giù: 50 chiamate, {down_hits} arrivate al server, {rejected} rifiutate dal circuito")
+
+    # Prova in semiapertura annullata (es. upload Cloudinary cancellato dopo un errore di Whisper)
+    Faults.always_fail = False
+    Faults.error_rate = Faults.reset_rate = Faults.slow_rate = 0
+    register("fake_probe", hedge=False, attempts=1)
+    breaker = provider_calls.breakers["fake_probe"] = CircuitBreaker("fake_probe", threshold=1, cooldown=0.05)
+    with contextlib.redirect_stdout(None):
+        breaker.record_failure()
+    await asyncio.sleep(0.1)
+    probe = asyncio.create_task(call_provider("fake_probe", lambda: time.sleep(0.3)))
+    await asyncio.sleep(0.05)
+    probe.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await probe
+    try:
+        await call_provider("fake_probe", request)
+        recovered = breaker.state == "closed"
+    except Exception:
+        recovered = False
+    print(f"  prova annullata in semiapertura: circuito {breaker.state}")
+
+    server.shutdown()
+    client.close()
+
+    checks = [
+        (retried["success"] > direct["success"], "il retry non migliora il tasso di successo"),
+        (down_hits == 5 and rejected == 45, "il circuito non si è aperto dopo 5 errori"),
+        (recovered, "il circuito resta bloccato dopo una prova annullata"),
+    ]
+    failed = [message for ok, message in checks if not ok]
+    for message in failed:
+        print(f"ERRORE: {message}")
+    if failed:
+        sys.exit(1)
+    print("ok")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--reset-rate", type=float, default=0.03)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
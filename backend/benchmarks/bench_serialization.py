@@ -0,0 +1,107 @@
+"""
+Benchmark della serializzazione delle note
+
+Confronta il percorso precedente (serialize_firestore_data + JSONResponse)
+con serialize_note + encode_json su note sintetiche con trascrizioni lunghe,
+e misura dimensione e tempo della compressione gzip/brotli.
+
+Uso:
+    python benchmarks/bench_serialization.py --notes 500 --repeat 20
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import brotli, compress, encode_json, orjson, serialize_note  # noqa: E402
+
+WORDS = "oggi ho parlato con il team del nuovo progetto e abbiamo deciso di partire subito".split()
+
+def serialize_firestore_data(data: dict) -> dict:
+    """Percorso precedente, riportato qui come riferimento"""
+    serialized = {}
+    for key, value in data.items():
+        if hasattr(value, 'isoformat'):
+            serialized[key] = value.isoformat()
+        elif isinstance(value, datetime):
+            serialized[key] = value.isoformat()
+        elif key == 'timestamp' and value is None:
+            continue
+        else:
+            serialized[key] = value
+    return serialized
+
+def make_notes(count: int, words: int) -> list:
+    rng = random.Random(0)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    notes = []
+    for i in range(count):
+        transcription = " ".join(rng.choice(WORDS) for _ in range(words))
+        notes.append({
+            "title": f"Nota {i}",
+            "original_filename": f"memo_{i}.m4a",
+            "audio_url": f"https://res.cloudinary.com/demo/video/upload/v1/voice_notes/memo_{i}.m4a",
+            "archive_status": "archived",
+            "transcription": transcription,
+            "processed_text": "<p>" + transcription.capitalize() + "</p>",
+            "preview": transcription[:200],
+            "prompt_type": "linkedin",
+            "claude_usage": {"input_tokens": 1200, "output_tokens": 400, "cache_read_input_tokens": 900},
+            "audio_duration_minutes": 3.5,
+            "cost_data": {"total_cost_usd": 0.05, "total_cost_eur": 0.046, "whisper": {"cost_usd": 0.021}},
+            "created_at": (start + timedelta(minutes=i)).isoformat(),
+            "timestamp": start + timedelta(minutes=i),
+        })
+    return notes
+
+def old_path(notes: list) -> bytes:
+    payload = {"success": True, "notes": [serialize_firestore_data(n) for n in notes]}
+    return JSONResponse(payload).body
+
+def new_path(notes: list) -> bytes:
+    return encode_json({"success": True, "notes": [serialize_note(n) for n in notes]})
+
+def timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--words", type=int, default=600, help="Parole per trascrizione")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    notes = make_notes(args.notes, args.words)
+    old_body = old_path(notes)
+    new_body = new_path(notes)
+
+    old_time = timed(lambda: old_path(notes), args.repeat)
+    new_time = timed(lambda: new_path(notes), args.repeat)
+
+    print(f"{args.notes} note, {len(new_body) / 1024:.0f} KiB di JSON (orjson: {'sì' if orjson else 'no'})")
+    print(f"  precedente: {old_time * 1000:8.2f} ms")
+    print(f"  nuovo:      {new_time * 1000:8.2f} ms  ({old_time / new_time:.1f}x)")
+    print(f"  stesso contenuto: {'sì' if json.loads(old_body) == json.loads(new_body) else 'no'}")
+
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    for encoding in encodings:
+        compressed = compress(new_body, encoding)
+        elapsed = timed(lambda: compress(new_body, encoding), max(1, args.repeat // 4))
+        print(f"  {encoding:4s}: {len(compressed) / 1024:7.0f} KiB ({len(compressed) / len(new_body):.1%}) "
+              f"in {elapsed * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
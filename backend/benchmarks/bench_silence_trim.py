@@ -0,0 +1,115 @@
+"""
+Benchmark della rimozione dei silenzi (VAD a energia)
+
+Genera parlato sintetico 16 kHz mono con una quota nota di silenzio
+(pause di lunghezza casuale, più silenzio iniziale e finale) e rumore di
+fondo a bassa intensità. Per ogni quota misura:
+
+- secondi rilevati come parlato rispetto ai secondi veri;
+- richiamo del parlato, cioè la frazione di campioni di parlato vero
+  mantenuta nell'audio tagliato (deve restare almeno al 99%);
+- velocità rispetto al tempo reale;
+- minuti e costo Whisper risparmiati.
+
+Termina con codice 1 se il richiamo scende sotto --min-recall.
+
+Uso:
+    python benchmarks/bench_silence_trim.py --minutes 10 --ratios 0.1,0.3,0.5
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cost_calculator import calculate_whisper_cost  # noqa: E402
+from silence_trim import (  # noqa: E402
+    VAD_FRAME_MS, VAD_MAX_SILENCE_MS, VAD_PAD_MS, speech_intervals, speech_mask, trim_silence
+)
+
+SAMPLE_RATE = 16000
+
+def synthetic_memo(seconds: float, silence_ratio: float, seed: int = 0):
+    """
+    Alterna segmenti di parlato (2-8 s) e pause (0.3-6 s) fino alla quota di silenzio richiesta
+
+    Returns:
+        (campioni int16, maschera booleana del parlato vero)
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * SAMPLE_RATE)
+    speech_target = total * (1 - silence_ratio)
+    mask = np.zeros(total, dtype=bool)
+
+    # Segmenti di parlato casuali, poi scalati per ottenere esattamente la quota
+    lengths = []
+    while sum(lengths) < speech_target:
+        lengths.append(rng.uniform(2, 8) * SAMPLE_RATE)
+    lengths = np.array(lengths) * speech_target / sum(lengths)
+    gaps = rng.uniform(0.3, 6, len(lengths) + 1)
+    gaps = gaps * (total - speech_target) / gaps.sum()
+
+    position = gaps[0]
+    for length, gap in zip(lengths, gaps[1:]):
+        mask[int(position):int(position + length)] = True
+        position += length + gap
+
+    t = np.arange(total) / SAMPLE_RATE
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    # Sillabe con brevi pause interne, che non vanno tagliate
+    syllables = 0.2 + 0.8 * (np.sin(2 * np.pi * 3 * t) > -0.3)
+    noise = 0.003 * rng.standard_normal(total)
+    signal = 0.25 * voice * syllables * mask + noise
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2"), mask
+
+def kept_mask(samples: np.ndarray) -> np.ndarray:
+    """Campioni mantenuti dal taglio, ricalcolati con le stesse funzioni di trim_silence"""
+    frame_length = int(SAMPLE_RATE * VAD_FRAME_MS / 1000)
+    intervals = speech_intervals(
+        speech_mask(samples, frame_length),
+        round(VAD_PAD_MS / VAD_FRAME_MS), round(VAD_MAX_SILENCE_MS / VAD_FRAME_MS)
+    ) * frame_length
+    kept = np.zeros(len(samples), dtype=bool)
+    for start, end in intervals:
+        kept[start:end] = True
+    return kept
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--ratios", default="0.1,0.3,0.5")
+    parser.add_argument("--min-recall", type=float, default=0.99)
+    args = parser.parse_args()
+
+    print(f"{args.minutes:.0f} minuti di audio 16 kHz, pad {VAD_PAD_MS} ms, "
+          f"silenzi oltre {VAD_MAX_SILENCE_MS} ms tagliati")
+    failed = False
+    for ratio in (float(r) for r in args.ratios.split(",")):
+        samples, truth = synthetic_memo(args.minutes * 60, ratio)
+        started = time.perf_counter()
+        trimmed = trim_silence(samples, SAMPLE_RATE)
+        elapsed = time.perf_counter() - started
+
+        speech_seconds = truth.sum() / SAMPLE_RATE
+        sent_seconds = trimmed.speech_seconds if trimmed is not None else len(samples) / SAMPLE_RATE
+        recall = (kept_mask(samples) & truth).sum() / truth.sum() if trimmed is not None else 1.0
+        saved_minutes = (len(samples) / SAMPLE_RATE - sent_seconds) / 60
+        print(f"  silenzio {ratio:4.0%}: parlato vero {speech_seconds:6.1f} s, inviato {sent_seconds:6.1f} s, "
+              f"richiamo {recall:7.3%}, {len(samples) / SAMPLE_RATE / elapsed:5.0f}x tempo reale, "
+              f"risparmio {saved_minutes:4.1f} min (${calculate_whisper_cost(saved_minutes):.4f})")
+        if recall < args.min_recall:
+            failed = True
+            print(f"ERRORE: richiamo del parlato sotto {args.min_recall:.0%}")
+
+    if failed:
+        sys.exit(1)
+    print("ok")
+
+if __name__ == "__main__":
+    main()
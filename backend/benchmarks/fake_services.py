@@ -0,0 +1,401 @@
+"""
+Servizi esterni simulati per i test di carico
+
+FakeServices è un server HTTP locale che risponde come le API usate dal
+backend, così gli SDK veri (openai, anthropic, cloudinary) girano senza
+modifiche puntando a un indirizzo locale:
+
+- OpenAI: POST /v1/audio/transcriptions (response_format=text), GET /v1/models;
+- Anthropic: POST /v1/messages, anche in streaming (SSE), GET /v1/models;
+- Cloudinary: upload, destroy, delete_resources e ping sotto /v1_1/{cloud}/.
+
+Firestore parla gRPC, quindi FakeFirestoreClient lo sostituisce a livello
+di client: implementa le operazioni usate da FirestoreNoteStore su un
+dizionario in memoria, con latenza ed errori simulati nel thread che le
+esegue, come farebbe il client reale.
+
+Ogni servizio ha un ServiceProfile: latenza mediana, dispersione
+lognormale (coda lunga) e probabilità di errore transitorio.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from note_store import NOTES_COLLECTION, project  # noqa: E402
+
+class ServiceProfile(NamedTuple):
+    # Latenza mediana (secondi), dispersione lognormale e probabilità di errore
+    median: float
+    sigma: float
+    error_rate: float
+
+    def scaled(self, latency_scale: float, error_scale: float) -> "ServiceProfile":
+        return ServiceProfile(self.median * latency_scale, self.sigma, min(1.0, self.error_rate * error_scale))
+
+    def latency(self) -> float:
+        return self.median * random.lognormvariate(0, self.sigma)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+# Valori tipici osservati in produzione per una nota vocale breve
+DEFAULT_PROFILES: Dict[str, ServiceProfile] = {
+    "whisper": ServiceProfile(1.0, 0.4, 0.02),
+    "claude": ServiceProfile(2.5, 0.5, 0.03),
+    "cloudinary": ServiceProfile(0.6, 0.5, 0.01),
+    "firestore": ServiceProfile(0.04, 0.6, 0.002),
+}
+
+# Secondi di elaborazione Whisper per secondo di audio (WAV 16 kHz mono = 32000 byte/s)
+WHISPER_SECONDS_PER_AUDIO_SECOND = 0.02
+WAV_BYTES_PER_SECOND = 32000
+
+# Risposta simulata di Claude, inviata in streaming a pezzi di CLAUDE_DELTA_CHARS
+CLAUDE_TEXT = (
+    "TITOLO: Nota di prova\n\nTesto elaborato per il test di carico. " * 8
+).strip()
+CLAUDE_DELTA_CHARS = 40
+TRANSCRIPTION_TEXT = "Questa è una trascrizione simulata della nota vocale. " * 6
+
+class FakeServiceError(ConnectionError):
+    """Errore transitorio simulato (servizio non disponibile)"""
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    services: "FakeServices"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, payload: Any, content_type: str = "application/json"):
+        body = payload if isinstance(payload, bytes) else (
+            payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self, service: str, extra_latency: float = 0.0) -> bool:
+        """Attende la latenza simulata; False se la richiesta deve fallire"""
+        profile = self.services.profiles[service]
+        self.services.count(service)
+        time.sleep(profile.latency() + extra_latency)
+        if profile.fails():
+            self.services.count(service + "_errors")
+            return False
+        return True
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/models":
+            self._reply(200, {"object": "list", "data": [], "has_more": False, "first_id": None, "last_id": None})
+        elif path.endswith("/ping"):
+            self._reply(200, {"status": "ok"})
+        else:
+            self._reply(404, {"error": {"message": f"Percorso non simulato: {path}"}})
+
+    def do_POST(self):
+        body = self._body()
+        path = self.path.split("?")[0]
+        if path == "/v1/audio/transcriptions":
+            self._whisper(body)
+        elif path == "/v1/messages":
+            self._claude(json.loads(body))
+        elif path.endswith("/upload"):
+            self._cloudinary_upload(path, body)
+        elif path.endswith("/destroy"):
+            if self._simulate("cloudinary"):
+                self._reply(200, {"result": "ok"})
+            else:
+                self._reply(500, {"error": {"message": "General Error"}})
+        else:
+            self._reply(404, {"error": {"message": f"Percorso non simulato: {path}"}})
+
+    def do_DELETE(self):
+        self._body()
+        if self._simulate("cloudinary"):
+            self._reply(200, {"deleted": {}, "partial": False})
+        else:
+            self._reply(500, {"error": {"message": "General Error"}})
+
+    def _whisper(self, body: bytes):
+        audio_seconds = len(body) / WAV_BYTES_PER_SECOND
+        if self._simulate("whisper", audio_seconds * WHISPER_SECONDS_PER_AUDIO_SECOND):
+            self._reply(200, TRANSCRIPTION_TEXT, "text/plain")
+        else:
+            self._reply(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+
+    def _claude(self, request: Dict[str, Any]):
+        if not self._simulate("claude"):
+            self._reply(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+            return
+        usage = {
+            "input_tokens": 60,
+            "output_tokens": len(CLAUDE_TEXT) // 4,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 1200,
+        }
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model"),
+            "content": [{"type": "text", "text": CLAUDE_TEXT}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage,
+        }
+        if request.get("stream"):
+            self._claude_stream(message)
+        else:
+            self._reply(200, message)
+
+    def _claude_stream(self, message: Dict[str, Any]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(name: str, data: Dict[str, Any]):
+            chunk = f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode()
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+
+        start = {**message, "content": [], "stop_reason": None, "usage": {**message["usage"], "output_tokens": 1}}
+        event("message_start", {"message": start})
+        event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for offset in range(0, len(CLAUDE_TEXT), CLAUDE_DELTA_CHARS):
+            delta = CLAUDE_TEXT[offset:offset + CLAUDE_DELTA_CHARS]
+            event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": delta}})
+        event("content_block_stop", {"index": 0})
+        event("message_delta", {
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]}
+        })
+        event("message_stop", {})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _cloudinary_upload(self, path: str, body: bytes):
+        # Latenza proporzionale anche alla dimensione del file (upload a ~20 Mbit/s)
+        if not self._simulate("cloudinary", len(body) * 8 / 20_000_000):
+            self._reply(500, {"error": {"message": "General Error"}})
+            return
+        cloud = path.split("/")[2]
+        fields = dict(re.findall(rb'name="(\w+)"\r\n\r\n([^\r]*)\r\n', body))
+        public_id = "/".join(
+            part.decode() for part in (fields.get(b"folder"), fields.get(b"public_id")) if part
+        ) or uuid.uuid4().hex
+        version = int(time.time())
+        self._reply(200, {
+            "public_id": public_id,
+            "version": version,
+            "resource_type": "video",
+            "bytes": len(body),
+            "secure_url": f"https://res.cloudinary.com/{cloud}/video/upload/v{version}/{public_id}.wav",
+        })
+
+class FakeServices:
+    """Server HTTP locale con OpenAI, Anthropic e Cloudinary simulati"""
+
+    def __init__(self, profiles: Optional[Dict[str, ServiceProfile]] = None, host: str = "127.0.0.1"):
+        self.profiles = dict(profiles or DEFAULT_PROFILES)
+        self.counters: Dict[str, int] = {}
+        self._counters_lock = threading.Lock()
+        handler = type("Handler", (FakeHandler,), {"services": self})
+        self.server = ThreadingHTTPServer((host, 0), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str):
+        with self._counters_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def start(self) -> "FakeServices":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class _Snapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]]):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return self._data
+
+class _DocumentRef:
+    def __init__(self, client: "FakeFirestoreClient", doc_id: str):
+        self.client = client
+        self.id = doc_id
+
+    def get(self) -> _Snapshot:
+        self.client.simulate()
+        return self.client.snapshot(self.id)
+
+    def update(self, data: Dict[str, Any]):
+        self.client.simulate()
+        self.client.write("update", self.id, data)
+
+    def delete(self):
+        self.client.simulate()
+        self.client.write("delete", self.id, None)
+
+class _Query:
+    """Ordinamento fisso (created_at, id decrescenti): l'unico usato dall'archivio"""
+
+    def __init__(self, client: "FakeFirestoreClient", fields=None, after=None, count=None):
+        self.client = client
+        self.fields = fields
+        self.after = after
+        self.count = count
+
+    def select(self, fields: List[str]) -> "_Query":
+        return _Query(self.client, fields, self.after, self.count)
+
+    def order_by(self, field: str, direction: Optional[str] = None) -> "_Query":
+        return self
+
+    def start_after(self, values: Dict[str, Any]) -> "_Query":
+        return _Query(self.client, self.fields, (values["created_at"], values["__name__"].id), self.count)
+
+    def limit(self, count: int) -> "_Query":
+        return _Query(self.client, self.fields, self.after, count)
+
+    def stream(self):
+        self.client.simulate()
+        return iter(self.client.query(self.fields, self.after, self.count))
+
+class _Collection(_Query):
+    def document(self, doc_id: Optional[str] = None) -> _DocumentRef:
+        return _DocumentRef(self.client, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data: Dict[str, Any]):
+        self.client.simulate()
+        ref = self.document()
+        self.client.write("set", ref.id, data)
+        return datetime.now(timezone.utc), ref
+
+class _Batch:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self.client = client
+        self.operations = []
+
+    def set(self, ref: _DocumentRef, data: Dict[str, Any]):
+        self.operations.append(("set", ref.id, data))
+
+    def update(self, ref: _DocumentRef, data: Dict[str, Any]):
+        self.operations.append(("update", ref.id, data))
+
+    def delete(self, ref: _DocumentRef):
+        self.operations.append(("delete", ref.id, None))
+
+    def commit(self):
+        self.client.simulate()
+        for operation in self.operations:
+            self.client.write(*operation)
+
+class FakeFirestoreClient:
+    """Client Firestore in memoria per FirestoreNoteStore, con latenza ed errori simulati"""
+
+    SERVER_TIMESTAMP = object()
+
+    class Query:
+        ASCENDING = "ASCENDING"
+        DESCENDING = "DESCENDING"
+
+    def __init__(self, profile: ServiceProfile = DEFAULT_PROFILES["firestore"]):
+        self.profile = profile
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def simulate(self):
+        self.calls += 1
+        time.sleep(self.profile.latency())
+        if self.profile.fails():
+            self.errors += 1
+            raise FakeServiceError("Firestore non disponibile (errore simulato)")
+
+    def collection(self, name: str) -> _Collection:
+        return _Collection(self)
+
+    def batch(self) -> _Batch:
+        return _Batch(self)
+
+    def get_all(self, refs: List[_DocumentRef], field_paths: Optional[List[str]] = None):
+        self.simulate()
+        for ref in refs:
+            snapshot = self.snapshot(ref.id)
+            if snapshot.exists and field_paths is not None:
+                snapshot = _Snapshot(ref.id, project(snapshot.to_dict(), field_paths))
+            yield snapshot
+
+    @staticmethod
+    def _copy(data: Dict[str, Any]) -> Dict[str, Any]:
+        # Come la deserializzazione del client reale: una copia indipendente a ogni lettura
+        return json.loads(json.dumps(data, default=str))
+
+    def snapshot(self, doc_id: str) -> _Snapshot:
+        with self._lock:
+            data = self.docs.get(doc_id)
+            return _Snapshot(doc_id, self._copy(data) if data is not None else None)
+
+    def write(self, method: str, doc_id: str, data: Optional[Dict[str, Any]]):
+        with self._lock:
+            if method == "delete":
+                self.docs.pop(doc_id, None)
+                return
+            data = {
+                key: datetime.now(timezone.utc) if value is self.SERVER_TIMESTAMP else value
+                for key, value in data.items()
+            }
+            if method == "set":
+                self.docs[doc_id] = data
+            elif doc_id not in self.docs:
+                raise KeyError(f"Documento {doc_id} non trovato")
+            else:
+                self.docs[doc_id].update(data)
+
+    def query(self, fields: Optional[List[str]], after: Optional[tuple], count: Optional[int]) -> List[_Snapshot]:
+        with self._lock:
+            ordered = sorted(
+                ((data.get("created_at") or "", doc_id) for doc_id, data in self.docs.items()), reverse=True
+            )
+            if after is not None:
+                ordered = [key for key in ordered if key < after]
+            return [
+                _Snapshot(doc_id, self._copy(project(self.docs[doc_id], fields))) for _, doc_id in ordered[:count]
+            ]
+
+def install_fake_firestore(store, profile: ServiceProfile = DEFAULT_PROFILES["firestore"]) -> FakeFirestoreClient:
+    """Collega un FirestoreNoteStore al client simulato, senza firebase_admin"""
+    client = FakeFirestoreClient(profile)
+    store._firestore = client
+    store.db = client
+    store.collection = client.collection(NOTES_COLLECTION)
+    return client
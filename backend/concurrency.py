@@ -0,0 +1,58 @@
+"""
+Esecuzione non bloccante delle chiamate ai servizi esterni
+
+Gli SDK di OpenAI, Anthropic, Cloudinary e Firestore sono sincroni: ogni
+chiamata viene eseguita nel thread pool condiviso, così l'event loop resta
+libero di servire le altre richieste. Ogni provider ha un proprio limite di
+concorrenza configurabile tramite variabili d'ambiente.
+"""
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Limiti di concorrenza per provider (chiamate contemporanee massime)
+PROVIDER_LIMITS: Dict[str, int] = {
+    "cloudinary": int(os.getenv('CLOUDINARY_CONCURRENCY', 4)),
+    "whisper": int(os.getenv('WHISPER_CONCURRENCY', 4)),
+    "claude": int(os.getenv('CLAUDE_CONCURRENCY', 4)),
+    "firestore": int(os.getenv('FIRESTORE_CONCURRENCY', 8)),
+}
+
+# Thread pool dimensionato per coprire tutti i provider contemporaneamente
+executor = ThreadPoolExecutor(
+    max_workers=sum(PROVIDER_LIMITS.values()),
+    thread_name_prefix="provider"
+)
+
+# Semafori creati alla prima richiesta (devono appartenere all'event loop attivo)
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def get_semaphore(provider: str) -> asyncio.Semaphore:
+    """Ritorna il semaforo che limita le chiamate contemporanee a un provider"""
+    if provider not in PROVIDER_LIMITS:
+        raise ValueError(f"Provider sconosciuto: {provider}")
+
+    semaphore = _semaphores.get(provider)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PROVIDER_LIMITS[provider])
+        _semaphores[provider] = semaphore
+    return semaphore
+
+async def run_blocking(provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Esegue una chiamata sincrona nel thread pool rispettando il limite del provider
+
+    Args:
+        provider: Nome del provider (cloudinary, whisper, claude, firestore)
+        func: Funzione sincrona da eseguire
+        *args, **kwargs: Argomenti passati alla funzione
+
+    Returns:
+        Il valore ritornato dalla funzione
+    """
+    loop = asyncio.get_running_loop()
+    async with get_semaphore(provider):
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
@@ -2,8 +2,12 @@
 Modulo per calcolare i costi delle API utilizzate
 """
 
-import tiktoken
-from typing import Dict, Tuple
+import os
+import numpy as np
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from audio_probe import probe_duration
 
 # Prezzi delle API (aggiornati a Dicembre 2024)
 PRICING = {
@@ -13,15 +17,24 @@ PRICING = {
     "claude": {
         "claude-opus-4-1-20250805": {
             "input_per_million": 15.00,   # $15 per milione di token input
-            "output_per_million": 75.00   # $75 per milione di token output
+            "output_per_million": 75.00,  # $75 per milione di token output
+            "cache_write_per_million": 18.75,  # Scrittura in prompt cache (1.25x input)
+            "cache_read_per_million": 1.50     # Lettura da prompt cache (0.1x input)
         },
         "claude-3-5-sonnet-20241022": {
             "input_per_million": 3.00,    # $3 per milione di token input
-            "output_per_million": 15.00   # $15 per milione di token output
+            "output_per_million": 15.00,  # $15 per milione di token output
+            "cache_write_per_million": 3.75,
+            "cache_read_per_million": 0.30
         }
     }
 }
 
+DEFAULT_CLAUDE_MODEL = "claude-opus-4-1-20250805"
+
+# Conversione approssimativa USD->EUR
+USD_TO_EUR = 0.92
+
 def estimate_audio_duration(file_size_bytes: int, format: str = "mp3") -> float:
     """
     Stima la durata dell'audio in minuti basandosi sulla dimensione del file
@@ -57,6 +70,36 @@ def estimate_audio_duration(file_size_bytes: int, format: str = "mp3") -> float:
     
     return duration_minutes
 
+@lru_cache(maxsize=None)
+def get_encoding(name: str):
+    """Encoder tiktoken, costruito una sola volta per nome (import al primo uso)"""
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+@lru_cache(maxsize=32)
+def count_template_tokens(prompt_template: str) -> int:
+    """Token della parte fissa di un template (calcolati una volta per template)"""
+    return count_tokens(prompt_template.replace("{transcription}", ""))
+
+def get_audio_duration_minutes(audio_path: str) -> float:
+    """
+    Durata dell'audio in minuti letta dalle intestazioni del file
+    
+    Usa la stima dal bitrate solo se il formato non è riconosciuto.
+    
+    Args:
+        audio_path: Percorso del file audio
+    
+    Returns:
+        Durata in minuti
+    """
+    duration_seconds = probe_duration(audio_path)
+    if duration_seconds is not None:
+        return duration_seconds / 60
+    
+    extension = os.path.splitext(audio_path)[1].lstrip('.')
+    return estimate_audio_duration(os.path.getsize(audio_path), extension)
+
 def count_tokens(text: str, model: str = "cl100k_base") -> int:
     """
     Conta i token in un testo usando tiktoken
@@ -69,7 +112,7 @@ def count_tokens(text: str, model: str = "cl100k_base") -> int:
         Numero di token
     """
     try:
-        encoding = tiktoken.get_encoding(model)
+        encoding = get_encoding(model)
         return len(encoding.encode(text))
     except Exception:
         # Fallback: stima approssimativa (1 token ≈ 4 caratteri)
@@ -107,21 +150,49 @@ def calculate_claude_cost(
     input_tokens = count_tokens(input_text)
     output_tokens = count_tokens(output_text)
     
+    return calculate_claude_cost_from_tokens(input_tokens, output_tokens, model)
+
+def calculate_claude_cost_from_tokens(
+    input_tokens: int,
+    output_tokens: int,
+    model: str = DEFAULT_CLAUDE_MODEL,
+    cache_creation_input_tokens: int = 0,
+    cache_read_input_tokens: int = 0
+) -> Tuple[float, Dict[str, int]]:
+    """
+    Calcola il costo di Claude a partire dai token effettivi
+    
+    Args:
+        input_tokens: Token di input non in cache
+        output_tokens: Token generati
+        model: Modello Claude utilizzato
+        cache_creation_input_tokens: Token scritti nella prompt cache
+        cache_read_input_tokens: Token letti dalla prompt cache
+    
+    Returns:
+        Tupla (costo_totale, dizionario_dettagli)
+    """
     # Ottieni prezzi per il modello
     if model not in PRICING["claude"]:
         # Se modello non riconosciuto, usa Opus come default
-        model = "claude-opus-4-1-20250805"
+        model = DEFAULT_CLAUDE_MODEL
     
     model_pricing = PRICING["claude"][model]
     
-    # Calcola costi
-    input_cost = (input_tokens / 1_000_000) * model_pricing["input_per_million"]
+    # Calcola costi (i token in cache hanno prezzi dedicati)
+    input_cost = (
+        input_tokens * model_pricing["input_per_million"]
+        + cache_creation_input_tokens * model_pricing["cache_write_per_million"]
+        + cache_read_input_tokens * model_pricing["cache_read_per_million"]
+    ) / 1_000_000
     output_cost = (output_tokens / 1_000_000) * model_pricing["output_per_million"]
     total_cost = input_cost + output_cost
     
     return total_cost, {
         "input_tokens": input_tokens,
         "output_tokens": output_tokens,
+        "cache_creation_input_tokens": cache_creation_input_tokens,
+        "cache_read_input_tokens": cache_read_input_tokens,
         "input_cost": input_cost,
         "output_cost": output_cost,
         "total_cost": total_cost,
@@ -151,13 +222,15 @@ def calculate_total_cost(
     # Costo Whisper
     whisper_cost = calculate_whisper_cost(audio_duration_minutes)
     
-    # Costruisci input completo per Claude (prompt + trascrizione)
-    claude_input = prompt_template.format(transcription=transcription_text)
+    # Token di input: parte fissa del template (in cache) + trascrizione,
+    # senza ricostruire ogni volta il prompt completo
+    input_tokens = count_template_tokens(prompt_template) + count_tokens(transcription_text)
+    output_tokens = count_tokens(processed_text)
     
     # Costo Claude
-    claude_cost, claude_details = calculate_claude_cost(
-        claude_input, 
-        processed_text,
+    claude_cost, claude_details = calculate_claude_cost_from_tokens(
+        input_tokens,
+        output_tokens,
         claude_model
     )
     
@@ -178,9 +251,109 @@ def calculate_total_cost(
             "total_cost_usd": round(claude_cost, 4)
         },
         "total_cost_usd": round(total_cost, 4),
-        "total_cost_eur": round(total_cost * 0.92, 4)  # Conversione approssimativa USD->EUR
+        "total_cost_eur": round(total_cost * USD_TO_EUR, 4)
     }
 
+def calculate_cost_from_usage(
+    audio_duration_minutes: float,
+    usage: Dict[str, int],
+    claude_model: str = DEFAULT_CLAUDE_MODEL,
+    whisper_minutes: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Calcola il costo di una nota dai token riportati dall'API Anthropic
+    
+    Args:
+        audio_duration_minutes: Durata reale dell'audio in minuti
+        usage: Campo usage della risposta Claude (input/output e token in cache)
+        claude_model: Modello Claude utilizzato
+        whisper_minutes: Minuti inviati a Whisper, se diversi dalla durata (silenzi rimossi)
+    
+    Returns:
+        Dizionario con breakdown dei costi (stesso formato di calculate_total_cost)
+    """
+    return recompute_costs([{
+        "audio_duration_minutes": audio_duration_minutes,
+        "whisper_minutes": whisper_minutes,
+        "claude_usage": usage,
+        "model": claude_model
+    }])[0]
+
+def recompute_costs(notes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Ricalcola in blocco i costi di molte note con i prezzi attuali di PRICING
+    
+    Il calcolo è vettorizzato con NumPy: utile quando cambiano i prezzi e
+    bisogna aggiornare tutte le note salvate.
+    
+    Args:
+        notes: Dizionari con audio_duration_minutes (o whisper_minutes, i minuti
+               fatturati se diversi), claude_usage (input_tokens, output_tokens,
+               cache_*_input_tokens) e model
+    
+    Returns:
+        Lista di dizionari cost_data, nello stesso ordine delle note
+    """
+    if not notes:
+        return []
+    
+    models = [n.get("model") if n.get("model") in PRICING["claude"] else DEFAULT_CLAUDE_MODEL for n in notes]
+    usages = [n.get("claude_usage") or {} for n in notes]
+    
+    minutes = np.array([
+        n["whisper_minutes"] if n.get("whisper_minutes") is not None else n.get("audio_duration_minutes") or 0.0
+        for n in notes
+    ], dtype=np.float64)
+    tokens = np.array([
+        [u.get("input_tokens", 0), u.get("output_tokens", 0),
+         u.get("cache_creation_input_tokens", 0), u.get("cache_read_input_tokens", 0)]
+        for u in usages
+    ], dtype=np.float64)
+    prices = np.array([
+        [PRICING["claude"][m]["input_per_million"], PRICING["claude"][m]["output_per_million"],
+         PRICING["claude"][m]["cache_write_per_million"], PRICING["claude"][m]["cache_read_per_million"]]
+        for m in models
+    ], dtype=np.float64) / 1_000_000
+    
+    costs = tokens * prices
+    input_cost = costs[:, 0] + costs[:, 2] + costs[:, 3]
+    output_cost = costs[:, 1]
+    claude_cost = input_cost + output_cost
+    whisper_cost = minutes * PRICING["whisper"]["per_minute"]
+    total_cost = whisper_cost + claude_cost
+    
+    # Arrotondamenti vettorizzati, poi conversione a tipi Python per il JSON
+    minutes_r = np.round(minutes, 2).tolist()
+    whisper_r = np.round(whisper_cost, 4).tolist()
+    input_r = np.round(input_cost, 4).tolist()
+    output_r = np.round(output_cost, 4).tolist()
+    claude_r = np.round(claude_cost, 4).tolist()
+    total_r = np.round(total_cost, 4).tolist()
+    total_eur_r = np.round(total_cost * USD_TO_EUR, 4).tolist()
+    token_counts = tokens.astype(np.int64).tolist()
+    
+    return [
+        {
+            "whisper": {
+                "duration_minutes": minutes_r[i],
+                "cost_usd": whisper_r[i]
+            },
+            "claude": {
+                "model": models[i],
+                "input_tokens": token_counts[i][0],
+                "output_tokens": token_counts[i][1],
+                "cache_creation_input_tokens": token_counts[i][2],
+                "cache_read_input_tokens": token_counts[i][3],
+                "input_cost_usd": input_r[i],
+                "output_cost_usd": output_r[i],
+                "total_cost_usd": claude_r[i]
+            },
+            "total_cost_usd": total_r[i],
+            "total_cost_eur": total_eur_r[i]
+        }
+        for i in range(len(notes))
+    ]
+
 def format_cost_summary(cost_data: Dict[str, any]) -> str:
     """
     Formatta un riassunto leggibile dei costi
@@ -0,0 +1,254 @@
+"""
+Coda persistente di trascrizioni elaborate in background
+
+I job vengono salvati in SQLite insieme al percorso dell'audio e allo stato
+raggiunto dalla pipeline. Ogni stage completato viene registrato come
+checkpoint: se il processo si riavvia, i job interrotti ripartono dall'ultimo
+stage completato senza ripagare le chiamate già eseguite.
+
+Un job fallito torna in coda con un'attesa (not_before) che cresce a ogni
+tentativo, con lo stesso backoff esponenziale con jitter delle chiamate ai
+provider: un guasto del provider non consuma tutti i tentativi in pochi
+secondi.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from provider_calls import CallPolicy, backoff_delay
+from settings import DATA_DIR
+
+# Percorsi di default
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', os.path.join(DATA_DIR, 'jobs.sqlite3'))
+JOBS_AUDIO_DIR = os.getenv('JOBS_AUDIO_DIR', os.path.join(DATA_DIR, 'job_audio'))
+
+# Worker in parallelo e tentativi massimi per job
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+MAX_JOB_ATTEMPTS = int(os.getenv('MAX_JOB_ATTEMPTS', 3))
+
+# Attesa prima di riprovare un job fallito (secondi): base raddoppiata a ogni tentativo, fino al massimo
+JOB_RETRY_POLICY = CallPolicy(
+    deadline=0,
+    attempts=MAX_JOB_ATTEMPTS,
+    backoff_base=float(os.getenv('JOB_RETRY_BASE_SECONDS', 30)),
+    backoff_max=float(os.getenv('JOB_RETRY_MAX_SECONDS', 600)),
+    hedge=False
+)
+
+# Intervallo massimo tra due controlli della coda (secondi)
+POLL_INTERVAL = 5.0
+
+Checkpoint = Callable[[str, Dict[str, Any]], Awaitable[None]]
+JobRunner = Callable[[Dict[str, Any], Checkpoint], Awaitable[Dict[str, Any]]]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    prompt_type TEXT NOT NULL,
+    audio_path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+class JobQueue:
+    """
+    Coda di job su SQLite con un pool di worker asyncio
+
+    Il runner riceve il job (con lo stato dei checkpoint già salvati) e una
+    coroutine checkpoint(stage, dati) da chiamare al termine di ogni stage.
+    Il runner è responsabile del file audio una volta completato il job e
+    può sostituirlo (es. con la versione normalizzata) salvando il nuovo
+    percorso nello stato come audio_path.
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        db_path: str = JOBS_DB_PATH,
+        audio_dir: str = JOBS_AUDIO_DIR,
+        workers: int = JOB_WORKERS,
+        max_attempts: int = MAX_JOB_ATTEMPTS
+    ):
+        self.runner = runner
+        self.db_path = db_path
+        self.audio_dir = audio_dir
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            os.makedirs(self.audio_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            # Database creati prima dell'attesa tra i tentativi
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "not_before" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    async def _run(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Prende il job in coda più vecchio, tra quelli senza attesa in corso, marcandolo come in esecuzione"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY created_at LIMIT 1",
+                    (time.time(),)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (datetime.now().isoformat(), row["id"])
+                    )
+                    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                conn.execute("COMMIT")
+                return row
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def enqueue(
+        self,
+        audio_path: str,
+        filename: str,
+        prompt_type: str,
+        state: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Inserisce un job in coda (con uno stato iniziale opzionale) e ritorna il suo id"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        await self._run(
+            "INSERT INTO jobs (id, status, stage, filename, prompt_type, audio_path, state, created_at, updated_at) "
+            "VALUES (?, 'queued', 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, prompt_type, audio_path, json.dumps(state or {}), now, now)
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Stato pubblico di un job (senza percorsi locali)"""
+        rows = await self._run("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "filename": row["filename"],
+            "prompt_type": row["prompt_type"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "retry_at": (
+                datetime.fromtimestamp(row["not_before"]).isoformat()
+                if row["status"] == "queued" and row["not_before"] > time.time() else None
+            ),
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+
+    async def _checkpoint(self, job_id: str, state: Dict[str, Any], stage: str, data: Dict[str, Any]):
+        state.update(data)
+        await self._run(
+            "UPDATE jobs SET stage = ?, state = ?, updated_at = ? WHERE id = ?",
+            (stage, json.dumps(state), datetime.now().isoformat(), job_id)
+        )
+
+    async def _process(self, row: sqlite3.Row):
+        job = dict(row)
+        job_id = job["id"]
+        state = json.loads(job["state"])
+        job["state"] = state
+
+        async def checkpoint(stage: str, data: Dict[str, Any]):
+            await self._checkpoint(job_id, state, stage, data)
+
+        try:
+            result = await self.runner(job, checkpoint)
+        except Exception as e:
+            status = "queued" if job["attempts"] < self.max_attempts else "failed"
+            # Rispetta l'attesa suggerita da RateLimited, ProviderUnavailable e QueueFull
+            delay = backoff_delay(job["attempts"], JOB_RETRY_POLICY, getattr(e, "retry_after", None))
+            retry = f", nuovo tentativo tra {delay:.0f}s" if status == "queued" else ""
+            print(f"Errore nel job {job_id} (tentativo {job['attempts']}{retry}): {str(e)}")
+            await self._run(
+                "UPDATE jobs SET status = ?, error = ?, not_before = ?, updated_at = ? WHERE id = ?",
+                (status, getattr(e, "detail", str(e)), time.time() + delay, datetime.now().isoformat(), job_id)
+            )
+            if status == "failed":
+                for path in {job["audio_path"], state.get("audio_path")}:
+                    if path and os.path.exists(path):
+                        os.unlink(path)
+            return
+
+        await self._run(
+            "UPDATE jobs SET status = 'completed', stage = 'completed', result = ?, error = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (json.dumps(result), datetime.now().isoformat(), job_id)
+        )
+
+    async def _worker(self):
+        while True:
+            # Azzerato prima del controllo, così un job inserito nel frattempo non va perso
+            self._wakeup.clear()
+            row = await asyncio.to_thread(self._claim_next)
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(row)
+
+    async def start(self):
+        """Recupera i job interrotti da un riavvio e avvia i worker"""
+        self._wakeup = asyncio.Event()
+        recovered = await self._run(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running' RETURNING id",
+            (datetime.now().isoformat(),)
+        )
+        if recovered:
+            print(f"Ripresi {len(recovered)} job interrotti")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Ferma i worker; i job in corso verranno ripresi al prossimo avvio"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,227 @@
+"""
+Metriche Prometheus e tempi per stage della pipeline
+
+Ogni stage di una trascrizione (upload, normalizzazione, Cloudinary,
+Whisper, Claude) e ogni operazione dell'archivio delle note viene eseguito
+dentro span(stage), che registra:
+
+- la durata in un istogramma per stage;
+- quante esecuzioni dello stage sono in corso;
+- gli errori per stage e tipo di eccezione.
+
+Le metriche sono esposte in formato testo Prometheus da GET /metrics (solo
+con METRICS_TOKEN), insieme a durata e richieste in corso per route HTTP
+(MetricsMiddleware).
+
+Una richiesta che chiama collect_timings() raccoglie anche i propri tempi
+per stage in un dizionario (in millisecondi), salvato con la nota: lo span
+lo trova attraverso una ContextVar, quindi i task creati durante la
+richiesta (es. l'archiviazione in parallelo) scrivono nello stesso
+dizionario senza passarlo a ogni funzione.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Token richiesto da /metrics (Authorization: Bearer ...); se assente l'endpoint è disattivato
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limiti superiori dei bucket (secondi): da letture in cache a trascrizioni lunghe
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+INF_BUCKET = 'le="+Inf"'
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+registry: List["Metric"] = []
+
+class Metric:
+    """Famiglia di serie con le stesse etichette"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (), register: bool = True):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        # Le metriche calcolate al momento della lettura non vanno nel registro
+        if register:
+            registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return self.header() + [
+                f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(self._values.items())
+            ]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str):
+        self.inc(*labels, amount=-1)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Conteggi per bucket (non cumulativi), somma, numero di osservazioni
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, INF_BUCKET)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds", "Durata degli stage della pipeline e delle operazioni sull'archivio",
+    ("stage",)
+)
+STAGE_IN_FLIGHT = Gauge("pipeline_stage_in_flight", "Esecuzioni in corso per stage", ("stage",))
+STAGE_ERRORS = Counter("pipeline_stage_errors_total", "Errori per stage e tipo di eccezione", ("stage", "error"))
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Durata delle richieste HTTP, risposta in streaming compresa",
+    ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Richieste HTTP in corso")
+
+# Tempi per stage della richiesta corrente (ms), se raccolti
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+
+def collect_timings() -> Dict[str, float]:
+    """Inizia a raccogliere i tempi per stage nel contesto corrente e ritorna il dizionario"""
+    timings: Dict[str, float] = {}
+    _timings.set(timings)
+    return timings
+
+def error_name(exc: BaseException) -> str:
+    if isinstance(exc, HTTPException):
+        return f"http_{exc.status_code}"
+    return type(exc).__name__
+
+@contextmanager
+def span(stage: str):
+    """Misura uno stage: istogramma, esecuzioni in corso, errori e tempi della richiesta"""
+    STAGE_IN_FLIGHT.inc(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Le cancellazioni (CancelledError) non sono errori dello stage
+        STAGE_ERRORS.inc(stage, error_name(e))
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_IN_FLIGHT.dec(stage)
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 1)
+
+def timed(stage: str) -> Callable:
+    """Decoratore: esegue la coroutine dentro span(stage)"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def render(extra: Optional[List[Metric]] = None) -> str:
+    """Tutte le metriche in formato testo Prometheus"""
+    lines: List[str] = []
+    for metric in registry + (extra or []):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """Middleware ASGI: durata e richieste in corso per route (il template, non il percorso)"""
+
+    def __init__(self, app, exclude_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # La route viene aggiunta allo scope dal router; i 404 non ne hanno
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - started, scope["method"], route, str(status))
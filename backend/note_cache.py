@@ -0,0 +1,127 @@
+"""
+Cache in memoria delle risposte di lettura delle note
+
+Le note cambiano di rado, mentre lista e dettaglio vengono letti a ogni
+apertura dell'app: le risposte già serializzate restano in un LRU con
+scadenza (TTL), insieme al loro ETag. Le scritture invalidano solo le voci
+interessate, e una richiesta con If-None-Match uguale all'ETag in cache
+riceve un 304 senza alcuna lettura su Firestore.
+
+Il TTL limita quanto a lungo un'altra istanza del backend può servire dati
+non aggiornati, dato che le invalidazioni valgono solo per questo processo.
+"""
+
+import os
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, NamedTuple, Optional
+
+from serialization import compress, encode_json
+
+# Durata delle voci (secondi) e numero massimo di risposte mantenute
+NOTE_CACHE_TTL = float(os.getenv('NOTE_CACHE_TTL', 300))
+NOTE_CACHE_MAX_ENTRIES = int(os.getenv('NOTE_CACHE_MAX_ENTRIES', 512))
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+    note_ids: FrozenSet[str]
+    expires_at: float
+    # Corpi compressi per codifica, calcolati alla prima richiesta
+    encoded: Dict[str, bytes]
+
+def encoded_body(entry: CachedBody, encoding: str) -> bytes:
+    """Corpo della voce compresso con encoding (una sola volta per voce)"""
+    body = entry.encoded.get(encoding)
+    if body is None:
+        body = entry.encoded[encoding] = compress(entry.body, encoding)
+    return body
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto debole tra l'header If-None-Match e l'ETag della risposta"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+class NoteCache:
+    """
+    LRU con TTL di risposte serializzate, indicizzate per chiave
+
+    Ogni voce ricorda le note che contiene, così la modifica di una nota
+    invalida solo il suo dettaglio e le pagine della lista in cui compare.
+    Le letture confrontano la generazione corrente con quella di inizio
+    lettura: una risposta letta prima di un'invalidazione non viene salvata.
+    """
+
+    def __init__(self, ttl: float = NOTE_CACHE_TTL, max_entries: int = NOTE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(
+        self,
+        key: Hashable,
+        payload: Dict[str, Any],
+        note_ids: Iterable[str],
+        generation: int
+    ) -> CachedBody:
+        """Serializza la risposta e la salva se nessuna invalidazione è avvenuta da generation"""
+        body = encode_json(payload)
+        entry = CachedBody(body, compute_etag(body), frozenset(note_ids), time.monotonic() + self.ttl, {})
+        if generation == self.generation and self.ttl > 0:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _drop(self, predicate):
+        self.generation += 1
+        for key in [k for k, entry in self._entries.items() if predicate(k, entry)]:
+            del self._entries[key]
+
+    def invalidate_note(self, note_id: str):
+        """Rimuove il dettaglio della nota e le pagine della lista che la contengono"""
+        self._drop(lambda key, entry: note_id in entry.note_ids)
+
+    def invalidate_first_pages(self):
+        """
+        Rimuove le prime pagine della lista (dopo la creazione di una nota)
+
+        Le pagine successive partono da un cursore fisso e non cambiano
+        quando una nota più recente viene aggiunta in testa.
+        """
+        self._drop(lambda key, entry: key[0] == "notes" and key[2] is None)
+
+    def clear(self):
+        self._drop(lambda key, entry: True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries)
+        }
@@ -0,0 +1,403 @@
+"""
+Archivio delle note con backend intercambiabili
+
+L'API legge e scrive le note solo attraverso NoteStore. In produzione il
+backend è Firestore; con NOTE_STORE=sqlite le note vivono in un database
+SQLite locale (WAL), così l'API può girare, essere profilata e sottoposta a
+test di carico senza un progetto Firebase, e le installazioni piccole
+evitano del tutto i round-trip di rete.
+
+Le note sono dict con gli stessi campi in entrambi i backend; i metodi che
+ritornano note aggiungono la chiave "id". Ogni operazione è misurata come
+stage "store.<metodo>" (vedi metrics.py).
+"""
+
+import os
+import json
+import uuid
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from concurrency import run_blocking
+from metrics import timed
+from settings import DATA_DIR
+
+# Backend scelto all'avvio: "firestore" (default) oppure "sqlite"
+NOTE_STORE = os.getenv('NOTE_STORE', 'firestore')
+NOTES_DB_PATH = os.getenv('NOTES_DB_PATH', os.path.join(DATA_DIR, 'notes.sqlite3'))
+
+NOTES_COLLECTION = 'notes'
+
+# Operazioni massime per batch di scrittura Firestore
+FIRESTORE_BATCH_LIMIT = 500
+
+# Posizione dopo cui riprendere una lista: (created_at, id)
+Cursor = Tuple[Any, str]
+
+def project(data: Dict[str, Any], fields: Optional[Iterable[str]]) -> Dict[str, Any]:
+    """Copia solo i campi indicati, con percorsi puntati per i campi annidati"""
+    if fields is None:
+        return dict(data)
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        parts = field.split('.')
+        value: Any = data
+        for part in parts:
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+    return projected
+
+class NoteStore:
+    """Interfaccia comune ai backend delle note"""
+
+    async def connect(self):
+        """Prepara le connessioni del backend (chiamato anche dai metodi al primo uso)"""
+
+    async def add(self, data: Dict[str, Any]) -> str:
+        """Salva una nuova nota e ritorna il suo id"""
+        raise NotImplementedError
+
+    async def add_many(self, notes: List[Dict[str, Any]]) -> List[str]:
+        """Salva più note con una sola scrittura e ritorna i loro id"""
+        raise NotImplementedError
+
+    async def get(self, note_id: str) -> Optional[Dict[str, Any]]:
+        """Nota completa, oppure None se non esiste"""
+        raise NotImplementedError
+
+    async def get_many(self, note_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Note esistenti tra quelle richieste, indicizzate per id"""
+        raise NotImplementedError
+
+    async def update(self, note_id: str, data: Dict[str, Any]):
+        """Aggiorna i campi di primo livello indicati"""
+        raise NotImplementedError
+
+    async def update_many(self, updates: Dict[str, Dict[str, Any]]):
+        """Aggiorna più note con scritture raggruppate"""
+        raise NotImplementedError
+
+    async def delete(self, note_id: str):
+        raise NotImplementedError
+
+    async def delete_many(self, note_ids: List[str]):
+        """Elimina più note con scritture raggruppate"""
+        raise NotImplementedError
+
+    async def list_page(
+        self,
+        fields: Optional[List[str]],
+        limit: int,
+        after: Optional[Cursor] = None
+    ) -> List[Dict[str, Any]]:
+        """Note dalla più recente (created_at, poi id, decrescenti), dopo il cursore"""
+        raise NotImplementedError
+
+    async def list_all(self, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Tutte le note, con i soli campi richiesti"""
+        raise NotImplementedError
+
+class FirestoreNoteStore(NoteStore):
+    """
+    Note nella collezione 'notes' di Firestore
+
+    firebase_admin viene importato e il client creato alla prima operazione,
+    in un thread del pool: l'import del modulo e l'avvio dell'app restano
+    veloci anche quando Firestore non serve subito.
+    """
+
+    def __init__(self, service_account: Optional[str] = None):
+        self._service_account = service_account
+        self._connect_lock = threading.Lock()
+        self._firestore = None
+        self.db = None
+        self.collection = None
+
+    def _connect(self):
+        with self._connect_lock:
+            if self.collection is not None:
+                return
+            import firebase_admin
+            from firebase_admin import credentials, firestore
+
+            try:
+                firebase_admin.get_app()
+            except ValueError:
+                service_account = self._service_account or os.getenv('FIREBASE_SERVICE_ACCOUNT')
+                firebase_admin.initialize_app(credentials.Certificate(json.loads(service_account)))
+            self._firestore = firestore
+            self.db = firestore.client()
+            self.collection = self.db.collection(NOTES_COLLECTION)
+
+    async def connect(self):
+        if self.collection is None:
+            await run_blocking("firestore", self._connect)
+
+    @staticmethod
+    def _to_note(doc) -> Dict[str, Any]:
+        note = doc.to_dict()
+        note['id'] = doc.id
+        return note
+
+    async def _commit_in_batches(self, operations: List[Tuple[str, Any, Optional[Dict[str, Any]]]]):
+        for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT):
+            batch = self.db.batch()
+            for method, ref, data in operations[start:start + FIRESTORE_BATCH_LIMIT]:
+                if method == 'delete':
+                    batch.delete(ref)
+                else:
+                    getattr(batch, method)(ref, data)
+            await run_blocking("firestore", batch.commit)
+
+    @timed("store.add")
+    async def add(self, data: Dict[str, Any]) -> str:
+        await self.connect()
+        _, doc_ref = await run_blocking(
+            "firestore", self.collection.add, {**data, "timestamp": self._firestore.SERVER_TIMESTAMP}
+        )
+        return doc_ref.id
+
+    @timed("store.add_many")
+    async def add_many(self, notes: List[Dict[str, Any]]) -> List[str]:
+        await self.connect()
+        refs = [self.collection.document() for _ in notes]
+        await self._commit_in_batches([
+            ('set', ref, {**data, "timestamp": self._firestore.SERVER_TIMESTAMP})
+            for ref, data in zip(refs, notes)
+        ])
+        return [ref.id for ref in refs]
+
+    @timed("store.get")
+    async def get(self, note_id: str) -> Optional[Dict[str, Any]]:
+        await self.connect()
+        doc = await run_blocking("firestore", self.collection.document(note_id).get)
+        return self._to_note(doc) if doc.exists else None
+
+    @timed("store.get_many")
+    async def get_many(self, note_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        await self.connect()
+        refs = [self.collection.document(note_id) for note_id in note_ids]
+        docs = await run_blocking("firestore", lambda: list(self.db.get_all(refs, field_paths=fields)))
+        return {doc.id: self._to_note(doc) for doc in docs if doc.exists}
+
+    @timed("store.update")
+    async def update(self, note_id: str, data: Dict[str, Any]):
+        await self.connect()
+        await run_blocking("firestore", self.collection.document(note_id).update, data)
+
+    @timed("store.update_many")
+    async def update_many(self, updates: Dict[str, Dict[str, Any]]):
+        await self.connect()
+        await self._commit_in_batches([
+            ('update', self.collection.document(note_id), data) for note_id, data in updates.items()
+        ])
+
+    @timed("store.delete")
+    async def delete(self, note_id: str):
+        await self.connect()
+        await run_blocking("firestore", self.collection.document(note_id).delete)
+
+    @timed("store.delete_many")
+    async def delete_many(self, note_ids: List[str]):
+        await self.connect()
+        await self._commit_in_batches([('delete', self.collection.document(note_id), None) for note_id in note_ids])
+
+    @timed("store.list_page")
+    async def list_page(
+        self,
+        fields: Optional[List[str]],
+        limit: int,
+        after: Optional[Cursor] = None
+    ) -> List[Dict[str, Any]]:
+        await self.connect()
+        # id del documento come spareggio tra note con lo stesso created_at
+        Query = self._firestore.Query
+        query = self.collection.select(fields) if fields is not None else self.collection
+        query = (
+            query
+            .order_by('created_at', direction=Query.DESCENDING)
+            .order_by('__name__', direction=Query.DESCENDING)
+        )
+        if after is not None:
+            created_at, doc_id = after
+            query = query.start_after({'created_at': created_at, '__name__': self.collection.document(doc_id)})
+        docs = await run_blocking("firestore", lambda: list(query.limit(limit).stream()))
+        return [self._to_note(doc) for doc in docs]
+
+    @timed("store.list_all")
+    async def list_all(self, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        await self.connect()
+        query = self.collection.select(fields) if fields is not None else self.collection
+        docs = await run_blocking("firestore", lambda: list(query.stream()))
+        return [self._to_note(doc) for doc in docs]
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_created ON notes (created_at DESC, id DESC);
+"""
+
+class SQLiteNoteStore(NoteStore):
+    """
+    Note in un database SQLite locale
+
+    Il documento è salvato come JSON, con created_at in una colonna
+    indicizzata per l'ordinamento e la paginazione. Le scritture multiple
+    avvengono in un'unica transazione.
+    """
+
+    def __init__(self, db_path: str = NOTES_DB_PATH):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SQLITE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def _transaction(self, statements: List[Tuple[str, tuple]]):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _update_rows(self, updates: Dict[str, Dict[str, Any]]):
+        # Lettura e scrittura nella stessa transazione per non perdere aggiornamenti concorrenti
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for note_id, data in updates.items():
+                    row = conn.execute("SELECT data FROM notes WHERE id = ?", (note_id,)).fetchone()
+                    if row is None:
+                        continue
+                    note = json.loads(row[0])
+                    note.update(data)
+                    conn.execute(
+                        "UPDATE notes SET data = ?, created_at = ? WHERE id = ?",
+                        (json.dumps(note), note.get('created_at', ''), note_id)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _to_note(row, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        note = project(json.loads(row[1]), fields)
+        note['id'] = row[0]
+        return note
+
+    @staticmethod
+    def _insert(data: Dict[str, Any]) -> Tuple[str, Tuple[str, tuple]]:
+        note_id = uuid.uuid4().hex
+        note = {**data, "timestamp": datetime.now().isoformat()}
+        return note_id, (
+            "INSERT INTO notes (id, created_at, data) VALUES (?, ?, ?)",
+            (note_id, note.get('created_at', ''), json.dumps(note))
+        )
+
+    @timed("store.add")
+    async def add(self, data: Dict[str, Any]) -> str:
+        return (await self._add_rows([data]))[0]
+
+    @timed("store.add_many")
+    async def add_many(self, notes: List[Dict[str, Any]]) -> List[str]:
+        return await self._add_rows(notes)
+
+    async def _add_rows(self, notes: List[Dict[str, Any]]) -> List[str]:
+        inserts = [self._insert(data) for data in notes]
+        await asyncio.to_thread(self._transaction, [statement for _, statement in inserts])
+        return [note_id for note_id, _ in inserts]
+
+    @timed("store.get")
+    async def get(self, note_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._execute, "SELECT id, data FROM notes WHERE id = ?", (note_id,))
+        return self._to_note(rows[0]) if rows else None
+
+    @timed("store.get_many")
+    async def get_many(self, note_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        if not note_ids:
+            return {}
+        placeholders = ",".join("?" * len(note_ids))
+        rows = await asyncio.to_thread(
+            self._execute, f"SELECT id, data FROM notes WHERE id IN ({placeholders})", tuple(note_ids)
+        )
+        return {row[0]: self._to_note(row, fields) for row in rows}
+
+    @timed("store.update")
+    async def update(self, note_id: str, data: Dict[str, Any]):
+        await asyncio.to_thread(self._update_rows, {note_id: data})
+
+    @timed("store.update_many")
+    async def update_many(self, updates: Dict[str, Dict[str, Any]]):
+        await asyncio.to_thread(self._update_rows, updates)
+
+    @timed("store.delete")
+    async def delete(self, note_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM notes WHERE id = ?", (note_id,))
+
+    @timed("store.delete_many")
+    async def delete_many(self, note_ids: List[str]):
+        await asyncio.to_thread(
+            self._transaction, [("DELETE FROM notes WHERE id = ?", (note_id,)) for note_id in note_ids]
+        )
+
+    @timed("store.list_page")
+    async def list_page(
+        self,
+        fields: Optional[List[str]],
+        limit: int,
+        after: Optional[Cursor] = None
+    ) -> List[Dict[str, Any]]:
+        if after is None:
+            sql, params = "SELECT id, data FROM notes ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)
+        else:
+            sql = (
+                "SELECT id, data FROM notes WHERE (created_at, id) < (?, ?) "
+                "ORDER BY created_at DESC, id DESC LIMIT ?"
+            )
+            params = (after[0], after[1], limit)
+        rows = await asyncio.to_thread(self._execute, sql, params)
+        return [self._to_note(row, fields) for row in rows]
+
+    @timed("store.list_all")
+    async def list_all(self, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._execute, "SELECT id, data FROM notes")
+        return [self._to_note(row, fields) for row in rows]
+
+def create_note_store(backend: str = NOTE_STORE) -> NoteStore:
+    """Istanzia il backend configurato con NOTE_STORE"""
+    if backend == 'firestore':
+        return FirestoreNoteStore()
+    if backend == 'sqlite':
+        return SQLiteNoteStore()
+    raise ValueError(f"NOTE_STORE non valido: {backend} (valori ammessi: firestore, sqlite)")
@@ -0,0 +1,99 @@
+"""
+Profilazione a campionamento delle richieste (opzionale)
+
+Con PROFILE_SAMPLE_RATE > 0 e pyinstrument installato, una frazione delle
+richieste sui percorsi PROFILE_PATHS viene eseguita sotto il profiler a
+campionamento di pyinstrument in modalità async: i tempi passati in await
+vengono attribuiti alla riga che aspetta, non alle altre richieste servite
+nel frattempo dall'event loop. Una richiesta può chiedere di essere
+profilata con l'header X-Profile: 1 (solo se la profilazione è attiva).
+pyinstrument in modalità async non ammette profiler sovrapposti nello
+stesso thread: mentre una richiesta è profilata, le altre non lo sono.
+
+Ogni profilo viene salvato come HTML in PROFILE_DIR, nominato con ora,
+metodo e percorso; restano solo gli ultimi PROFILE_MAX_FILES.
+"""
+
+import os
+import time
+import random
+import asyncio
+from typing import Optional
+
+from settings import DATA_DIR
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # La profilazione resta disattivata
+    Profiler = None
+
+# Frazione delle richieste profilate (0 = disattivata)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 1))
+PROFILE_PATHS = tuple(p.strip() for p in os.getenv('PROFILE_PATHS', '/api/').split(',') if p.strip())
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))
+
+class ProfilerMiddleware:
+    """Middleware ASGI che profila un campione delle richieste"""
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        path_prefixes: tuple = PROFILE_PATHS,
+        output_dir: str = PROFILE_DIR
+    ):
+        self.app = app
+        self.sample_rate = sample_rate if Profiler is not None else 0.0
+        self.path_prefixes = path_prefixes
+        self.output_dir = output_dir
+        self._active = False
+        if sample_rate > 0 and Profiler is None:
+            print("PROFILE_SAMPLE_RATE attivo ma pyinstrument non installato: profilazione disattivata")
+
+    def _sampled(self, scope) -> bool:
+        if self.sample_rate <= 0 or self._active or scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            return False
+        return dict(scope["headers"]).get(b"x-profile") == b"1" or random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self._sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(interval=PROFILE_INTERVAL_MS / 1000, async_mode="enabled")
+        started = time.time()
+        try:
+            profiler.start()
+        except RuntimeError:
+            # Profiler ancora attivo nel contesto (es. task avviato da una richiesta profilata)
+            await self.app(scope, receive, send)
+            return
+        self._active = True
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            self._active = False
+            # Il rendering HTML costa decine di ms: fuori dall'event loop
+            await asyncio.to_thread(self._save, profiler, scope, started)
+
+    def _save(self, profiler, scope, started: float) -> Optional[str]:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(started))
+            route = scope["path"].strip("/").replace("/", "_") or "root"
+            path = os.path.join(self.output_dir, f"{stamp}_{int(started * 1000) % 1000:03d}_{scope['method']}_{route}.html")
+            with open(path, "w") as f:
+                f.write(profiler.output_html())
+            self._prune()
+            return path
+        except Exception as e:
+            print(f"Errore nel salvataggio del profilo: {str(e)}")
+            return None
+
+    def _prune(self):
+        profiles = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".html"))
+        for name in profiles[:-PROFILE_MAX_FILES]:
+            os.unlink(os.path.join(self.output_dir, name))
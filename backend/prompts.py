@@ -6,8 +6,13 @@ Prompt templates per l'elaborazione delle trascrizioni
 WHISPER_PROMPT = """Questa è una nota vocale personale in italiano per un post LinkedIn. 
 Trascrivi accuratamente includendo la punteggiatura appropriata."""
 
+# I prompt per Claude sono divisi in due parti:
+# - SYSTEM: istruzioni fisse, inviate come system prompt (messe in cache da Anthropic
+#   solo oltre CLAUDE_CACHE_MIN_TOKENS token, vedi claude_request)
+# - USER: parte variabile con la trascrizione, diversa a ogni chiamata
+
 # Prompt principale per Claude - trasforma in post LinkedIn
-CLAUDE_LINKEDIN_PROMPT = """Il tuo compito è aiutarmi a scrivere contenuti per LinkedIn in modo più veloce.  
+CLAUDE_LINKEDIN_SYSTEM = """Il tuo compito è aiutarmi a scrivere contenuti per LinkedIn in modo più veloce.  
 Riceverai come input una trascrizione vocale o un testo grezzo, che può essere disordinato, colloquiale e senza formattazione.  
 
 Il tuo obiettivo è trasformarlo in un post LinkedIn ben scritto, scorrevole e fedele al mio stile.  
@@ -32,36 +37,45 @@ Il valore, i pensieri e le riflessioni devono restare miei: tu fai solo editing,
 - Non scrivere in stile troppo “pubblicitario” o artificiale.  
 - Non rendere il post telegrafico: deve sembrare un flusso naturale di pensiero.  
 
-Risultato atteso: un post LinkedIn curato, leggibile e pronto alla pubblicazione, che conserva la mia voce e le mie opinioni ma in una forma chiara ed efficace.
-
+Risultato atteso: un post LinkedIn curato, leggibile e pronto alla pubblicazione, che conserva la mia voce e le mie opinioni ma in una forma chiara ed efficace."""
 
-### Trascrizione da elaborare:
+CLAUDE_LINKEDIN_USER = """### Trascrizione da elaborare:
 
 {transcription}
 
 ### Output:
 Risultato atteso: un post LinkedIn curato, leggibile e pronto alla pubblicazione, che conserva la mia voce e le mie opinioni ma in una forma chiara ed efficace. Il post deve essere tra i 2000 e i 3000 caratteri"""
 
+CLAUDE_LINKEDIN_PROMPT = CLAUDE_LINKEDIN_SYSTEM + "\n\n\n" + CLAUDE_LINKEDIN_USER
+
 # Prompt alternativo per note generali (non LinkedIn)
-CLAUDE_GENERAL_PROMPT = """Sei un assistente intelligente che analizza trascrizioni di note vocali.
+CLAUDE_GENERAL_SYSTEM = """Sei un assistente intelligente che analizza trascrizioni di note vocali.
 Il tuo compito è:
 1. Correggere eventuali errori di trascrizione
 2. Strutturare il contenuto in modo chiaro e organizzato
 3. Identificare punti chiave e azioni da intraprendere
-4. Fornire un riassunto conciso alla fine
+4. Fornire un riassunto conciso alla fine"""
 
-Trascrizione da analizzare:
+CLAUDE_GENERAL_USER = """Trascrizione da analizzare:
 
 {transcription}
 
 Per favore, elabora questa nota vocale e restituisci una versione migliorata e strutturata."""
 
+CLAUDE_GENERAL_PROMPT = CLAUDE_GENERAL_SYSTEM + "\n\n" + CLAUDE_GENERAL_USER
+
 # Dizionario per selezionare il prompt in base al tipo
 PROMPTS = {
     "linkedin": CLAUDE_LINKEDIN_PROMPT,
     "general": CLAUDE_GENERAL_PROMPT
 }
 
+# Parti (system, user) per le chiamate con prompt caching
+PROMPT_PARTS = {
+    "linkedin": (CLAUDE_LINKEDIN_SYSTEM, CLAUDE_LINKEDIN_USER),
+    "general": (CLAUDE_GENERAL_SYSTEM, CLAUDE_GENERAL_USER)
+}
+
 def get_prompt(prompt_type="linkedin"):
     """
     Restituisce il prompt appropriato in base al tipo richiesto
@@ -72,4 +86,16 @@ def get_prompt(prompt_type="linkedin"):
     Returns:
         str: Template del prompt
     """
-    return PROMPTS.get(prompt_type, CLAUDE_LINKEDIN_PROMPT)
\ No newline at end of file
+    return PROMPTS.get(prompt_type, CLAUDE_LINKEDIN_PROMPT)
+
+def get_prompt_parts(prompt_type="linkedin"):
+    """
+    Restituisce il prompt diviso in parte fissa e parte variabile
+    
+    Args:
+        prompt_type (str): Tipo di prompt ("linkedin" o "general")
+    
+    Returns:
+        tuple: (system prompt da mettere in cache, template del messaggio utente)
+    """
+    return PROMPT_PARTS.get(prompt_type, PROMPT_PARTS["linkedin"])
@@ -0,0 +1,315 @@
+"""
+Chiamate ai provider con scadenze, retry, circuit breaker e hedging
+
+Whisper, Claude e Cloudinary falliscono ogni tanto in modo transitorio
+(5xx, 429, 529 overloaded, connessioni chiuse). call_provider esegue la
+chiamata con run_blocking e:
+
+- la ripete con backoff esponenziale e jitter (rispettando Retry-After)
+  finché non scade la scadenza dello stage;
+- conta gli errori consecutivi per provider e, oltre una soglia, apre il
+  circuito: le chiamate falliscono subito con ProviderUnavailable per
+  CIRCUIT_COOLDOWN secondi, poi una sola chiamata di prova lo richiude;
+- se l'hedging è attivo per il provider, invia una seconda richiesta
+  identica quando la prima supera il p95 delle latenze recenti e usa la
+  prima risposta che arriva.
+
+Prima di ogni tentativo la chiamata attende di rientrare nei limiti di
+frequenza del provider (rate_limits), entro la stessa scadenza.
+
+L'hedging raddoppia il costo delle chiamate lente, quindi è disattivato di
+default e va abilitato per provider con PROVIDER_HEDGING (es. "cloudinary").
+Le chiamate passate a call_provider devono poter essere ripetute: ogni
+esecuzione riapre i file che invia.
+"""
+
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+
+from concurrency import run_blocking
+from rate_limits import RATE_LIMITS, RateLimited
+
+class CallPolicy(NamedTuple):
+    # Scadenza complessiva dello stage (secondi), tentativi compresi
+    deadline: float
+    attempts: int
+    backoff_base: float
+    backoff_max: float
+    hedge: bool
+
+HEDGED_PROVIDERS = {p.strip() for p in os.getenv('PROVIDER_HEDGING', '').split(',') if p.strip()}
+
+def _policy(provider: str, deadline: float, attempts: int) -> CallPolicy:
+    prefix = provider.upper()
+    return CallPolicy(
+        deadline=float(os.getenv(f'{prefix}_DEADLINE', deadline)),
+        attempts=int(os.getenv(f'{prefix}_ATTEMPTS', attempts)),
+        backoff_base=0.5,
+        backoff_max=8.0,
+        hedge=provider in HEDGED_PROVIDERS
+    )
+
+PROVIDER_POLICIES: Dict[str, CallPolicy] = {
+    "whisper": _policy("whisper", 300, 3),
+    "claude": _policy("claude", 180, 3),
+    "cloudinary": _policy("cloudinary", 300, 3),
+}
+
+# Errori consecutivi che aprono il circuito e durata dell'apertura (secondi)
+CIRCUIT_THRESHOLD = int(os.getenv('CIRCUIT_THRESHOLD', 5))
+CIRCUIT_COOLDOWN = float(os.getenv('CIRCUIT_COOLDOWN', 30))
+
+# Latenze recenti usate per il p95 dell'hedging, e minimo per considerarlo affidabile
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# Stati HTTP ed errori di rete per cui ha senso riprovare
+TRANSIENT_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529})
+TRANSIENT_ERRORS = frozenset({
+    # openai / anthropic
+    "APIConnectionError", "APITimeoutError", "InternalServerError", "RateLimitError",
+    # httpx
+    "TransportError",
+    # urllib3 (Cloudinary)
+    "ProtocolError", "NewConnectionError", "ReadTimeoutError", "MaxRetryError",
+    # cloudinary
+    "GeneralError", "RateLimited",
+})
+
+class ProviderUnavailable(Exception):
+    """Circuito aperto: il provider ha fallito troppe volte di seguito"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} non disponibile, riprova tra {retry_after:.0f} secondi")
+        self.provider = provider
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Circuito chiuso → aperto dopo N errori → semiaperto (una prova) → chiuso"""
+
+    def __init__(self, provider: str, threshold: int = CIRCUIT_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.provider = provider
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        if self.opened_at is None:
+            return
+        remaining = self.cooldown - (time.monotonic() - self.opened_at)
+        if remaining > 0 or self.probing:
+            raise ProviderUnavailable(self.provider, max(remaining, 1.0))
+        self.probing = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def release_probe(self):
+        """Chiamata annullata: non dice nulla sul provider, la prova passa alla prossima"""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        # Una prova fallita in semiapertura riapre subito il circuito
+        if self.failures >= self.threshold or self.probing:
+            if self.opened_at is None or self.probing:
+                print(f"Circuito aperto per {self.provider} dopo {self.failures} errori")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+class ProviderStats:
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+breakers: Dict[str, CircuitBreaker] = {}
+provider_stats: Dict[str, ProviderStats] = {}
+
+def _state(provider: str):
+    if provider not in breakers:
+        breakers[provider] = CircuitBreaker(provider)
+        provider_stats[provider] = ProviderStats()
+    return breakers[provider], provider_stats[provider]
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """Stato HTTP di un errore degli SDK (openai/anthropic, httpx), se presente"""
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = status_code(exc)
+    if code is not None:
+        return code in TRANSIENT_STATUS
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__)
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Attesa suggerita dal provider (header Retry-After in secondi)"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, policy: CallPolicy, suggested: Optional[float] = None) -> float:
+    """Backoff esponenziale con jitter completo, mai sotto l'attesa suggerita"""
+    delay = random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** (attempt - 1)))
+    return max(delay, min(suggested or 0.0, policy.backoff_max))
+
+async def _hedged(
+    provider: str,
+    request: Callable[[], Any],
+    hedge_after: float,
+    stats: ProviderStats,
+    units: float = 0
+) -> Any:
+    first = asyncio.ensure_future(run_blocking(provider, request))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done and _hedge_allowed(provider, units):
+            stats.hedges += 1
+            tasks.add(asyncio.ensure_future(run_blocking(provider, request)))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        stats.hedge_wins += 1
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        # La richiesta rimasta indietro finisce nel suo thread e viene ignorata
+        for task in tasks:
+            task.cancel()
+
+def _hedge_allowed(provider: str, units: float) -> bool:
+    """La copia hedge è una richiesta in più: parte solo se i limiti la lasciano partire subito"""
+    rate_limit = RATE_LIMITS.get(provider)
+    if rate_limit is None:
+        return True
+    try:
+        rate_limit.reserve_now(units)
+    except RateLimited:
+        return False
+    return True
+
+async def call_provider(
+    provider: str,
+    request: Callable[[], Any],
+    retry: bool = True,
+    units: float = 0,
+    hedge: bool = True
+) -> Any:
+    """
+    Esegue request() nel thread pool con la politica del provider
+
+    Args:
+        provider: whisper, claude o cloudinary
+        request: Chiamata sincrona ripetibile
+        retry: False per le chiamate da non ripetere (es. stream già iniziati)
+        units: Volume della chiamata per il limite al minuto (minuti di audio, token)
+        hedge: False per le chiamate con effetti visibili mentre sono in corso
+            (es. stream), che una copia parallela duplicherebbe
+
+    Raises:
+        ProviderUnavailable: se il circuito del provider è aperto
+        RateLimited: se i limiti di frequenza non lasciano partire la chiamata in tempo
+        TimeoutError: se la scadenza dello stage è trascorsa
+    """
+    policy = PROVIDER_POLICIES[provider]
+    breaker, stats = _state(provider)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.deadline
+    attempts = policy.attempts if retry else 1
+
+    for attempt in range(1, attempts + 1):
+        # Prima del circuito: una prova in semiapertura non resta in sospeso durante l'attesa
+        rate_limit = RATE_LIMITS.get(provider)
+        if rate_limit is not None:
+            await rate_limit.acquire(units, deadline - loop.time())
+        try:
+            breaker.before_call()
+        except ProviderUnavailable:
+            stats.rejected += 1
+            raise
+        stats.calls += 1
+        started = loop.time()
+        hedge_after = stats.p95() if policy.hedge and hedge else None
+        try:
+            call = (_hedged(provider, request, hedge_after, stats, units) if hedge_after is not None
+                    else run_blocking(provider, request))
+            result = await asyncio.wait_for(call, max(deadline - started, 0.001))
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            transient = is_transient(e)
+            if transient:
+                breaker.record_failure()
+            else:
+                # Errori del client (400, 401...) non dicono nulla sulla salute del provider
+                breaker.record_success()
+            stats.failures += 1
+            delay = backoff_delay(attempt, policy, retry_after(e))
+            if not transient or attempt == attempts or loop.time() + delay >= deadline:
+                raise
+            stats.retries += 1
+            print(f"Errore transitorio da {provider} (tentativo {attempt}/{attempts}), "
+                  f"nuovo tentativo tra {delay:.1f}s: {type(e).__name__}: {str(e)}")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            stats.latencies.append(loop.time() - started)
+            return result
+
+def providers_stats() -> Dict[str, Any]:
+    """Contatori e stato del circuito per provider"""
+    stats = {}
+    for provider in PROVIDER_POLICIES:
+        breaker, provider_stat = _state(provider)
+        p95 = provider_stat.p95()
+        rate_limit = RATE_LIMITS.get(provider)
+        stats[provider] = {
+            "circuit": breaker.state,
+            "calls": provider_stat.calls,
+            "retries": provider_stat.retries,
+            "failures": provider_stat.failures,
+            "rejected": provider_stat.rejected,
+            "hedges": provider_stat.hedges,
+            "hedge_wins": provider_stat.hedge_wins,
+            "throttled": rate_limit.throttled if rate_limit is not None else 0,
+            "throttled_seconds": round(rate_limit.waited, 1) if rate_limit is not None else 0.0,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None
+        }
+    return stats
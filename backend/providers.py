@@ -0,0 +1,142 @@
+"""
+Client dei servizi esterni, creati al primo utilizzo
+
+Importare gli SDK di OpenAI, Anthropic e Cloudinary e costruirne i client
+costa centinaia di millisecondi: farlo all'import di app.py ritarda l'avvio
+dell'istanza, e quindi la prima richiesta dopo una sospensione. I client
+vengono invece creati alla prima chiamata, dal thread del pool che la
+esegue, così l'event loop non si blocca mai sull'import di un SDK.
+
+Con PREWARM_CONNECTIONS=1 il lifespan crea i client in background subito
+dopo l'avvio e apre le connessioni HTTP con una richiesta leggera per
+provider, senza ritardare l'avvio del server.
+
+OpenAI e Anthropic usano un client httpx dedicato con connessioni
+keep-alive dimensionate sul limite di concorrenza del provider; i retry
+degli SDK sono disattivati perché se ne occupa provider_calls.
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from concurrency import run_blocking, PROVIDER_LIMITS
+from provider_calls import PROVIDER_POLICIES
+
+# Crea i client e apre le connessioni in background all'avvio
+PREWARM_CONNECTIONS = os.getenv('PREWARM_CONNECTIONS', '0') == '1'
+
+# Durata delle connessioni inattive nel pool e timeout di connessione (secondi)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+def _lazy_client(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _http_client(provider: str, sdk):
+    """
+    Pool HTTP per un provider: una connessione per chiamata contemporanea (il doppio con l'hedging)
+
+    Client e limiti vengono dal modulo dell'SDK (DefaultHttpxClient), così
+    corrispondono sempre alla libreria HTTP che l'SDK accetta.
+    """
+    policy = PROVIDER_POLICIES[provider]
+    connections = PROVIDER_LIMITS[provider] * (2 if policy.hedge else 1)
+    Limits = type(sdk.DEFAULT_CONNECTION_LIMITS)
+    return sdk.DefaultHttpxClient(
+        limits=Limits(
+            max_connections=connections,
+            max_keepalive_connections=connections,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=sdk.Timeout(policy.deadline, connect=HTTP_CONNECT_TIMEOUT)
+    )
+
+def _create_openai():
+    import openai
+    return openai.OpenAI(
+        api_key=os.getenv('OPENAI_API_KEY'), http_client=_http_client("whisper", openai), max_retries=0
+    )
+
+def _create_claude():
+    import anthropic
+    return anthropic.Anthropic(
+        api_key=os.getenv('ANTHROPIC_API_KEY'), http_client=_http_client("claude", anthropic), max_retries=0
+    )
+
+def _create_cloudinary():
+    import cloudinary
+    import cloudinary.uploader
+    import cloudinary.api
+
+    cloudinary.config(
+        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
+        timeout=PROVIDER_POLICIES["cloudinary"].deadline
+    )
+    return cloudinary
+
+def openai_client():
+    """Client OpenAI per Whisper API"""
+    return _lazy_client("openai", _create_openai)
+
+def claude_client():
+    """Client Anthropic"""
+    return _lazy_client("claude", _create_claude)
+
+def cloudinary_sdk():
+    """Modulo cloudinary configurato (con uploader e api già importati)"""
+    return _lazy_client("cloudinary", _create_cloudinary)
+
+async def _warm(provider: str, request: Callable[[], Any]) -> Optional[str]:
+    try:
+        await run_blocking(provider, request)
+        return None
+    except Exception as e:
+        return str(e)
+
+async def _warm_store(store) -> Optional[str]:
+    try:
+        await store.connect()
+        await store.list_page([], 1)
+        return None
+    except Exception as e:
+        return str(e)
+
+async def prewarm(store) -> Dict[str, Optional[str]]:
+    """
+    Crea tutti i client e apre una connessione verso ogni provider
+
+    Ogni richiesta è gratuita e di sola lettura; un errore (chiave mancante,
+    rete assente) viene solo registrato, dato che il client verrà comunque
+    usato alla prima richiesta reale.
+
+    Returns:
+        Errore per provider, None se il riscaldamento è riuscito
+    """
+    requests = {
+        "whisper": lambda: openai_client().models.list(),
+        "claude": lambda: claude_client().models.list(limit=1),
+        "cloudinary": lambda: cloudinary_sdk().api.ping(),
+    }
+    names = ["store"] + list(requests)
+    results = await asyncio.gather(
+        _warm_store(store),
+        *(_warm(provider, request) for provider, request in requests.items())
+    )
+    errors = dict(zip(names, results))
+    for name, error in errors.items():
+        if error is not None:
+            print(f"Riscaldamento di {name} non riuscito: {error}")
+    return errors
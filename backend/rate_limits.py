@@ -0,0 +1,120 @@
+"""
+Limiti di frequenza per provider (token bucket)
+
+OpenAI e Anthropic limitano sia le richieste al minuto sia il volume
+(token al minuto per Claude). Superarli significa ricevere 429 su tutte le
+richieste in corso insieme: i limiti vengono quindi applicati prima di ogni
+chiamata, con due bucket per provider:
+
+- richieste al minuto (<PROVIDER>_RPM);
+- unità al minuto: minuti di audio per Whisper (WHISPER_AUDIO_MPM), token
+  di input stimati per Claude (CLAUDE_TPM).
+
+Ogni bucket si riempie in modo continuo fino alla quota di un minuto. Una
+chiamata prenota subito le unità, anche andando in negativo, e aspetta il
+tempo necessario a ripagarle: le chiamate vengono servite in ordine di
+arrivo. Se l'attesa supera la scadenza dello stage la prenotazione viene
+annullata e la chiamata fallisce subito con RateLimited; lo stesso vale
+per una chiamata annullata durante l'attesa. Un limite a 0 è disattivato.
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+class RateLimited(Exception):
+    """L'attesa per rientrare nei limiti del provider supera la scadenza"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Limite di richieste verso {provider} raggiunto, riprova tra {retry_after:.0f} secondi")
+        self.provider = provider
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Bucket con capacità pari alla quota di un minuto"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        """Prenota amount unità e ritorna i secondi da attendere prima di usarle"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Una sola chiamata più grande della quota aspetta al massimo un minuto
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+class ProviderRateLimit:
+    def __init__(self, provider: str, requests_per_minute: float, units_per_minute: float = 0):
+        self.provider = provider
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.units = TokenBucket(units_per_minute) if units_per_minute > 0 else None
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _reserve(self, units: float) -> Tuple[List[Tuple[TokenBucket, float]], float]:
+        reserved: List[Tuple[TokenBucket, float]] = [
+            (bucket, amount) for bucket, amount in ((self.requests, 1), (self.units, units))
+            if bucket is not None and amount > 0
+        ]
+        return reserved, max([bucket.reserve(amount) for bucket, amount in reserved], default=0.0)
+
+    def reserve_now(self, units: float = 0):
+        """
+        Prenota la chiamata solo se può partire subito
+
+        Raises:
+            RateLimited: se servirebbe un'attesa (nulla resta prenotato)
+        """
+        reserved, wait = self._reserve(units)
+        if wait > 0:
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            raise RateLimited(self.provider, wait)
+
+    async def acquire(self, units: float = 0, max_wait: Optional[float] = None):
+        """
+        Attende che la chiamata rientri nei limiti
+
+        Raises:
+            RateLimited: se l'attesa supererebbe max_wait secondi
+        """
+        reserved, wait = self._reserve(units)
+        if wait <= 0:
+            return
+        if max_wait is not None and wait > max_wait:
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            raise RateLimited(self.provider, wait)
+        self.throttled += 1
+        self.waited += wait
+        try:
+            await asyncio.sleep(wait)
+        except BaseException:
+            # Chiamata annullata durante l'attesa: la quota prenotata non è stata usata
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            raise
+
+def _limit(provider: str, requests_per_minute: float, units_env: Optional[str] = None, units: float = 0) -> ProviderRateLimit:
+    prefix = provider.upper()
+    return ProviderRateLimit(
+        provider,
+        float(os.getenv(f'{prefix}_RPM', requests_per_minute)),
+        float(os.getenv(units_env, units)) if units_env else 0
+    )
+
+# Default vicini ai limiti del primo livello di OpenAI e Anthropic
+RATE_LIMITS: Dict[str, ProviderRateLimit] = {
+    "whisper": _limit("whisper", 500, 'WHISPER_AUDIO_MPM', 0),
+    "claude": _limit("claude", 50, 'CLAUDE_TPM', 30000),
+    "cloudinary": _limit("cloudinary", 0),
+}
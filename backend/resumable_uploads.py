@@ -0,0 +1,297 @@
+"""
+Upload riprendibili a blocchi
+
+Con un unico upload multipart, una connessione mobile che cade al 90%
+costringe a ricominciare da zero. Con una sessione di upload il client:
+
+1. crea la sessione (POST /api/uploads) con nome e dimensione del file, ed
+   eventualmente lo SHA-256 dell'intero file;
+2. invia i byte in ordine con PUT /api/uploads/{id} e Content-Range
+   (bytes inizio-fine/totale), con lo SHA-256 di ogni blocco nell'header
+   X-Chunk-Sha256 (opzionale);
+3. dopo un'interruzione legge l'offset raggiunto (GET /api/uploads/{id}) e
+   riprende da lì, senza reinviare i byte già ricevuti;
+4. finalizza (POST /api/uploads/{id}/finalize), che avvia la pipeline.
+
+I byte vengono accodati in UPLOAD_SESSIONS_DIR/<id><estensione>. L'offset
+confermato è salvato in <id>.json solo dopo che il blocco è stato scritto
+per intero e verificato: un blocco interrotto o con checksum errato viene
+troncato e l'offset non avanza. Un blocco reinviato perché la risposta è
+andata persa viene accettato senza riscrivere i byte già presenti.
+
+Le sessioni inattive da più di UPLOAD_SESSION_TTL_HOURS ore vengono
+eliminate insieme ai byte ricevuti.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from settings import DATA_DIR
+from uploads import MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, upload_too_large_detail
+
+UPLOAD_SESSIONS_DIR = os.getenv('UPLOAD_SESSIONS_DIR', os.path.join(DATA_DIR, 'upload_sessions'))
+UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600
+
+# Blocco suggerito al client e blocco massimo accettato da una singola PUT
+SESSION_CHUNK_BYTES = 2 * 1024 * 1024
+MAX_CHUNK_BYTES = int(os.getenv('UPLOAD_MAX_CHUNK_MB', 8)) * 1024 * 1024
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+SHA256_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+def parse_content_range(header: Optional[str]) -> Tuple[int, int, int]:
+    """Content-Range "bytes inizio-fine/totale" → (inizio, lunghezza, totale)"""
+    match = CONTENT_RANGE.match(header or "")
+    if match is None:
+        raise HTTPException(status_code=400, detail="Content-Range mancante o non valido (bytes inizio-fine/totale)")
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise HTTPException(status_code=400, detail="Content-Range non valido")
+    return start, end - start + 1, total
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+class UploadSessions:
+    """Sessioni di upload su disco, con offset confermato e scadenza"""
+
+    def __init__(self, directory: str = UPLOAD_SESSIONS_DIR, ttl: float = UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # SHA-256 dei byte confermati, aggiornato a ogni blocco (ricalcolato dopo un riavvio)
+        self._hashers: Dict[str, Any] = {}
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def data_path(self, session: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, session["id"] + session["extension"])
+
+    def _save(self, session: Dict[str, Any]):
+        tmp_path = self._meta_path(session["id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, self._meta_path(session["id"]))
+
+    def _remove(self, session: Dict[str, Any]):
+        for path in (self._meta_path(session["id"]), self.data_path(session)):
+            if os.path.exists(path):
+                os.unlink(path)
+        self._locks.pop(session["id"], None)
+        self._hashers.pop(session["id"], None)
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        """Sessione esistente e non scaduta, altrimenti 404"""
+        session = None
+        if re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            try:
+                with open(self._meta_path(upload_id)) as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                session = None
+        if session is not None and time.time() - session["updated_at"] > self.ttl:
+            self._remove(session)
+            session = None
+        if session is None:
+            raise HTTPException(status_code=404, detail="Sessione di upload non trovata o scaduta")
+        return session
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        """
+        Lock della sessione, creato solo per sessioni esistenti
+
+        Un id non valido o scaduto riceve 404 senza lasciare un lock nel
+        dizionario; il lock viene rimosso con la sessione (_remove) o alla
+        finalizzazione.
+        """
+        self._load(upload_id)
+        return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    def public(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """Campi della sessione restituiti al client"""
+        return {
+            "upload_id": session["id"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "offset": session["offset"],
+            "chunk_size": SESSION_CHUNK_BYTES,
+            "expires_at": datetime.fromtimestamp(session["updated_at"] + self.ttl).isoformat()
+        }
+
+    async def create(self, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        if size <= 0:
+            raise HTTPException(status_code=400, detail="Dimensione del file non valida")
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=upload_too_large_detail())
+        if sha256 is not None and not SHA256_HEX.match(sha256.lower()):
+            raise HTTPException(status_code=400, detail="sha256 non valido")
+
+        now = time.time()
+        session = {
+            "id": uuid.uuid4().hex,
+            "filename": filename,
+            "extension": os.path.splitext(filename)[1].lower(),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "offset": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+        open(self.data_path(session), "wb").close()
+        self._save(session)
+        self._hashers[session["id"]] = hashlib.sha256()
+        return session
+
+    async def get(self, upload_id: str) -> Dict[str, Any]:
+        return self._load(upload_id)
+
+    async def write(
+        self,
+        upload_id: str,
+        start: int,
+        length: int,
+        total: int,
+        body: AsyncIterator[bytes],
+        chunk_sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Aggiunge un blocco alla sessione e ritorna la sessione aggiornata
+
+        Raises:
+            HTTPException: 409 se il blocco non parte dall'offset confermato
+                (il client deve rileggerlo), 400 per un blocco incompleto,
+                422 per un checksum errato
+        """
+        if length > MAX_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail=upload_too_large_detail(MAX_CHUNK_BYTES))
+        async with self._lock(upload_id):
+            session = self._load(upload_id)
+            offset = session["offset"]
+            if total != session["size"] or start + length > total:
+                raise HTTPException(status_code=400, detail="Content-Range non coerente con la dimensione del file")
+            if start > offset:
+                raise HTTPException(status_code=409, detail=f"Offset atteso: {offset}")
+
+            path = self.data_path(session)
+            hasher = self._hashers.get(upload_id)
+            if hasher is None:
+                hasher = await asyncio.to_thread(self._rehash, path, offset)
+            updated = hasher.copy()
+            chunk_hasher = hashlib.sha256()
+            # Byte del blocco già ricevuti con un invio precedente
+            skip = offset - start
+            received = 0
+            try:
+                with open(path, "r+b") as f:
+                    # Scarta eventuali byte di una scrittura interrotta
+                    f.truncate(offset)
+                    f.seek(offset)
+                    async for data in body:
+                        received += len(data)
+                        if received > length:
+                            raise HTTPException(status_code=400, detail="Blocco più lungo del Content-Range")
+                        chunk_hasher.update(data)
+                        new = data[max(0, skip - (received - len(data))):]
+                        if new:
+                            updated.update(new)
+                            f.write(new)
+                    if received != length:
+                        raise HTTPException(status_code=400, detail="Blocco incompleto")
+                    if chunk_sha256 and chunk_hasher.hexdigest() != chunk_sha256.lower():
+                        raise HTTPException(status_code=422, detail="Checksum del blocco non valido")
+            except BaseException:
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                raise
+
+            session["offset"] = max(offset, start + length)
+            session["updated_at"] = time.time()
+            self._save(session)
+            self._hashers[upload_id] = updated
+            return session
+
+    def _rehash(self, path: str, offset: int):
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            remaining = offset
+            while remaining:
+                block = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    async def finalize(self, upload_id: str) -> Tuple[str, str, str]:
+        """
+        Chiude la sessione completa e ritorna (percorso, nome file, sha256)
+
+        Il file passa al chiamante, che deve rimuoverlo.
+        """
+        async with self._lock(upload_id):
+            session = self._load(upload_id)
+            if session["offset"] != session["size"]:
+                raise HTTPException(
+                    status_code=409, detail=f"Upload incompleto: ricevuti {session['offset']} di {session['size']} byte"
+                )
+            path = self.data_path(session)
+            hasher = self._hashers.pop(upload_id, None)
+            content_hash = hasher.hexdigest() if hasher is not None else await asyncio.to_thread(file_sha256, path)
+            if session["sha256"] and content_hash != session["sha256"]:
+                self._remove(session)
+                raise HTTPException(status_code=422, detail="Checksum del file non valido, upload da ripetere")
+            os.unlink(self._meta_path(upload_id))
+            self._locks.pop(upload_id, None)
+            return path, session["filename"], content_hash
+
+    async def delete(self, upload_id: str):
+        self._remove(self._load(upload_id))
+
+    def purge_expired(self) -> int:
+        """Elimina le sessioni scadute e i file rimasti senza sessione"""
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            upload_id, extension = os.path.splitext(name)
+            if extension == ".json":
+                try:
+                    self._load(upload_id)
+                except HTTPException:
+                    removed += 1
+            elif not os.path.exists(self._meta_path(upload_id.split(".")[0])) and now - os.path.getmtime(path) > self.ttl:
+                os.unlink(path)
+        return removed
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.purge_expired)
+                if removed:
+                    print(f"Eliminate {removed} sessioni di upload scadute")
+            except Exception as e:
+                print(f"Errore nella pulizia delle sessioni di upload: {str(e)}")
+            await asyncio.sleep(min(self.ttl, 3600))
+
+    async def start(self):
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
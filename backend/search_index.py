@@ -0,0 +1,276 @@
+"""
+Ricerca full-text sulle note
+
+Indice invertito in memoria su titolo, trascrizione e testo elaborato, con
+tokenizzazione per l'italiano (elisioni, stopword, accenti ignorati,
+stemming leggero) e ranking BM25. L'indice viene costruito dall'archivio
+alla prima ricerca, aggiornato a ogni creazione, modifica ed eliminazione
+e salvato su disco come snapshot compresso, così un riavvio non richiede
+di rileggere tutte le note. Le note modificate prima della prima ricerca
+vengono rilette dall'archivio dopo aver caricato lo snapshot.
+"""
+
+import os
+import re
+import gzip
+import json
+import math
+import asyncio
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from note_store import project
+from settings import DATA_DIR
+
+SEARCH_SNAPSHOT_PATH = os.getenv('SEARCH_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'search_index.json.gz'))
+
+# Attesa (secondi) dopo una modifica prima di salvare lo snapshot
+SNAPSHOT_DELAY = 5.0
+
+# Versione del formato dello snapshot e della tokenizzazione
+SNAPSHOT_VERSION = 1
+
+# Parametri BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Il titolo conta come se le sue parole comparissero più volte
+TITLE_WEIGHT = 3
+
+# Campi indicizzati e campi restituiti nei risultati (gli stessi della lista note)
+TEXT_FIELDS = ['title', 'transcription', 'processed_text']
+RESULT_FIELDS = [
+    'title',
+    'original_filename',
+    'preview',
+    'prompt_type',
+    'audio_duration_minutes',
+    'cost_data.total_cost_usd',
+    'cost_data.total_cost_eur',
+    'created_at'
+]
+INDEX_FIELDS = list(dict.fromkeys(TEXT_FIELDS + RESULT_FIELDS))
+
+ITALIAN_STOPWORDS = frozenset("""
+a ad al allo ai agli all alla alle anche avere aveva c che chi ci col come con contro cui da dal dallo dai
+dagli dall dalla dalle degli dei del dell della delle dello di dove e ed era erano essere fra gli ha hai
+hanno ho i il in io la le lei li lo loro lui ma me mi mia mie miei mio ne negli nei nel nell nella nelle
+nello noi non nostro o per perche piu poi quale quando quanto quella quelle quelli quello questa queste
+questi questo se sei si sia siamo siete solo sono su sua sue sugli sui sul sull sulla sulle sullo suo
+suoi te ti tra tu tua tue tuo tuoi un una uno vi voi
+""".split())
+
+_HTML_TAG = re.compile(r"<[^>]+>")
+_WORD = re.compile(r"[a-z0-9]+")
+
+def fold_accents(text: str) -> str:
+    """Rimuove accenti e segni diacritici (perché -> perche)"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def stem(word: str) -> str:
+    """
+    Stemming leggero: toglie la vocale finale delle parole lunghe
+
+    Unifica singolare/plurale e maschile/femminile (progetto, progetti,
+    progetta) senza le regole complete di uno stemmer.
+    """
+    if len(word) > 4 and word[-1] in "aeio":
+        return word[:-1]
+    return word
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Token normalizzati di un testo (anche HTML) in italiano"""
+    if not text:
+        return []
+    # Le elisioni (l'anno, dell'idea) diventano parole separate
+    text = fold_accents(_HTML_TAG.sub(" ", text).lower()).replace("'", " ").replace("’", " ")
+    return [stem(word) for word in _WORD.findall(text) if word not in ITALIAN_STOPWORDS]
+
+def document_terms(note: Dict[str, Any]) -> Counter:
+    """Frequenza dei termini di una nota, con il titolo pesato TITLE_WEIGHT volte"""
+    terms = Counter(tokenize(note.get('transcription')))
+    terms.update(tokenize(note.get('processed_text')))
+    for term in tokenize(note.get('title')):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+class SearchIndex:
+    """
+    Indice invertito con ranking BM25 e snapshot su disco
+
+    Per ogni nota conserva le frequenze dei termini (per poterla rimuovere
+    o aggiornare) e i metadati mostrati nei risultati.
+    """
+
+    def __init__(self, snapshot_path: str = SEARCH_SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.meta: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+        self.built = False
+        self._build_lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+        # Note create, modificate o eliminate prima che l'indice fosse costruito
+        self._stale: Set[str] = set()
+
+    def _insert(self, note_id: str, terms: Dict[str, int], meta: Dict[str, Any]):
+        self.doc_terms[note_id] = terms
+        self.meta[note_id] = meta
+        length = sum(terms.values())
+        self.doc_lengths[note_id] = length
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[note_id] = frequency
+
+    def _remove(self, note_id: str):
+        terms = self.doc_terms.pop(note_id, None)
+        if terms is None:
+            return
+        self.meta.pop(note_id, None)
+        self.total_length -= self.doc_lengths.pop(note_id, 0)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(note_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def _index_note(self, note: Dict[str, Any]):
+        self._remove(note['id'])
+        meta = project(note, RESULT_FIELDS)
+        meta.setdefault('title', note.get('original_filename', 'Nota senza titolo'))
+        self._insert(note['id'], dict(document_terms(note)), meta)
+
+    # Aggiornamenti incrementali: finché l'indice non è costruito viene solo
+    # ricordato l'id, perché lo snapshot da caricare non li contiene
+
+    def add(self, notes: Iterable[Dict[str, Any]]):
+        """Indicizza (o reindicizza) note complete di id"""
+        if not self.built:
+            self._stale.update(note['id'] for note in notes)
+            return
+        for note in notes:
+            self._index_note(note)
+        self._schedule_save()
+
+    def remove(self, note_ids: Iterable[str]):
+        if not self.built:
+            self._stale.update(note_ids)
+            return
+        for note_id in note_ids:
+            self._remove(note_id)
+        self._schedule_save()
+
+    async def ensure_built(self, store):
+        """Carica lo snapshot o, se assente, costruisce l'indice dall'archivio"""
+        if self.built:
+            return
+        async with self._build_lock:
+            if self.built:
+                return
+            if await asyncio.to_thread(self._load_snapshot):
+                print(f"Indice di ricerca caricato dallo snapshot: {len(self.doc_terms)} note")
+            else:
+                self._stale.clear()
+                for note in await store.list_all(INDEX_FIELDS):
+                    self._index_note(note)
+                print(f"Indice di ricerca costruito: {len(self.doc_terms)} note")
+                await self.save()
+            # Modifiche successive allo snapshot o arrivate durante la lettura dell'archivio
+            while self._stale:
+                await self._refresh_stale(store)
+            self.built = True
+
+    async def _refresh_stale(self, store):
+        """Rilegge dall'archivio le note cambiate dopo lo snapshot"""
+        note_ids = list(self._stale)
+        self._stale.clear()
+        notes = await store.get_many(note_ids, fields=INDEX_FIELDS)
+        for note_id in note_ids:
+            if note_id in notes:
+                self._index_note({**notes[note_id], 'id': note_id})
+            else:
+                self._remove(note_id)
+        print(f"Indice di ricerca: {len(note_ids)} note aggiornate dopo lo snapshot")
+        await self.save()
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Note più rilevanti per la query, ordinate per punteggio BM25"""
+        terms = set(tokenize(query))
+        if not terms or not self.doc_terms:
+            return []
+
+        count = len(self.doc_terms)
+        average_length = self.total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for note_id, frequency in posting.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[note_id] / average_length)
+                scores[note_id] = scores.get(note_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"id": note_id, "score": round(score, 4), **self.meta[note_id]} for note_id, score in ranked]
+
+    def _load_snapshot(self) -> bool:
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with gzip.open(self.snapshot_path, "rt", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot dell'indice di ricerca non leggibile, ricostruzione: {str(e)}")
+            return False
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return False
+        for note_id, (terms, meta) in snapshot["notes"].items():
+            self._insert(note_id, terms, meta)
+        return True
+
+    def _write_snapshot(self, snapshot: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.snapshot_path)
+
+    async def save(self):
+        """Salva lo snapshot (scrittura atomica, in un thread)"""
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "notes": {note_id: [terms, self.meta[note_id]] for note_id, terms in self.doc_terms.items()}
+        }
+        await asyncio.to_thread(self._write_snapshot, snapshot)
+
+    def _schedule_save(self):
+        # Più modifiche ravvicinate producono un solo salvataggio
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._delayed_save())
+
+    async def _delayed_save(self):
+        await asyncio.sleep(SNAPSHOT_DELAY)
+        try:
+            await self.save()
+        except Exception as e:
+            print(f"Errore nel salvataggio dell'indice di ricerca: {str(e)}")
+
+    async def flush(self):
+        """Salva subito le modifiche in attesa (allo spegnimento)"""
+        if not self.built and self._stale and os.path.exists(self.snapshot_path):
+            # Lo snapshot non contiene le modifiche di questa esecuzione: al
+            # prossimo avvio l'indice va ricostruito dall'archivio
+            os.unlink(self.snapshot_path)
+            return
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+            await self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"built": self.built, "notes": len(self.doc_terms), "terms": len(self.postings)}
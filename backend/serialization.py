@@ -0,0 +1,97 @@
+"""
+Serializzazione veloce delle note e compressione delle risposte
+
+I documenti delle note hanno un insieme noto di campi: lo schema indica
+quali vanno convertiti (le date di Firestore) e tutti gli altri vengono
+copiati senza ispezionarli. Il JSON è prodotto con orjson quando disponibile
+e la risposta viene compressa con brotli o gzip in base ad Accept-Encoding.
+"""
+
+import gzip
+import json
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # Fallback sulla libreria standard
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Senza brotli si usa solo gzip
+    brotli = None
+
+# Sotto questa dimensione la compressione non conviene
+COMPRESSION_MIN_BYTES = 1024
+# Oltre questa dimensione (circa 0.5 ms di gzip/brotli) la compressione gira in un thread
+COMPRESSION_THREAD_BYTES = 64 * 1024
+
+# Livelli scelti per risposte generate a ogni richiesta (veloci, non massimi)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_SKIP = object()
+
+def _timestamp(value: Any) -> Any:
+    # DatetimeWithNanoseconds di Firestore, datetime o stringa ISO già pronta
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+def _server_timestamp(value: Any) -> Any:
+    # Il timestamp server-side è None finché Firestore non lo valorizza
+    return _SKIP if value is None else _timestamp(value)
+
+# Campi di una nota che richiedono una conversione; gli altri sono già tipi JSON
+NOTE_SCHEMA: Dict[str, Callable[[Any], Any]] = {
+    "created_at": _timestamp,
+    "updated_at": _timestamp,
+    "timestamp": _server_timestamp,
+}
+
+def serialize_note(data: Dict[str, Any], schema: Dict[str, Callable[[Any], Any]] = NOTE_SCHEMA) -> Dict[str, Any]:
+    """Converte un documento nota in un dict serializzabile in JSON"""
+    serialized = {}
+    for key, value in data.items():
+        convert = schema.get(key)
+        if convert is not None:
+            value = convert(value)
+            if value is _SKIP:
+                continue
+        serialized[key] = value
+    return serialized
+
+def _default(value: Any) -> Any:
+    # Rete di sicurezza per date in campi fuori dallo schema
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Tipo non serializzabile in JSON: {type(value).__name__}")
+
+def encode_json(payload: Any) -> bytes:
+    """Serializza in JSON UTF-8 compatto (stesso output di JSONResponse)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Sceglie la codifica tra quelle accettate dal client: br, poi gzip"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Codifica non supportata: {encoding}")
@@ -0,0 +1,8 @@
+"""
+Percorsi dei dati locali del backend
+"""
+
+import os
+
+# Cartella per database SQLite, cache e file in attesa di elaborazione
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
@@ -0,0 +1,113 @@
+"""
+Rimozione dei silenzi (VAD a energia) prima di Whisper
+
+Le note vocali registrate dal telefono contengono pause lunghe e secondi
+vuoti all'inizio e alla fine. Whisper fattura al minuto e impiega più tempo
+sui file lunghi, quindi prima della trascrizione:
+
+1. l'energia RMS viene calcolata per frame da 30 ms (vettorizzata);
+2. la soglia parlato/silenzio si adatta al rumore di fondo della
+   registrazione (percentile basso dell'energia);
+3. le zone di parlato vengono estese di VAD_PAD_MS per lato, così l'inizio
+   e la fine delle parole restano intatti;
+4. i silenzi più lunghi di VAD_MAX_SILENCE_MS vengono tagliati, lasciando
+   solo la pausa data dal margine, e quelli iniziali e finali rimossi.
+
+L'archivio su Cloudinary riceve sempre l'audio originale: il taglio vale
+solo per la trascrizione, e i minuti effettivamente inviati a Whisper sono
+quelli fatturati nella nota.
+"""
+
+import os
+import numpy as np
+from typing import NamedTuple, Optional
+
+from audio_chunking import frame_energy
+
+VAD_TRIM = os.getenv('VAD_TRIM', '1') == '1'
+
+VAD_FRAME_MS = 30
+# Margine mantenuto attorno al parlato e silenzio massimo lasciato intatto
+VAD_PAD_MS = int(os.getenv('VAD_PAD_MS', 250))
+VAD_MAX_SILENCE_MS = int(os.getenv('VAD_MAX_SILENCE_MS', 1000))
+# Sotto questa riduzione il taglio non conviene e si invia l'audio originale
+VAD_MIN_TRIM_RATIO = float(os.getenv('VAD_MIN_TRIM_RATIO', 0.05))
+
+# Soglia: rumore di fondo × VAD_NOISE_RATIO, almeno VAD_MIN_RMS (circa -50 dBFS),
+# al massimo una frazione del livello del parlato più forte
+VAD_NOISE_RATIO = 3.0
+VAD_MIN_RMS = 100.0
+VAD_LOUD_FRACTION = 0.1
+
+class TrimmedAudio(NamedTuple):
+    samples: np.ndarray
+    original_seconds: float
+    speech_seconds: float
+
+    @property
+    def removed_seconds(self) -> float:
+        return self.original_seconds - self.speech_seconds
+
+def speech_mask(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """Frame con energia sopra la soglia adattiva (True = parlato)"""
+    energy = frame_energy(samples, frame_length)
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    floor, loud = np.percentile(energy, [10, 95])
+    threshold = min(max(floor * VAD_NOISE_RATIO, VAD_MIN_RMS), loud * VAD_LOUD_FRACTION)
+    return energy > threshold
+
+def speech_intervals(mask: np.ndarray, pad_frames: int, max_silence_frames: int) -> np.ndarray:
+    """
+    Intervalli di frame da mantenere, come array (n, 2) di [inizio, fine)
+
+    Il parlato viene esteso di pad_frames per lato; i silenzi rimasti più
+    corti di max_silence_frames vengono uniti agli intervalli vicini.
+    """
+    if pad_frames > 0 and mask.any():
+        kernel = np.ones(2 * pad_frames + 1, dtype=np.int32)
+        mask = np.convolve(mask.astype(np.int32), kernel, mode="same") > 0
+
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    breaks = (starts[1:] - ends[:-1]) >= max_silence_frames
+    return np.stack([
+        np.concatenate(([starts[0]], starts[1:][breaks])),
+        np.concatenate((ends[:-1][breaks], [ends[-1]]))
+    ], axis=1)
+
+def trim_silence(
+    samples: np.ndarray,
+    sample_rate: int,
+    pad_ms: int = VAD_PAD_MS,
+    max_silence_ms: int = VAD_MAX_SILENCE_MS,
+    min_trim_ratio: float = VAD_MIN_TRIM_RATIO
+) -> Optional[TrimmedAudio]:
+    """
+    Ritorna l'audio senza i silenzi lunghi
+
+    Returns:
+        TrimmedAudio con i campioni ridotti, oppure None se la riduzione è
+        inferiore a min_trim_ratio o non è stato trovato parlato
+    """
+    frame_length = max(1, int(sample_rate * VAD_FRAME_MS / 1000))
+    mask = speech_mask(samples, frame_length)
+    intervals = speech_intervals(
+        mask, round(pad_ms / VAD_FRAME_MS), max(1, round(max_silence_ms / VAD_FRAME_MS))
+    ) * frame_length
+    if len(intervals) == 0:
+        return None
+
+    # L'ultimo frame parziale segue l'ultimo intervallo se questo arriva alla fine
+    if intervals[-1, 1] == len(mask) * frame_length:
+        intervals[-1, 1] = len(samples)
+    kept = int((intervals[:, 1] - intervals[:, 0]).sum())
+    if kept > len(samples) * (1 - min_trim_ratio):
+        return None
+
+    trimmed = np.concatenate([samples[start:end] for start, end in intervals])
+    return TrimmedAudio(trimmed, len(samples) / sample_rate, kept / sample_rate)
@@ -0,0 +1,136 @@
+"""
+Ricezione dei file audio caricati con memoria costante
+
+Il file viene copiato su disco a blocchi invece di essere letto tutto in RAM,
+e le richieste troppo grandi vengono rifiutate prima di riceverle per intero.
+"""
+
+import os
+import json
+import tempfile
+from typing import Any, Optional
+from fastapi import HTTPException, UploadFile
+
+# Dimensione dei blocchi letti dall'upload (1 MiB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Dimensione massima di un file audio caricato
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', 100)) * 1024 * 1024
+
+# File e byte totali massimi di una richiesta di trascrizione multipla
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', 50))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv('MAX_BATCH_UPLOAD_MB', 1024)) * 1024 * 1024
+
+# Margine per intestazioni e boundary della richiesta multipart
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def upload_too_large_detail(max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    return f"File troppo grande. Dimensione massima: {max_bytes // (1024 * 1024)}MB"
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    dir: Optional[str] = None,
+    hasher: Optional[Any] = None
+) -> str:
+    """
+    Copia un file caricato in un file temporaneo a blocchi
+
+    Args:
+        file: File ricevuto da FastAPI
+        suffix: Estensione del file temporaneo
+        max_bytes: Dimensione massima accettata
+        dir: Cartella del file (default: cartella temporanea di sistema)
+        hasher: Oggetto hashlib aggiornato con i byte man mano che arrivano
+
+    Returns:
+        Percorso del file temporaneo (da rimuovere a cura del chiamante)
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=dir)
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=upload_too_large_detail(max_bytes))
+                if hasher is not None:
+                    hasher.update(chunk)
+                tmp_file.write(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+class UploadSizeLimitMiddleware:
+    """
+    Middleware ASGI che rifiuta con 413 gli upload oltre la dimensione massima
+
+    Controlla subito il Content-Length e, se assente o falso, conta i byte
+    ricevuti interrompendo la lettura del body appena il limite è superato.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_bytes: int = MAX_UPLOAD_BYTES,
+        path_prefixes: tuple = ("/api/transcribe",),
+        exclude_prefixes: tuple = ()
+    ):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_request_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        self.path_prefixes = path_prefixes
+        self.exclude_prefixes = exclude_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.path_prefixes)
+            or (self.exclude_prefixes and scope["path"].startswith(self.exclude_prefixes))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_request_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request" and not rejected:
+                received += len(message.get("body", b""))
+                if received > self.max_request_bytes:
+                    rejected = True
+                    await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Dopo il rifiuto la risposta è già stata inviata
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": upload_too_large_detail(self.max_bytes)}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -33,11 +33,13 @@ export const FILE_CONFIG = {
 
 interface FileUploadProps {
   onFileProcess: (file: File, promptType: 'linkedin' | 'general') => Promise<void>
+  onBatchProcess: (files: File[], promptType: 'linkedin' | 'general') => Promise<void>
   isProcessing: boolean
 }
 
-export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
-  const [selectedFile, setSelectedFile] = useState<File | null>(null)
+export function FileUpload({ onFileProcess, onBatchProcess, isProcessing }: FileUploadProps) {
+  const [selectedFiles, setSelectedFiles] = useState<File[]>([])
+  const selectedFile = selectedFiles[0] ?? null
   const [promptType, setPromptType] = useState<'linkedin' | 'general'>('linkedin')
   const [isDragging, setIsDragging] = useState(false)
   const [isMobile, setIsMobile] = useState(false)
@@ -58,26 +60,35 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
     return () => window.removeEventListener('resize', checkMobile)
   }, [])
 
-  const handleFileSelect = (file: File) => {
+  const isValidFile = (file: File) => {
     // Validazione formato
     const isValidType = FILE_CONFIG.supportedFormats.some(format => file.type === format) ||
       FILE_CONFIG.supportedExtensions.some(ext => file.name.toLowerCase().endsWith(ext))
 
     if (!isValidType) {
-      alert('Formato file non supportato. Usa MP3, WAV, M4A, FLAC, OGG, AAC o WEBM.')
-      return
+      alert(`${file.name}: formato file non supportato. Usa MP3, WAV, M4A, FLAC, OGG, AAC o WEBM.`)
+      return false
     }
 
     // Validazione dimensione
     if (file.size > FILE_CONFIG.maxFileSize) {
-      alert(`File troppo grande. Dimensione massima: ${FILE_CONFIG.maxFileSize / 1024 / 1024}MB`)
-      return
+      alert(`${file.name}: file troppo grande. Dimensione massima: ${FILE_CONFIG.maxFileSize / 1024 / 1024}MB`)
+      return false
     }
 
-    setSelectedFile(file)
+    return true
+  }
+
+  const handleFilesSelect = (files: File[]) => {
+    const validFiles = files.filter(isValidFile)
+    if (validFiles.length === 0) return
+
+    setSelectedFiles(validFiles)
     setShowRecorder(false)
   }
 
+  const handleFileSelect = (file: File) => handleFilesSelect([file])
+
   const handleDragOver = useCallback((e: React.DragEvent) => {
     e.preventDefault()
     setIsDragging(true)
@@ -94,17 +105,21 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
 
     const files = e.dataTransfer.files
     if (files.length > 0) {
-      handleFileSelect(files[0])
+      handleFilesSelect(Array.from(files))
     }
   }, [])
 
   const handleProcess = async () => {
     if (!selectedFile) return
     
-    await onFileProcess(selectedFile, promptType)
+    if (selectedFiles.length > 1) {
+      await onBatchProcess(selectedFiles, promptType)
+    } else {
+      await onFileProcess(selectedFile, promptType)
+    }
     
     // Reset dopo elaborazione
-    setSelectedFile(null)
+    setSelectedFiles([])
     setShowRecorder(false)
     if (fileInputRef.current) {
       fileInputRef.current.value = ''
@@ -199,7 +214,7 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
           >
             <Upload className="w-16 h-16 mx-auto mb-4 text-muted-foreground" />
             <p className="text-foreground mb-2">
-              Trascina qui il file audio o clicca per selezionare
+              Trascina qui uno o più file audio o clicca per selezionare
             </p>
             <p className="text-sm text-muted-foreground">
               Formati supportati: MP3, WAV, M4A, FLAC, OGG, AAC (max 25MB)
@@ -210,9 +225,10 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
         <input
           ref={fileInputRef}
           type="file"
+          multiple
           accept=".mp3,.wav,.m4a,.flac,.ogg,.aac,.webm,audio/*"
           className="hidden"
-          onChange={(e) => e.target.files?.[0] && handleFileSelect(e.target.files[0])}
+          onChange={(e) => e.target.files && handleFilesSelect(Array.from(e.target.files))}
           disabled={isProcessing}
         />
 
@@ -220,13 +236,15 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
         {selectedFile && (
           <div className="p-4 bg-primary/5 rounded-lg">
             <p className="text-primary font-medium">
-              File selezionato: {selectedFile.name} ({formatFileSize(selectedFile.size)})
+              {selectedFiles.length > 1
+                ? `${selectedFiles.length} file selezionati (${formatFileSize(selectedFiles.reduce((total, file) => total + file.size, 0))})`
+                : `File selezionato: ${selectedFile.name} (${formatFileSize(selectedFile.size)})`}
             </p>
             {isMobile && (
               <Button
                 variant="ghost"
                 size="sm"
-                onClick={() => setSelectedFile(null)}
+                onClick={() => setSelectedFiles([])}
                 className="mt-2"
               >
                 Cambia file
@@ -243,7 +261,7 @@ export function FileUpload({ onFileProcess, isProcessing }: FileUploadProps) {
             size="lg"
             disabled={isProcessing}
           >
-            Trascrivi e Processa
+            {selectedFiles.length > 1 ? `Trascrivi e Processa ${selectedFiles.length} file` : 'Trascrivi e Processa'}
           </Button>
         )}
       </CardContent>
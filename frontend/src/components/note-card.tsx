@@ -13,11 +13,11 @@ import {
   DialogTitle,
 } from '@/components/ui/dialog'
 import { cn } from '@/lib/utils'
-import { Note } from '@/lib/api'
+import { NoteSummary } from '@/lib/api'
 import { apiService } from '@/lib/api'
 
 interface NoteCardProps {
-  note: Note
+  note: NoteSummary
   onClick: () => void
   onDelete: (noteId: string) => Promise<void>
   onUpdate?: () => void  // Callback per aggiornare la lista dopo modifica
@@ -209,7 +209,7 @@ export function NoteCard({ note, onClick, onDelete, onUpdate }: NoteCardProps) {
         </CardHeader>
         <CardContent className="py-3">
           <p className="text-sm text-muted-foreground line-clamp-2">
-            {note.transcription}
+            {note.preview}
           </p>
         </CardContent>
       </Card>
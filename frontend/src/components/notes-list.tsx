@@ -1,6 +1,7 @@
 "use client"
 
-import { Menu } from 'lucide-react'
+import { useEffect, useState } from 'react'
+import { Loader2, Menu, Search } from 'lucide-react'
 import { Button } from '@/components/ui/button'
 import {
   Dialog,
@@ -11,16 +12,60 @@ import {
   DialogTrigger,
 } from '@/components/ui/dialog'
 import { NoteCard } from '@/components/note-card'
-import { Note } from '@/lib/api'
+import { apiService, NoteSummary } from '@/lib/api'
+
+// Attesa dopo l'ultimo tasto prima di cercare (ms)
+const SEARCH_DEBOUNCE_MS = 300
 
 interface NotesListProps {
-  notes: Note[]
+  notes: NoteSummary[]
+  hasMore?: boolean
+  onLoadMore?: () => Promise<void>
   onNoteSelect: (noteId: string) => void
   onNoteDelete: (noteId: string) => Promise<void>
   onNotesUpdate?: () => void  // Callback per ricaricare le note dopo modifica titolo
 }
 
-export function NotesList({ notes, onNoteSelect, onNoteDelete, onNotesUpdate }: NotesListProps) {
+export function NotesList({ notes, hasMore, onLoadMore, onNoteSelect, onNoteDelete, onNotesUpdate }: NotesListProps) {
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
+  const [query, setQuery] = useState('')
+  const [searchResults, setSearchResults] = useState<NoteSummary[] | null>(null)
+
+  useEffect(() => {
+    const trimmed = query.trim()
+    if (!trimmed) {
+      setSearchResults(null)
+      return
+    }
+
+    let cancelled = false
+    const timer = setTimeout(async () => {
+      try {
+        const response = await apiService.searchNotes(trimmed)
+        if (!cancelled) setSearchResults(response.results)
+      } catch (error) {
+        console.error('Errore nella ricerca:', error)
+      }
+    }, SEARCH_DEBOUNCE_MS)
+
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [query, notes])
+
+  const visibleNotes = searchResults ?? notes
+
+  const handleLoadMore = async () => {
+    if (!onLoadMore) return
+    setIsLoadingMore(true)
+    try {
+      await onLoadMore()
+    } finally {
+      setIsLoadingMore(false)
+    }
+  }
+
   return (
     <Dialog>
       <DialogTrigger asChild>
@@ -35,13 +80,23 @@ export function NotesList({ notes, onNoteSelect, onNoteDelete, onNotesUpdate }:
             Seleziona una nota per visualizzarla e modificarla. Clicca sull'icona matita per rinominare.
           </DialogDescription>
         </DialogHeader>
+        <div className="relative mt-4">
+          <Search className="absolute left-3 top-1/2 h-4 w-4 -translate-y-1/2 text-muted-foreground" />
+          <input
+            type="search"
+            value={query}
+            onChange={(e) => setQuery(e.target.value)}
+            placeholder="Cerca nelle note..."
+            className="w-full pl-9 pr-3 py-2 text-sm border rounded focus:outline-none focus:ring-2 focus:ring-primary bg-background"
+          />
+        </div>
         <div className="overflow-y-auto max-h-[60vh] space-y-3 mt-4">
-          {notes.length === 0 ? (
+          {visibleNotes.length === 0 ? (
             <p className="text-center text-muted-foreground py-8">
               Nessuna nota trovata
             </p>
           ) : (
-            notes.map((note) => (
+            visibleNotes.map((note) => (
               <NoteCard
                 key={note.id}
                 note={note}
@@ -51,6 +106,17 @@ export function NotesList({ notes, onNoteSelect, onNoteDelete, onNotesUpdate }:
               />
             ))
           )}
+          {hasMore && searchResults === null && (
+            <Button
+              variant="outline"
+              className="w-full"
+              onClick={handleLoadMore}
+              disabled={isLoadingMore}
+            >
+              {isLoadingMore && <Loader2 className="mr-2 h-4 w-4 animate-spin" />}
+              Carica altre note
+            </Button>
+          )}
         </div>
       </DialogContent>
     </Dialog>
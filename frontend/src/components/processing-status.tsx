@@ -3,15 +3,21 @@ import { Card, CardContent } from '@/components/ui/card'
 
 interface ProcessingStatusProps {
   step: string
+  partialText?: string  // Testo di Claude ricevuto finora in streaming
 }
 
-export function ProcessingStatus({ step }: ProcessingStatusProps) {
+export function ProcessingStatus({ step, partialText }: ProcessingStatusProps) {
   return (
     <Card>
       <CardContent className="py-12">
         <div className="flex flex-col items-center justify-center space-y-4">
           <Loader2 className="h-12 w-12 animate-spin text-primary" />
           <p className="text-muted-foreground">{step}</p>
+          {partialText && (
+            <p className="w-full max-h-96 overflow-y-auto whitespace-pre-wrap text-sm text-foreground">
+              {partialText}
+            </p>
+          )}
         </div>
       </CardContent>
     </Card>
@@ -6,11 +6,12 @@ import { FileUpload } from '@/components/file-upload'
 import { ProcessingStatus } from '@/components/processing-status'
 import { NoteEditor } from '@/components/note-editor'
 import { NotesList } from '@/components/notes-list'
-import { apiService, Note, TranscriptionResponse } from '@/lib/api'
+import { apiService, NoteSummary, TranscriptionResponse } from '@/lib/api'
 
 interface ProcessingState {
   isProcessing: boolean
   step: string
+  partialText?: string
 }
 
 export default function VoiceNotes() {
@@ -22,7 +23,8 @@ export default function VoiceNotes() {
   const [processedText, setProcessedText] = useState('')
   const [currentNoteId, setCurrentNoteId] = useState<string | null>(null)
   const [currentNoteTitle, setCurrentNoteTitle] = useState<string>('')
-  const [notes, setNotes] = useState<Note[]>([])
+  const [notes, setNotes] = useState<NoteSummary[]>([])
+  const [notesCursor, setNotesCursor] = useState<string | null>(null)
 
   // Carica note all'avvio
   useEffect(() => {
@@ -34,10 +36,23 @@ export default function VoiceNotes() {
       const response = await apiService.getNotes()
       if (response.notes && Array.isArray(response.notes)) {
         setNotes(response.notes)
+        setNotesCursor(response.next_cursor)
       }
     } catch (error) {
       console.error('Errore nel caricamento note:', error)
       setNotes([])
+      setNotesCursor(null)
+    }
+  }
+
+  const loadMoreNotes = async () => {
+    if (!notesCursor) return
+    try {
+      const response = await apiService.getNotes(20, notesCursor)
+      setNotes(prev => [...prev, ...response.notes])
+      setNotesCursor(response.next_cursor)
+    } catch (error) {
+      console.error('Errore nel caricamento note:', error)
     }
   }
 
@@ -45,8 +60,15 @@ export default function VoiceNotes() {
     setProcessingState({ isProcessing: true, step: 'Caricamento audio...' })
 
     try {
-      setProcessingState({ isProcessing: true, step: 'Trascrizione con Whisper...' })
-      const result = await apiService.transcribeAudio(file, promptType)
+      const result = await apiService.transcribeAudioResumable(file, promptType, {
+        onUploadProgress: (fraction) => setProcessingState({
+          isProcessing: true,
+          step: `Caricamento audio... ${Math.round(fraction * 100)}%`,
+        }),
+        onUploaded: () => setProcessingState({ isProcessing: true, step: 'Trascrizione con Whisper...' }),
+        onTranscription: () => setProcessingState({ isProcessing: true, step: 'Scrittura del post con Claude...' }),
+        onDelta: (text) => setProcessingState({ isProcessing: true, step: 'Scrittura del post con Claude...', partialText: text }),
+      })
 
       setTranscriptionResult(result)
       // Converte il testo processato in formato markdown se necessario
@@ -65,6 +87,32 @@ export default function VoiceNotes() {
     }
   }
 
+  const handleBatchProcess = async (files: File[], promptType: 'linkedin' | 'general') => {
+    let completed = 0
+    const step = () => `Elaborazione di ${files.length} file: ${completed} completati`
+    setProcessingState({ isProcessing: true, step: step() })
+
+    try {
+      const result = await apiService.transcribeBatch(files, promptType, (progress) => {
+        if (progress.stage !== 'transcribed') {
+          completed += 1
+          setProcessingState({ isProcessing: true, step: step() })
+        }
+      })
+
+      await loadNotes()
+      if (result.failed > 0) {
+        const failedNames = result.results.filter(r => r.status === 'failed').map(r => r.filename)
+        alert(`Elaborazione non riuscita per ${result.failed} file: ${failedNames.join(', ')}`)
+      }
+    } catch (error) {
+      console.error('Errore durante elaborazione multipla:', error)
+      alert('Si è verificato un errore durante l\'elaborazione')
+    } finally {
+      setProcessingState({ isProcessing: false, step: '' })
+    }
+  }
+
   const handleSaveNote = async () => {
     if (!currentNoteId) return
 
@@ -150,6 +198,8 @@ export default function VoiceNotes() {
       <div className="fixed top-4 right-4 z-50">
         <NotesList 
           notes={notes}
+          hasMore={notesCursor !== null}
+          onLoadMore={loadMoreNotes}
           onNoteSelect={handleLoadNote}
           onNoteDelete={handleDeleteNote}
           onNotesUpdate={loadNotes}
@@ -163,13 +213,14 @@ export default function VoiceNotes() {
           {!transcriptionResult && !processingState.isProcessing && (
             <FileUpload 
               onFileProcess={handleFileProcess}
+              onBatchProcess={handleBatchProcess}
               isProcessing={processingState.isProcessing}
             />
           )}
 
           {/* Processing Status */}
           {processingState.isProcessing && (
-            <ProcessingStatus step={processingState.step} />
+            <ProcessingStatus step={processingState.step} partialText={processingState.partialText} />
           )}
 
           {/* Results */}
@@ -12,6 +12,8 @@ export interface CostData {
     model: string
     input_tokens: number
     output_tokens: number
+    cache_creation_input_tokens?: number
+    cache_read_input_tokens?: number
     input_cost_usd: number
     output_cost_usd: number
     total_cost_usd: number
@@ -26,7 +28,9 @@ export interface TranscriptionResponse {
   title?: string
   transcription: string
   processed: string
-  audio_url: string
+  audio_url: string | null
+  archive_status?: 'archived' | 'pending' | 'failed'
+  cached?: boolean  // true se l'audio era già stato elaborato
   cost?: CostData
 }
 
@@ -34,7 +38,8 @@ export interface Note {
   id: string
   title: string  // Nuovo campo per il titolo personalizzabile
   original_filename: string
-  audio_url: string
+  audio_url: string | null
+  archive_status?: 'archived' | 'pending' | 'failed'
   transcription: string
   processed_text: string
   prompt_type: string
@@ -45,9 +50,73 @@ export interface Note {
   audio_duration_minutes?: number
 }
 
+// Campi restituiti da /api/notes: il testo completo si legge con getNote
+export interface NoteSummary {
+  id: string
+  title: string
+  original_filename: string
+  preview?: string
+  prompt_type: string
+  created_at: string
+  audio_duration_minutes?: number
+  cost_data?: Pick<CostData, 'total_cost_usd' | 'total_cost_eur'>
+}
+
+export interface TranscriptionStreamHandlers {
+  onUploadProgress?: (fraction: number) => void  // Solo per gli upload a blocchi
+  onUploaded?: () => void
+  onTranscription?: (text: string) => void
+  onDelta?: (text: string) => void
+}
+
+interface UploadSession {
+  upload_id: string
+  size: number
+  offset: number
+  chunk_size: number
+}
+
+// Tentativi consecutivi falliti prima di rinunciare all'upload a blocchi
+const UPLOAD_MAX_RETRIES = 6
+
+export interface BatchFileProgress {
+  index: number
+  filename: string
+  stage: 'transcribed' | 'processed' | 'cached' | 'failed'
+  detail?: string
+}
+
+export interface BatchFileResult {
+  index: number
+  filename: string
+  status: 'saved' | 'cached' | 'failed'
+  id?: string
+  title?: string
+  audio_url?: string | null
+  archive_status?: 'archived' | 'pending' | 'failed'
+  cost?: CostData
+}
+
+export interface BatchTranscriptionResponse {
+  results: BatchFileResult[]
+  saved: number
+  failed: number
+}
+
 export interface NotesResponse {
   success: boolean
-  notes: Note[]
+  notes: NoteSummary[]
+  next_cursor: string | null
+}
+
+export interface SearchResult extends NoteSummary {
+  score: number
+}
+
+export interface SearchResponse {
+  success: boolean
+  query: string
+  results: SearchResult[]
 }
 
 export interface NoteResponse {
@@ -67,6 +136,28 @@ export interface UpdateNoteData {
 }
 
 class ApiService {
+  // Ultima risposta ricevuta per ogni URL letto con ETag
+  private etagCache = new Map<string, { etag: string; data: unknown }>()
+
+  /**
+   * GET con If-None-Match: su 304 riusa la risposta già ricevuta
+   */
+  private async getWithEtag<T>(url: string): Promise<T> {
+    const cached = this.etagCache.get(url)
+    const headers = new Headers(authService.getAuthHeaders())
+    if (cached) headers.set('If-None-Match', cached.etag)
+
+    const response = await fetch(url, { headers })
+    if (response.status === 304 && cached) {
+      return cached.data as T
+    }
+
+    await this.handleResponse(response)
+    const data = await response.json()
+    const etag = response.headers.get('ETag')
+    if (etag) this.etagCache.set(url, { etag, data })
+    return data
+  }
   
   /**
    * Gestisce errori di autenticazione
@@ -156,29 +247,246 @@ class ApiService {
   }
 
   /**
-   * Recupera note con autenticazione
+   * Trascrivi audio ricevendo gli stadi come Server-Sent Events:
+   * trascrizione appena pronta e testo di Claude man mano che viene generato
    */
-  async getNotes(limit: number = 20): Promise<NotesResponse> {
-    const response = await fetch(`${BACKEND_URL}/api/notes?limit=${limit}`, {
+  async transcribeAudioStream(
+    file: File,
+    promptType: 'linkedin' | 'general' = 'linkedin',
+    handlers: TranscriptionStreamHandlers = {}
+  ): Promise<TranscriptionResponse> {
+    const formData = new FormData()
+    formData.append('file', file)
+
+    const response = await fetch(`${BACKEND_URL}/api/transcribe/stream?prompt_type=${promptType}`, {
+      method: 'POST',
+      headers: authService.getAuthHeadersMultipart(),
+      body: formData,
+    })
+
+    await this.handleResponse(response)
+    return this.readTranscriptionEvents(response, handlers)
+  }
+
+  /**
+   * Trascrivi audio caricandolo a blocchi riprendibili: dopo una caduta della
+   * connessione l'upload riparte dall'ultimo byte ricevuto dal server
+   */
+  async transcribeAudioResumable(
+    file: File,
+    promptType: 'linkedin' | 'general' = 'linkedin',
+    handlers: TranscriptionStreamHandlers = {}
+  ): Promise<TranscriptionResponse> {
+    const created = await fetch(`${BACKEND_URL}/api/uploads`, {
+      method: 'POST',
       headers: authService.getAuthHeaders(),
+      body: JSON.stringify({ filename: file.name, size: file.size }),
     })
-    
+    await this.handleResponse(created)
+    const session: UploadSession = await created.json()
+
+    let offset = session.offset
+    let failures = 0
+    while (offset < file.size) {
+      const chunk = file.slice(offset, Math.min(offset + session.chunk_size, file.size))
+      let response: Response | null = null
+      try {
+        response = await fetch(`${BACKEND_URL}/api/uploads/${session.upload_id}`, {
+          method: 'PUT',
+          headers: {
+            ...authService.getAuthHeadersMultipart(),
+            'Content-Range': `bytes ${offset}-${offset + chunk.size - 1}/${file.size}`,
+            ...(await this.chunkChecksum(chunk)),
+          },
+          body: chunk,
+        })
+      } catch {
+        // Connessione caduta: il blocco viene reinviato
+      }
+
+      if (response?.ok) {
+        offset = (await response.json()).offset
+        failures = 0
+        handlers.onUploadProgress?.(offset / file.size)
+        continue
+      }
+      // Ripetibili: offset disallineato (409), checksum errato (422), errori del server
+      if (response && ![409, 422].includes(response.status) && response.status < 500) {
+        await this.handleResponse(response)
+      }
+      failures += 1
+      if (failures > UPLOAD_MAX_RETRIES) {
+        throw new Error('Connessione instabile: caricamento dell\'audio non riuscito')
+      }
+      await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** (failures - 1), 15000)))
+      // Riprende dall'offset confermato dal server, se raggiungibile
+      offset = await this.getUploadOffset(session.upload_id).catch(() => offset)
+    }
+
+    const response = await fetch(
+      `${BACKEND_URL}/api/uploads/${session.upload_id}/finalize?prompt_type=${promptType}`,
+      { method: 'POST', headers: authService.getAuthHeadersMultipart() }
+    )
     await this.handleResponse(response)
-    return response.json()
+    return this.readTranscriptionEvents(response, handlers)
+  }
+
+  private async getUploadOffset(uploadId: string): Promise<number> {
+    const response = await fetch(`${BACKEND_URL}/api/uploads/${uploadId}`, {
+      headers: authService.getAuthHeadersMultipart(),
+    })
+    await this.handleResponse(response)
+    return (await response.json()).offset
   }
 
   /**
-   * Recupera una nota specifica con autenticazione
+   * SHA-256 del blocco per X-Chunk-Sha256 (crypto.subtle esiste solo su HTTPS e localhost)
    */
-  async getNote(noteId: string): Promise<NoteResponse> {
-    const response = await fetch(`${BACKEND_URL}/api/note/${noteId}`, {
+  private async chunkChecksum(chunk: Blob): Promise<Record<string, string>> {
+    if (typeof crypto === 'undefined' || !crypto.subtle) return {}
+    const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer())
+    const hex = Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('')
+    return { 'X-Chunk-Sha256': hex }
+  }
+
+  /**
+   * Eventi della pipeline (uploaded, transcription, delta, saved, error) fino alla nota salvata
+   */
+  private async readTranscriptionEvents(
+    response: Response,
+    handlers: TranscriptionStreamHandlers
+  ): Promise<TranscriptionResponse> {
+    let transcription = ''
+    let processed = ''
+
+    for await (const { event, data } of this.readEvents(response)) {
+      switch (event) {
+        case 'uploaded':
+          handlers.onUploaded?.()
+          break
+        case 'transcription':
+          transcription = data.text
+          handlers.onTranscription?.(data.text)
+          break
+        case 'delta':
+          processed += data.text
+          handlers.onDelta?.(processed)
+          break
+        case 'saved':
+          return {
+            success: true,
+            id: data.id,
+            title: data.title,
+            transcription,
+            processed,
+            audio_url: data.audio_url,
+            archive_status: data.archive_status,
+            cached: data.cached,
+            cost: data.cost,
+          }
+        case 'error':
+          throw new Error(data.detail || 'Errore durante l\'elaborazione')
+      }
+    }
+
+    throw new Error('Connessione interrotta prima del salvataggio della nota')
+  }
+
+  /**
+   * Trascrive più file in parallelo, notificando l'avanzamento di ciascuno
+   */
+  async transcribeBatch(
+    files: File[],
+    promptType: 'linkedin' | 'general' = 'linkedin',
+    onFileProgress?: (progress: BatchFileProgress) => void
+  ): Promise<BatchTranscriptionResponse> {
+    const formData = new FormData()
+    files.forEach(file => formData.append('files', file))
+
+    const response = await fetch(`${BACKEND_URL}/api/transcribe/batch?prompt_type=${promptType}`, {
+      method: 'POST',
+      headers: authService.getAuthHeadersMultipart(),
+      body: formData,
+    })
+
+    await this.handleResponse(response)
+
+    for await (const { event, data } of this.readEvents(response)) {
+      switch (event) {
+        case 'file':
+          onFileProgress?.(data)
+          break
+        case 'saved':
+          return data
+        case 'error':
+          throw new Error(data.detail || 'Errore durante l\'elaborazione')
+      }
+    }
+
+    throw new Error('Connessione interrotta prima del salvataggio delle note')
+  }
+
+  /**
+   * Legge una risposta Server-Sent Events evento per evento
+   */
+  private async *readEvents(response: Response): AsyncGenerator<{ event?: string; data: any }> {
+    if (!response.body) {
+      throw new Error('Streaming non supportato dal browser')
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) return
+      buffer += decoder.decode(value, { stream: true })
+
+      // Gli eventi SSE sono separati da una riga vuota
+      let separator = buffer.indexOf('\n\n')
+      while (separator !== -1) {
+        const rawEvent = buffer.slice(0, separator)
+        buffer = buffer.slice(separator + 2)
+        separator = buffer.indexOf('\n\n')
+
+        yield {
+          event: rawEvent.match(/^event: (.*)$/m)?.[1],
+          data: JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] || '{}'),
+        }
+      }
+    }
+  }
+
+  /**
+   * Recupera una pagina di note con autenticazione (dalla più recente)
+   */
+  async getNotes(limit: number = 20, cursor?: string): Promise<NotesResponse> {
+    const params = new URLSearchParams({ limit: String(limit) })
+    if (cursor) params.set('cursor', cursor)
+    return this.getWithEtag<NotesResponse>(`${BACKEND_URL}/api/notes?${params}`)
+  }
+
+  /**
+   * Cerca le note per testo (titolo, trascrizione e testo elaborato)
+   */
+  async searchNotes(query: string, limit: number = 20): Promise<SearchResponse> {
+    const params = new URLSearchParams({ q: query, limit: String(limit) })
+    const response = await fetch(`${BACKEND_URL}/api/search?${params}`, {
       headers: authService.getAuthHeaders(),
     })
-    
+
     await this.handleResponse(response)
     return response.json()
   }
 
+  /**
+   * Recupera una nota specifica con autenticazione
+   */
+  async getNote(noteId: string): Promise<NoteResponse> {
+    return this.getWithEtag<NoteResponse>(`${BACKEND_URL}/api/note/${noteId}`)
+  }
+
   /**
    * Aggiorna nota con autenticazione (testo e/o titolo)
    */